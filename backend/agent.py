@@ -6,7 +6,7 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
-from model import agent1
+from model import get_agent
 
 # Graph state
 class State(TypedDict):
@@ -19,7 +19,7 @@ def agentfunction(state: State):
     """First LLM call to generate initial joke"""
     # print(state)s
     inner_input = {"messages": [HumanMessage(content=state['query'])]}
-    msg = agent1.invoke(inner_input)
+    msg = get_agent().invoke(inner_input)
     # print(msg)
     
     return {"result": msg["messages"][-1].content}
@@ -42,7 +42,8 @@ workflow.add_edge("agent", END)
 chain = workflow.compile()
 
 
-# Invoke
-state = chain.invoke({"query": "list 5 paper pdf link  and list of title of topic mixture of expert"})
+# Invoke (only when run as a script; importing this module makes no LLM calls)
+if __name__ == "__main__":
+    state = chain.invoke({"query": "list 5 paper pdf link  and list of title of topic mixture of expert"})
 
-print(state["result"])
+    print(state["result"])
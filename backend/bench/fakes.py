@@ -0,0 +1,266 @@
+"""
+Local stand-ins for the network services the backend talks to: an arXiv
+export API / PDF server and a deterministic chat model with configurable
+latency. Nothing in here opens a connection outside localhost.
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "attention transformer model layer encoder decoder training data loss result "
+    "gradient network sequence token embedding benchmark baseline dataset accuracy "
+    "convolution recurrent optimizer learning rate batch inference latency memory "
+    "retrieval index query document corpus ranking sparse dense vector graph"
+).split()
+
+PAPER_ID_RE = re.compile(r'(\d{4}\.\d{4,5})(v\d+)?')
+
+
+def synthetic_pages(seed: int, pages: int = 8, lines: int = 60, words_per_line: int = 12) -> list:
+    """Deterministic pseudo-text: ``pages`` lists of ``lines`` lines."""
+    rng = random.Random(seed)
+    out = [[" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines)] for _ in range(pages)]
+    if out and out[0]:
+        out[0][0] = f"Synthetic Paper {seed}"
+    return out
+
+
+def synthetic_text(seed: int, words: int) -> str:
+    rng = random.Random(seed)
+    lines = []
+    for start in range(0, words, 12):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(min(12, words - start))))
+    return "\n".join(lines)
+
+
+def make_pdf(pages: list) -> bytes:
+    """Minimal uncompressed PDF with one Helvetica text line per entry of each page."""
+    objs = []
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objs.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    objs.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, lines in enumerate(pages):
+        stream = "\n".join(["BT /F1 10 Tf 12 TL 50 780 Td"] + [f"({line}) '" for line in lines] + ["ET"])
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out, offsets = "%PDF-1.4\n", []
+    for i, obj in enumerate(objs):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" \
+xmlns:arxiv="http://arxiv.org/schemas/atom">
+<title>arXiv Query</title><id>http://arxiv.org/api/fake</id><updated>2024-01-01T00:00:00Z</updated>
+<opensearch:totalResults>{total}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+<opensearch:itemsPerPage>{size}</opensearch:itemsPerPage>
+{entries}</feed>"""
+
+ENTRY = """<entry><id>http://arxiv.org/abs/{id}v1</id>
+<updated>2024-01-{day:02d}T00:00:00Z</updated><published>2024-01-{day:02d}T00:00:00Z</published>
+<title>{title}</title><summary>{summary}</summary><author><name>Ada Lovelace</name></author>
+<link href="{base}/abs/{id}v1" rel="alternate" type="text/html"/>
+<link href="{base}/pdf/{id}v1" rel="related" type="application/pdf" title="pdf"/>
+<arxiv:primary_category term="cs.LG"/><category term="cs.LG"/></entry>
+"""
+
+
+class FakeArxiv:
+    """
+    Threaded HTTP server speaking enough of arXiv for the backend.
+
+    ``/api/query`` answers any search with ``total_results`` Atom entries
+    (paged by ``start`` / ``max_results``) whose titles contain the searched
+    phrase; ``/pdf/<id>`` serves a synthetic PDF seeded by the id, with an
+    ``ETag`` so revalidation works.
+
+    Args:
+        port (int): Port to bind on 127.0.0.1; ``0`` picks a free one.
+        total_results (int): Results every search reports.
+        pages (int): Pages per generated PDF.
+        latency (float): Seconds added to every response.
+    """
+
+    def __init__(self, port: int = 0, total_results: int = 100, pages: int = 8, latency: float = 0.0):
+        self.total_results = total_results
+        self.pages = pages
+        self.latency = latency
+        self.requests = {"api": 0, "pdf": 0}
+        self._pdfs = {}
+        self._pdf_lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def api_url(self) -> str:
+        return self.url + "/api/query"
+
+    def pdf_url(self, paper_id: str) -> str:
+        return f"{self.url}/pdf/{paper_id}v1"
+
+    def pdf(self, paper_id: str) -> bytes:
+        with self._pdf_lock:
+            if paper_id not in self._pdfs:
+                seed = int(hashlib.sha256(paper_id.encode()).hexdigest()[:8], 16)
+                self._pdfs[paper_id] = make_pdf(synthetic_pages(seed, pages=self.pages))
+            return self._pdfs[paper_id]
+
+    def feed(self, query: str, start: int, size: int) -> bytes:
+        phrase = re.sub(r'^ti:', '', query.split(' AND ')[0]).strip('"') or "paper"
+        entries = []
+        for i in range(start, min(start + size, self.total_results)):
+            paper_id = f"2401.{i + 1:05d}"
+            entries.append(ENTRY.format(id=paper_id, day=i % 28 + 1, title=f"{phrase} study {i + 1}",
+                                        summary=f"Synthetic abstract {i + 1}.", base=self.url))
+        return FEED.format(total=self.total_results, start=start, size=size, entries="".join(entries)).encode()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", content_type="application/octet-stream", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                url = urlparse(self.path)
+                if url.path.startswith("/api/"):
+                    fake.requests["api"] += 1
+                    params = parse_qs(url.query)
+                    body = fake.feed(params.get("search_query", [""])[0],
+                                     int(params.get("start", ["0"])[0]), int(params.get("max_results", ["10"])[0]))
+                    return self._send(200, body, "application/atom+xml")
+                match = PAPER_ID_RE.search(url.path)
+                if url.path.startswith("/pdf/") and match:
+                    fake.requests["pdf"] += 1
+                    body = fake.pdf(match.group(1))
+                    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, headers={"ETag": etag})
+                    return self._send(200, body, "application/pdf", {"ETag": etag})
+                self._send(404)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeChatModel:
+    """
+    Deterministic chat model with the parts of the LangChain interface the
+    backend uses (``invoke``/``ainvoke``/``stream``/``astream``/``bind_tools``).
+
+    The answer is derived from a hash of the prompt, so the same prompt always
+    gets the same text. Latency is ``latency`` seconds before the first token
+    plus ``token_latency`` per streamed token. With tools bound, ``invoke``
+    returns a ``get_arxiv_papers`` call for ``tool_query``.
+
+    Args:
+        latency (float): Seconds until the first token.
+        token_latency (float): Seconds per additional token.
+        answer_tokens (int): Tokens in every answer.
+        tool_query (str): Query the fake tool call searches for.
+    """
+
+    def __init__(self, latency: float = 0.05, token_latency: float = 0.0, answer_tokens: int = 32,
+                 tool_query: str = "attention", tools=None):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.tool_query = tool_query
+        self.tools = tools
+        self.calls = 0
+
+    def bind_tools(self, tools):
+        return FakeChatModel(self.latency, self.token_latency, self.answer_tokens, self.tool_query, tools=tools)
+
+    def _tokens(self, messages) -> list:
+        digest = hashlib.sha256(repr(messages).encode("utf-8")).hexdigest()
+        return [f"{WORDS[int(digest[i % 64], 16) + i % 16]} " for i in range(self.answer_tokens)]
+
+    def _message(self, messages):
+        from langchain_core.messages import AIMessage
+        self.calls += 1
+        if self.tools:
+            count = re.search(r'use (\d+) as count', str(messages))
+            args = {"query": self.tool_query, "count": int(count.group(1)) if count else 10}
+            return AIMessage(content="", tool_calls=[{"name": "get_arxiv_papers", "args": args, "id": "call_0"}])
+        return AIMessage(content="".join(self._tokens(messages)))
+
+    def invoke(self, messages, *args, **kwargs):
+        time.sleep(self.latency + self.token_latency * max(self.answer_tokens - 1, 0))
+        return self._message(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        await asyncio.sleep(self.latency + self.token_latency * max(self.answer_tokens - 1, 0))
+        return self._message(messages)
+
+    def stream(self, messages, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        self.calls += 1
+        time.sleep(self.latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield AIMessageChunk(content=token)
+
+    async def astream(self, messages, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=token)
+
+
+def install_fake_llm(model: FakeChatModel):
+    """Makes ``model.get_llm()`` (and everything built on it) return ``model``."""
+    from tools.lazy import REGISTRY
+    REGISTRY.register("llm", lambda: model)
+    REGISTRY.reset("llm_with_tools")
+    REGISTRY.reset("agent1")
@@ -0,0 +1,168 @@
+"""
+Load tests of the HTTP API against a real uvicorn process whose arXiv and
+LLM dependencies are the local fakes.
+
+``python -m bench.load serve --port P --arxiv-url U ...`` is the server
+side (started by ``run_load``); the client side fires a fixed number of
+requests per scenario at each concurrency level and reports throughput and
+latency percentiles.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fakes import FakeArxiv, FakeChatModel, install_fake_llm
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def scenarios(fake: FakeArxiv) -> dict:
+    """Request factories by scenario name; each takes the request number."""
+    return {
+        # Plain title search: parsed locally, no LLM call.
+        "ask_direct": lambda i: ("/ask", {"query": f"transformer layer {i % 10}"}),
+        # Ambiguous query: goes through the (fake) LLM tool call.
+        "ask_llm": lambda i: ("/ask", {"query": f"what are the best papers on attention {i % 10}?"}),
+        # Warm index, answer cache bypassed: retrieval, packing and one LLM call.
+        "question": lambda i: ("/question", {"query": f"what does section {i % 20} report about the loss?",
+                                             "paperId": "2401.00001", "pdfLink": fake.pdf_url("2401.00001"),
+                                             "noCache": True}),
+        # Same question repeated: served from the answer cache.
+        "question_cached": lambda i: ("/question", {"query": "what is the main result?",
+                                                    "paperId": "2401.00001", "pdfLink": fake.pdf_url("2401.00001")}),
+    }
+
+
+async def run_scenario(client, make_request, n_requests: int, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            path, body = make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def drive(base_url: str, fake: FakeArxiv, names, concurrencies, n_requests: int) -> dict:
+    import httpx
+    results = {}
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        factories = scenarios(fake)
+        # Builds the paper index once, so "question" measures the warm path.
+        await client.post("/question", json=factories["question"](0)[1])
+        for name in names:
+            for concurrency in concurrencies:
+                await run_scenario(client, factories[name], min(concurrency, n_requests), concurrency)  # warm-up
+                api_calls = fake.requests["api"]
+                result = await run_scenario(client, factories[name], n_requests, concurrency)
+                # Searches that reached the fake arXiv API, to confirm /ask is not served from a cache.
+                result["arxiv_calls"] = fake.requests["api"] - api_calls
+                results[f"load.{name}.c{concurrency}"] = result
+    return results
+
+
+def wait_for_server(url: str, proc, timeout: float = 60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"benchmark server exited with {proc.returncode}")
+        try:
+            httpx.get(url + "/cache/stats", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("benchmark server did not start")
+
+
+def run_load(names=("ask_direct", "ask_llm", "question", "question_cached"), concurrencies=(1, 8, 32),
+             n_requests: int = 200, llm_latency: float = 0.05, token_latency: float = 0.0,
+             arxiv_latency: float = 0.0) -> dict:
+    """Starts the fakes and a server process, runs every scenario at every concurrency."""
+    port = free_port()
+    with FakeArxiv(latency=arxiv_latency) as fake, tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PAPER_STORE_DIR=os.path.join(tmp, "store"), EXTRACT_PROCESSES="0")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "bench.load", "serve", "--port", str(port), "--arxiv-url", fake.url,
+             "--llm-latency", str(llm_latency), "--token-latency", str(token_latency)],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_for_server(base_url, proc)
+            return asyncio.run(drive(base_url, fake, names, concurrencies, n_requests))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+def serve(args):
+    """Server side: the real app, with arXiv pointed at the fake and the fake LLM installed."""
+    os.environ.update(
+        ARXIV_API_URL=args.arxiv_url + "/api/query",
+        ARXIV_API_INTERVAL="0",
+        ARXIV_PDF_RATE="0",
+        ARXIV_CACHE_ENTRIES="0",  # disables the search cache: every /ask reaches the (fake) API
+        PREFETCH_TOP_N="0",
+    )
+    import uvicorn
+    import main
+    install_fake_llm(FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency))
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--arxiv-url", required=True)
+    serve_parser.add_argument("--llm-latency", type=float, default=0.05)
+    serve_parser.add_argument("--token-latency", type=float, default=0.0)
+    serve(parser.parse_args())
@@ -0,0 +1,115 @@
+"""
+Microbenchmarks of the CPU-bound pieces: PDF extraction, chunking, index
+build, retrieval and search-query parsing. Each result is the median
+per-call time in milliseconds.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+from bench.fakes import FakeArxiv, synthetic_text
+
+
+def timeit(fn, min_seconds: float = 0.2, max_runs: int = 200, min_runs: int = 3) -> float:
+    """Median milliseconds per ``fn()`` over repeated runs (after one warm-up call)."""
+    fn()
+    runs = []
+    deadline = time.perf_counter() + min_seconds
+    while len(runs) < min_runs or (time.perf_counter() < deadline and len(runs) < max_runs):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs) * 1000
+
+
+def bench_extract(results: dict, page_counts, min_seconds: float):
+    from tools.ragtool import extract_text_and_chunks
+    for pages in page_counts:
+        with FakeArxiv(pages=pages) as fake:
+            url = fake.pdf_url("2401.00001")
+            results[f"micro.pdf_extract.pages={pages}"] = {
+                "median_ms": timeit(lambda: extract_text_and_chunks(url), min_seconds, max_runs=20)}
+
+
+def bench_chunk(results: dict, chunk_counts, min_seconds: float):
+    from tools.ragtool import make_text_splitter
+    splitter = make_text_splitter()
+    for n in chunk_counts:
+        # About 1300 characters of text per chunk at the default 1500/200 split.
+        text = synthetic_text(n, words=n * 190)
+        results[f"micro.chunk.chunks={n}"] = {"median_ms": timeit(lambda: splitter.split_text(text), min_seconds)}
+
+
+def synthetic_chunks(n: int) -> list:
+    return [synthetic_text(i, words=190) for i in range(n)]
+
+
+def bench_index(results: dict, chunk_counts, min_seconds: float):
+    from tools.analyzer import TermDictionary, default_analyzer
+    from tools.bm25 import BM25Index, term_stats_from_ids
+    analyzer = default_analyzer()
+
+    def build(chunks):
+        dictionary = TermDictionary()
+        return BM25Index(term_stats_from_ids(analyzer.encode_batch(chunks, dictionary), dictionary.terms))
+
+    for n in chunk_counts:
+        chunks = synthetic_chunks(n)
+        results[f"micro.index_build.chunks={n}"] = {"median_ms": timeit(lambda: build(chunks), min_seconds)}
+
+
+def bench_retrieve(results: dict, chunk_counts, min_seconds: float):
+    from tools.analyzer import TermDictionary, default_analyzer
+    from tools.bm25 import term_stats_from_ids
+    from tools.paperstore import PaperStore
+    from tools.ragtool import FastTfidfRAG
+    analyzer = default_analyzer()
+    queries = ["what is the attention mechanism", "which dataset and benchmark are used",
+               "how does the optimizer learning rate affect training loss"]
+    with tempfile.TemporaryDirectory() as root:
+        store = PaperStore(root, analyzer=analyzer.signature)
+        for n in chunk_counts:
+            # Loaded through the paper store, exactly like a cached paper in production.
+            chunks = synthetic_chunks(n)
+            dictionary = TermDictionary()
+            stats = term_stats_from_ids(analyzer.encode_batch(chunks, dictionary), dictionary.terms)
+            url = f"https://arxiv.org/pdf/2401.{n:05d}v1"
+            store.save(url, "\n".join(chunks), chunks, stats)
+            rag = FastTfidfRAG(url, store=store)
+            results[f"micro.retrieve.chunks={n}"] = {
+                "median_ms": timeit(lambda: [rag.retrieve_scored(q, k=8) for q in queries], min_seconds) / len(queries)}
+            results[f"micro.retrieve_batch.chunks={n}"] = {
+                "median_ms": timeit(lambda: rag.retrieve_scored_batch(queries, k=8), min_seconds) / len(queries)}
+
+
+QUERIES = [
+    "attention is all you need",
+    "find me 5 papers on mixture of experts in cs.LG since 2021",
+    "papers by Hinton about capsule networks from 2017 to 2019",
+    "what are the most influential recent papers on diffusion models?",
+    'latest 20 preprints titled "graph neural networks" in cs',
+]
+
+
+def bench_query_parsing(results: dict, min_seconds: float):
+    from tools.arxivetool import build_arxiv_query, parse_search
+    from tools.getpapers import route_query
+
+    def parse_all():
+        for q in QUERIES:
+            build_arxiv_query(parse_search(q, count=100))
+            route_query(q)
+
+    results["micro.query_parse"] = {"median_ms": timeit(parse_all, min_seconds, max_runs=5000) / len(QUERIES)}
+
+
+def run_micro(chunk_counts=(50, 500, 2000), page_counts=(8, 32), min_seconds: float = 0.2) -> dict:
+    os.environ.setdefault("EXTRACT_PROCESSES", "0")
+    results = {}
+    bench_query_parsing(results, min_seconds)
+    bench_chunk(results, chunk_counts, min_seconds)
+    bench_index(results, chunk_counts, min_seconds)
+    bench_retrieve(results, chunk_counts, min_seconds)
+    bench_extract(results, page_counts, min_seconds)
+    return results
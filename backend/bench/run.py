@@ -0,0 +1,134 @@
+"""
+Runs the benchmark suites and compares them with a stored baseline.
+
+    python -m bench.run                       # micro + load, compared with bench/baseline.json
+    python -m bench.run --suite micro --quick
+    python -m bench.run --save-baseline       # record this machine's numbers as the baseline
+    python -m bench.run --check               # exit 1 if anything regressed beyond --tolerance
+
+Everything runs offline: arXiv and the LLM are the local fakes in
+``bench/fakes.py``. Baselines are only comparable on the machine (and
+settings) they were recorded with.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# Metrics where a larger number is better; every other metric is a latency.
+HIGHER_IS_BETTER = {"rps"}
+COMPARED = ("median_ms", "rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Rows of ``(name, metric, baseline, current, change, status)``; ``status``
+    is ``"regressed"``, ``"improved"`` or ``"ok"`` relative to ``tolerance``
+    (a fraction, e.g. ``0.2`` for 20%).
+    """
+    rows = []
+    for name, metrics in results.items():
+        base = baseline.get(name, {})
+        for metric in COMPARED:
+            if metric not in metrics:
+                continue
+            current, before = metrics[metric], base.get(metric)
+            if not before:
+                rows.append((name, metric, None, current, None, "new"))
+                continue
+            change = (current - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            status = "regressed" if worse > tolerance else "improved" if worse < -tolerance else "ok"
+            rows.append((name, metric, before, current, change, status))
+    return rows
+
+
+def print_report(rows: list):
+    width = max((len(r[0]) for r in rows), default=10)
+    print(f"{'benchmark':<{width}}  {'metric':<9} {'baseline':>10} {'current':>10} {'change':>8}  status")
+    for name, metric, before, current, change, status in rows:
+        before_s = f"{before:10.2f}" if before is not None else f"{'-':>10}"
+        change_s = f"{change * 100:+7.1f}%" if change is not None else f"{'-':>8}"
+        print(f"{name:<{width}}  {metric:<9} {before_s} {current:10.2f} {change_s}  {status}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the ArXivAI backend.")
+    parser.add_argument("--suite", choices=("micro", "load", "all"), default="all")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer requests")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated load concurrencies")
+    parser.add_argument("--requests", type=int, default=200, help="requests per load scenario and concurrency")
+    parser.add_argument("--scenarios", default="ask_direct,ask_llm,question,question_cached")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds to first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake LLM seconds per further token")
+    parser.add_argument("--arxiv-latency", type=float, default=0.0, help="fake arXiv seconds per response")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--check", action="store_true", help="exit 1 when a benchmark regressed")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    # The fakes answer instantly; no client-side spacing or persistent state.
+    os.environ.update(ARXIV_API_INTERVAL="0", ARXIV_PDF_RATE="0", EXTRACT_PROCESSES="0")
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+    results = {}
+    start = time.perf_counter()
+    if args.suite in ("micro", "all"):
+        from bench.micro import run_micro
+        results.update(run_micro(
+            chunk_counts=(50, 500) if args.quick else (50, 500, 2000),
+            page_counts=(8,) if args.quick else (8, 32),
+            min_seconds=0.05 if args.quick else 0.2,
+        ))
+    if args.suite in ("load", "all"):
+        from bench.load import run_load
+        results.update(run_load(
+            names=[s for s in args.scenarios.split(",") if s],
+            concurrencies=[int(c) for c in args.concurrency.split(",")],
+            n_requests=min(args.requests, 40) if args.quick else args.requests,
+            llm_latency=args.llm_latency,
+            token_latency=args.token_latency,
+            arxiv_latency=args.arxiv_latency,
+        ))
+    print(f"Ran {len(results)} benchmarks in {time.perf_counter() - start:.1f}s")
+    for name, metrics in results.items():
+        if metrics.get("errors"):
+            print(f"{name}: {metrics['errors']} of {metrics['requests']} requests failed")
+
+    document = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                 "llm_latency": args.llm_latency, "quick": args.quick},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    rows = compare(results, baseline, args.tolerance)
+    print_report(rows)
+
+    if args.save_baseline:
+        # Merged, so saving one suite keeps the other suite's baseline.
+        with open(args.baseline, "w") as f:
+            json.dump(dict(document, results=dict(baseline, **results)), f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+
+    regressed = [r for r in rows if r[5] == "regressed"]
+    if regressed:
+        print(f"{len(regressed)} metric(s) regressed by more than {args.tolerance:.0%}.")
+    return 1 if args.check and regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,53 @@
-from fastapi import FastAPI
+import os
+import json
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import secrets
+import threading
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from tools.getpapers import getpapers
-from tools.ragtool import FastTfidfRAG
+from tools.getpapers import resolve_search
+from tools.ragtool import ProgressiveRAG, open_paper_index
+from tools.cache import LRUCache
+from tools.singleflight import index_builds
+from tools.chatmemory import session_store_from_env
+from tools.prefetch import WarmupScheduler
+from tools.corpus import CorpusIndex
+from tools.workers import ExtractionQueueFull, extraction_pool_from_env
+from tools.arxivetool import (PAPER_FIELDS, SEARCH_CACHE, clamp_count, get_arxiv_papers, iter_search, parse_search,
+                              project_paper)
+from tools.answercache import answer_cache_from_env
+from tools.context import context_packer_from_env
+from tools.arxivclient import BACKGROUND, arxiv_session, priority
+from tools.sharedindex import shared_indexes_from_env
+from tools.metrics import METRICS, REQUEST_SECONDS, STAGE_SECONDS, collect_spans, process_memory, server_timing, span
+import time
 
 app = FastAPI()
 
-from model import simplechat
+from model import asimplechat, astream_simplechat
 
-RAGDICT = {}
+# Indexes shared by all uvicorn workers through mapped files (SHARED_INDEX_DIR; off by default).
+SHARED = shared_indexes_from_env()
 
+# Per-paper RAG indexes, bounded by entry count, an approximate byte budget
+# and an idle TTL so a long-running backend keeps flat memory use.
+# Dropping a shared index releases this worker's reference to it.
+RAGDICT = LRUCache(
+    max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", "64")),
+    max_bytes=int(os.getenv("RAG_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    ttl=float(os.getenv("RAG_CACHE_TTL", "3600")),
+    sizeof=lambda rag: rag.nbytes,
+    on_remove=(lambda paper_id, rag: SHARED.release(rag)) if SHARED else None,
+)
 
-Memory  = []
+# Conversation memory per client session, token-budgeted and expiring when idle.
+SESSIONS = session_store_from_env()
 # 2. Add the Middleware
 # This tells the browser that requests from other origins are allowed.
 app.add_middleware(
@@ -21,8 +57,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],                       # Allow all methods (POST, GET, etc.)
     allow_headers=["*"],                       # Allow all headers
+    expose_headers=["Server-Timing"],
 )
 
+# Adds a Server-Timing header with the per-stage spans of each request (SERVER_TIMING=1).
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    # Route templates, not raw paths, so unknown URLs cannot blow up the label set.
+    REQUEST_SECONDS.observe(getattr(route, "path", "unmatched"), time.perf_counter() - start)
+    if SERVER_TIMING and spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
 
 # 2. Define the Input Model (Schema)
 # This ensures the POST body contains a field called "query" that is a string.
@@ -30,17 +83,287 @@ class QueryRequest(BaseModel):
     query: str
     pdfLink: str | None = None
     paperId:str | None = None
+    sessionId: str | None = None
+    prefetch: int | None = None  # warm up indexes of the top N /ask results
+    noCache: bool = False  # skip the answer cache and always ask the LLM
+    limit: int | None = None  # /ask page size; the response carries a nextCursor
+    cursor: str | None = None  # nextCursor of the previous /ask page (query is then ignored)
+    fields: list[str] | None = None  # paper fields to return, e.g. ["title", "pdf_url", "date"]
+
+
+class PaperRef(BaseModel):
+    paperId: str
+    pdfLink: str
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: list[str]
+    paperId: str
+    pdfLink: str | None = None
+    noCache: bool = False
+
+
+class CorpusQueryRequest(BaseModel):
+    query: str
+    papers: list[PaperRef]
+    sessionId: str | None = None
+    k: int = 8
 
 # 3. Create the POST endpoint for /ask (legacy)
+# Cursors are signed so clients cannot forge searches. CURSOR_SECRET must be the same in every
+# worker process for a cursor to work on another worker; without it each process uses a random key.
+CURSOR_KEY = (os.getenv("CURSOR_SECRET") or secrets.token_hex(32)).encode('utf-8')
+# Largest /ask page (ASK_MAX_LIMIT); a larger limit is clamped to it.
+ASK_MAX_LIMIT = int(os.getenv("ASK_MAX_LIMIT", "100"))
+SEARCH_ARGS = frozenset(get_arxiv_papers.args)
+
+
+def _cursor_signature(payload: bytes) -> str:
+    return base64.urlsafe_b64encode(hmac.new(CURSOR_KEY, payload, hashlib.sha256).digest()).decode('ascii')
+
+
+def encode_cursor(func_args: dict, route: str, offset: int, limit: int) -> str:
+    state = {"args": func_args, "route": route, "offset": offset, "limit": limit}
+    payload = base64.urlsafe_b64encode(json.dumps(state).encode('utf-8'))
+    return payload.decode('ascii') + '.' + _cursor_signature(payload)
+
+
+def decode_cursor(cursor: str) -> dict:
+    """The state of a cursor from ``encode_cursor``; 400 if it is malformed, tampered with or out of range."""
+    try:
+        payload, signature = cursor.encode('ascii').rsplit(b'.', 1)
+        if not hmac.compare_digest(signature.decode('ascii'), _cursor_signature(payload)):
+            raise ValueError("bad signature")
+        state = json.loads(base64.urlsafe_b64decode(payload))
+        args, offset, limit = dict(state["args"]), int(state["offset"]), int(state["limit"])
+        if not set(args) <= SEARCH_ARGS or not 0 <= offset <= clamp_count(args.get("count", 100)) \
+                or not 0 < limit <= ASK_MAX_LIMIT:
+            raise ValueError("cursor out of range")
+        return {"args": args, "route": str(state["route"]), "offset": offset, "limit": limit}
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def resolve_ask(request: QueryRequest) -> tuple:
+    """
+    ``(func_args, route, offset, limit, fields)`` of an /ask request.
+
+    A cursor carries the resolved search, so later pages never repeat the
+    routing (or its LLM call); ``limit`` is ``None`` for an unpaginated answer
+    and at most ``ASK_MAX_LIMIT``.
+    """
+    fields = request.fields or None
+    unknown = sorted(set(fields or ()) - set(PAPER_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}; choose from {list(PAPER_FIELDS)}")
+    if request.limit is not None and request.limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    limit = min(request.limit, ASK_MAX_LIMIT) if request.limit is not None else None
+    if request.cursor:
+        state = decode_cursor(request.cursor)
+        return state["args"], state["route"], state["offset"], limit or state["limit"], fields
+    # Simple queries skip the LLM tool call; "route" reports which path answered.
+    func_args, route = resolve_search(request.query, default_count=100)
+    return func_args, route, 0, limit, fields
+
+
+def page_bounds(func_args: dict, offset: int, limit: int | None) -> tuple:
+    """
+    ``(end, total)``: the page is results ``offset:end`` of the full search
+    for ``total`` results. Every page fetches that same full search, so the
+    first page caches it and later pages are served from the search cache.
+    """
+    total = clamp_count(func_args.get("count", 100))
+    end = total if limit is None else min(offset + limit, total)
+    return end, total
+
+
+def schedule_warmup(request: QueryRequest, pdf_links: list):
+    top_n = PREFETCH_TOP_N if request.prefetch is None else request.prefetch
+    if top_n > 0:
+        # Without a session id the search gets a group of its own, so it neither
+        # supersedes nor is superseded by other clients' warm-ups.
+        group = request.sessionId or f"anonymous-{secrets.token_hex(8)}"
+        WARMUP.schedule(pdf_links, group=group, top_n=top_n)
+
+
 @app.post("/ask")
 def get_answer(request: QueryRequest):
-    user_input = request.query + " If count is not given use 100 as count"
-    result_text = getpapers(user_input)
-    return {"answer": result_text}
+    """
+    Searches arXiv for ``query``.
+
+    With ``limit`` the answer is one page and ``nextCursor`` (``None`` on the
+    last page) fetches the next; ``fields`` keeps only those paper fields.
+    """
+    func_args, route, offset, limit, fields = resolve_ask(request)
+    papers, next_cursor = {}, None
+    if func_args is not None:
+        end, total = page_bounds(func_args, offset, limit)
+        items = list(get_arxiv_papers.invoke(dict(func_args, count=total)).items())
+        papers = dict(items[offset:end])
+        if limit is not None and len(items) > end:
+            next_cursor = encode_cursor(func_args, route, end, limit)
+    schedule_warmup(request, [p.get("pdf_url") for p in papers.values()])
+    answer = {entry_id: project_paper(paper, fields) for entry_id, paper in papers.items()}
+    return {"answer": answer, "route": route, "nextCursor": next_cursor}
+
+
+@app.post("/ask/stream")
+def stream_answer(request: QueryRequest):
+    """
+    Same search as ``/ask`` as NDJSON: one ``{"id", "paper"}`` line per paper
+    as soon as arXiv returns it, then ``{"done": true, "route", "nextCursor"}``.
+    """
+    func_args, route, offset, limit, fields = resolve_ask(request)
+
+    def lines():
+        next_cursor, pdf_links = None, []
+        if func_args is not None:
+            end, total = page_bounds(func_args, offset, limit)
+            spec = parse_search(**dict(func_args, count=total))
+            # Read to the end so the full search gets cached for the next pages.
+            for i, (entry_id, paper) in enumerate(iter_search(spec)):
+                if i >= end:
+                    if limit is not None:
+                        next_cursor = encode_cursor(func_args, route, end, limit)
+                elif i >= offset:
+                    pdf_links.append(paper.get("pdf_url"))
+                    yield json.dumps({"id": entry_id, "paper": project_paper(paper, fields)}) + "\n"
+        schedule_warmup(request, pdf_links)
+        yield json.dumps({"done": True, "route": route, "nextCursor": next_cursor}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# PDF parsing and chunking run in worker processes (EXTRACT_PROCESSES=0 keeps them in-process).
+EXTRACT_POOL = extraction_pool_from_env()
+
+
+@app.exception_handler(ExtractionQueueFull)
+async def extraction_queue_full(request: Request, exc: ExtractionQueueFull):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+
+def build_rag(paper_id, pdf_link, cancel_event=None):
+    """Blocking index build; runs on the index-build pool, never on the event loop.
+
+    With shared indexes, a paper another worker already built is attached
+    instead, and only one worker at a time builds a given paper.
+    """
+    lock = None
+    if SHARED is not None:
+        rag = SHARED.attach(pdf_link)
+        if rag is None:
+            lock = SHARED.lock_build(pdf_link, cancel_event)
+            # Whoever held the lock may have just finished this paper.
+            rag = SHARED.attach(pdf_link)
+        if rag is not None:
+            if lock:
+                lock.release()
+            return RAGDICT.put(paper_id, rag)
+
+    def settle(rag, published: bool):
+        """Runs once extraction has finished *and* the index was published to RAGDICT."""
+        if lock:
+            lock.release()
+        if rag.error is not None:
+            # Timed out or failed part-way: don't keep serving a truncated paper.
+            RAGDICT.pop(paper_id)
+            return rag
+        # Swap the private build for the mapped copy every worker shares.
+        shared = SHARED.attach(pdf_link) if SHARED is not None else None
+        if published or paper_id in RAGDICT:
+            # Re-put even the same index so the byte budget sees its final size.
+            return RAGDICT.put(paper_id, shared or rag)
+        if shared is not None:
+            SHARED.release(shared)  # evicted while it was still being extracted
+        return rag
+
+    # Extraction may finish before build_rag publishes the index (or the other
+    # way round); whichever of the two happens second settles the build.
+    completion = {"published": False, "done": False}
+    completion_lock = threading.Lock()
+
+    def on_complete(rag):
+        with completion_lock:
+            completion["done"] = True
+            published = completion["published"]
+        if published:
+            settle(rag, published=False)
+
+    try:
+        rag = open_paper_index(
+            pdf_link,
+            on_complete=on_complete,
+            page_source=EXTRACT_POOL.stream if EXTRACT_POOL else None,
+            cancel_event=cancel_event,
+            store=SHARED.store if SHARED is not None else None,
+        )
+    except BaseException:
+        if lock:
+            lock.release()
+        raise
+    if not isinstance(rag, ProgressiveRAG):
+        return settle(rag, published=True)
+    # Publish before the single-flight entry is cleared so later callers hit the cache.
+    RAGDICT.put(paper_id, rag)
+    with completion_lock:
+        completion["published"] = True
+        done = completion["done"]
+    return settle(rag, published=True) if done else rag
+
+
+# Background index warm-up for papers returned by /ask (off unless PREFETCH_TOP_N > 0
+# or the request asks for it). Warm-ups join the same single-flight builds as /question.
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "0"))
+def warm_up(paper_id, pdf_link):
+    # Warm-up downloads queue behind interactive arXiv requests.
+    with priority(BACKGROUND):
+        return index_builds.submit(paper_id, build_rag, paper_id, pdf_link).result()
+
+
+WARMUP = WarmupScheduler(
+    build=warm_up,
+    is_ready=lambda paper_id: paper_id in RAGDICT or index_builds.in_flight(paper_id),
+    max_downloads=int(os.getenv("PREFETCH_MAX_DOWNLOADS", "2")),
+)
+
+
+async def until_disconnected(http_request: Request, poll: float = 0.5):
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(poll)
+
+
+async def get_rag(paper_id, pdf_link, http_request: Request | None = None):
+    """Returns the cached index for ``paper_id``, building it at most once concurrently.
+
+    With ``http_request`` the wait is abandoned when the client disconnects;
+    the build itself is cancelled once no other caller is waiting for it.
+    """
+    rag = RAGDICT.get(paper_id)
+    if rag is not None:
+        return rag
+    build = asyncio.ensure_future(index_builds.run(paper_id, build_rag, paper_id, pdf_link))
+    if http_request is None:
+        with span("index_wait"):
+            return await build
+    watcher = asyncio.ensure_future(until_disconnected(http_request))
+    try:
+        with span("index_wait"):
+            await asyncio.wait({build, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        build.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not build.done():
+        build.cancel()
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return build.result()
+
 
 # 4. Simple question API used by the frontend
 @app.post("/question")
-def get_question(request: QueryRequest):
+async def get_question(request: QueryRequest, http_request: Request):
     """Return a simple answer for the given query.
 
     The frontend posts to this endpoint with a JSON body containing a
@@ -48,25 +371,276 @@ def get_question(request: QueryRequest):
     forwards the query to ``getpapers`` and returns the result under the
     ``response`` key, echoing back the provided ``pdfLink`` if present.
     """
-    global Memory
+    ques, coverage, cache_key = await build_question_prompt(request, http_request)
+    response = ANSWERS.get(cache_key) if cache_key else None
+    cached = response is not None
+    if not cached:
+        response = await asimplechat(ques)
+        if cache_key:
+            ANSWERS.put(cache_key, str(response))
+    SESSIONS.get(request.sessionId).add("BOT_RESPONSE", response)
+    # print(response)
+    return {"response": str(response), "partial": not coverage["complete"], "coverage": coverage, "cached": cached}
+
+
+# Answers keyed by paper, normalized question, retrieved chunk ids and chat history (ANSWER_CACHE_ENTRIES=0 disables).
+ANSWERS = answer_cache_from_env()
+
+
+async def build_question_prompt(request: QueryRequest, http_request: Request | None = None):
+    """Records the user query, retrieves context and assembles the LLM prompt.
+
+    Returns the prompt, the index coverage at retrieval time (papers that
+    are still being extracted are answered from the pages indexed so far)
+    and the answer cache key (``None`` when the cache is off or bypassed).
+    """
     user_input = request.query 
-    Memory.append({"USER_QUERY":user_input})
+    session = SESSIONS.get(request.sessionId)
+    history = session.history()
+    session.add("USER_QUERY", user_input)
     
     # result_text = getpapers(user_input)
-    if request.paperId not in RAGDICT:
-        RAGDICT[request.paperId] = FastTfidfRAG(request.pdfLink)
+    rag = await get_rag(request.paperId, request.pdfLink, http_request)
     
-    retrieved_docs = RAGDICT[request.paperId].retrieve(user_input)
+    if rag.complete:
+        chunk_ids, scores = rag.retrieve_scored(user_input, k=CONTEXT_CANDIDATES)
+    else:
+        # May block until the pages the question needs are indexed.
+        chunk_ids, scores = await asyncio.to_thread(rag.retrieve_scored, user_input, CONTEXT_CANDIDATES)
+    context_str, chunk_ids = pack_context(rag, chunk_ids, scores)
+    coverage = rag.coverage()
+    cache_key = None
+    if ANSWERS is not None and not request.noCache:
+        cache_key = ANSWERS.key(request.paperId, user_input, chunk_ids, history)
     # print(docs,len(docs))
-    context_str = "\n\n---\n\n".join(retrieved_docs)
-    maxn = max(len(Memory),6)
-    ques = f"Chat History {Memory[:maxn]} \n\n Context:\n{context_str}\n\nQuestion: {user_input}"
-    response = simplechat(ques )
-    Memory.append({"BOT_RESPONSE":response})
-    # print(response)
-    return {"response": str(response)}
+    with span("prompt"):
+        ques = format_prompt(history, context_str, user_input)
+    return ques, coverage, cache_key
+
+
+# Retrieved chunks are merged (overlap removed) and packed into CONTEXT_TOKEN_BUDGET;
+# CONTEXT_CANDIDATES is how many top chunks compete for that budget.
+PACKER = context_packer_from_env()
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+
+
+def pack_context(rag, chunk_ids, scores):
+    """Returns the packed context text and the chunk ids it contains, in reading order."""
+    with span("pack_context"):
+        spans = PACKER.pack_chunks(rag.documents, chunk_ids, scores)
+    return PACKER.render(spans), [i for s in spans for i in s.chunk_ids]
+
+
+def format_prompt(history, context_str, question):
+    return f"Chat History {history} \n\n Context:\n{context_str}\n\nQuestion: {question}"
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """Formats one Server-Sent Events message with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# 4b. Streaming variant of /question (Server-Sent Events)
+@app.post("/question/stream")
+async def stream_question(request: QueryRequest, http_request: Request):
+    """Same as ``/question`` but streams answer tokens as they are generated.
+
+    Emits ``data: {"token": ...}`` messages, then a final ``done`` event
+    carrying the full ``response``; failures are reported as an ``error``
+    event. The complete answer is recorded in the session's chat memory once
+    the stream ends. A cached answer is sent as a single token.
+    """
+    ques, coverage, cache_key = await build_question_prompt(request, http_request)
+    cached = ANSWERS.get(cache_key) if cache_key else None
+
+    async def events():
+        if cached is not None:
+            response = cached
+            yield sse_event({"token": response})
+        else:
+            parts = []
+            try:
+                async for token in astream_simplechat(ques):
+                    parts.append(token)
+                    yield sse_event({"token": token})
+            except Exception as e:
+                print(f"Streaming failed: {e}")
+                yield sse_event({"error": str(e)}, event="error")
+                return
+            response = "".join(parts)
+            if cache_key:
+                ANSWERS.put(cache_key, response)
+        SESSIONS.get(request.sessionId).add("BOT_RESPONSE", response)
+        yield sse_event({"response": response, "partial": not coverage["complete"], "cached": cached is not None}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Upper bounds for /question/batch: questions per request and LLM calls in flight per request.
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "20"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+
+# 4c. Many questions about one paper (e.g. generating a summary)
+@app.post("/question/batch")
+async def get_batch_questions(request: BatchQuestionRequest, http_request: Request):
+    """Answer several independent questions about one paper.
+
+    Retrieval for all questions runs in one vectorized pass; the LLM calls
+    then run concurrently, at most ``BATCH_LLM_CONCURRENCY`` at a time.
+    Questions are answered without chat history and are not recorded in a
+    session. Each answer lists the chunk ids it was given; a failed LLM
+    call is reported in that answer's ``error`` instead of failing the batch.
+    """
+    questions = request.questions
+    if not questions:
+        return {"answers": [], "partial": False, "coverage": None}
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+
+    rag = await get_rag(request.paperId, request.pdfLink, http_request)
+    if rag.complete:
+        scored = rag.retrieve_scored_batch(questions, k=CONTEXT_CANDIDATES)
+    else:
+        scored = await asyncio.to_thread(rag.retrieve_scored_batch, questions, CONTEXT_CANDIDATES)
+    coverage = rag.coverage()
+
+    limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(question, retrieved):
+        context_str, chunk_ids = pack_context(rag, *retrieved)
+        result = {"question": question, "chunkIds": chunk_ids, "cached": False}
+        cache_key = None
+        if ANSWERS is not None and not request.noCache:
+            cache_key = ANSWERS.key(request.paperId, question, chunk_ids)
+            cached = ANSWERS.get(cache_key)
+            if cached is not None:
+                return dict(result, response=cached, cached=True)
+        with span("prompt"):
+            ques = format_prompt([], context_str, question)
+        try:
+            async with limit:
+                response = str(await asimplechat(ques))
+        except Exception as e:
+            print(f"Batch question failed: {e}")
+            return dict(result, response=None, error=str(e))
+        if cache_key:
+            ANSWERS.put(cache_key, response)
+        return dict(result, response=response)
+
+    answers = await asyncio.gather(*(answer(q, retrieved) for q, retrieved in zip(questions, scored)))
+    return {"answers": answers, "partial": not coverage["complete"], "coverage": coverage}
+
+# Shared multi-paper index for questions spanning several papers.
+CORPUS = CorpusIndex(max_papers=int(os.getenv("CORPUS_MAX_PAPERS", "200")))
+
+
+async def ensure_in_corpus(paper: PaperRef):
+    """
+    Adds ``paper`` to the corpus from its per-paper index (built on the index
+    build pool if needed); the corpus reuses that index's term statistics.
+    """
+    if paper.paperId not in CORPUS:
+        rag = await get_rag(paper.paperId, paper.pdfLink)
+        if not rag.complete:
+            await asyncio.to_thread(rag.wait_until_complete)
+        await asyncio.to_thread(CORPUS.add_paper, paper.paperId, rag.documents, stats=rag.term_stats())
+
+
+# 4d. Question across several papers (e.g. "the papers I just searched")
+@app.post("/corpus/question")
+async def get_corpus_question(request: CorpusQueryRequest):
+    """Answer ``query`` from the chunks of all listed papers.
+
+    Retrieval runs over the shared corpus index restricted to ``papers``;
+    the response lists the source chunks with their paper provenance.
+    """
+    # Missing papers are built concurrently.
+    await asyncio.gather(*(ensure_in_corpus(paper) for paper in request.papers))
+    hits = CORPUS.search(request.query, k=request.k, paper_ids=[p.paperId for p in request.papers])
+
+    session = SESSIONS.get(request.sessionId)
+    history = session.history()
+    session.add("USER_QUERY", request.query)
+    with span("pack_context"):
+        spans = PACKER.pack([(h["paper_id"], h["chunk_id"], h["score"], h["text"]) for h in hits])
+    packed = {(s.group, i) for s in spans for i in s.chunk_ids}
+    hits = [h for h in hits if (h["paper_id"], h["chunk_id"]) in packed]
+    ques = format_prompt(history, PACKER.render(spans, label=lambda s: f"[{s.group}]"), request.query)
+    response = await asimplechat(ques)
+    session.add("BOT_RESPONSE", response)
+    sources = [{"paperId": h["paper_id"], "chunkId": h["chunk_id"], "score": h["score"]} for h in hits]
+    return {"response": str(response), "sources": sources}
+
+# 5. Cache statistics (hits, misses, evictions, memory)
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {
+        "rag": RAGDICT.stats(),
+        "sessions": SESSIONS.stats(),
+        "warmup": WARMUP.stats,
+        "corpus": CORPUS.stats(),
+        "extraction": EXTRACT_POOL.stats if EXTRACT_POOL else None,
+        "search": SEARCH_CACHE.stats(),
+        "answers": ANSWERS.stats() if ANSWERS else None,
+        "arxiv": arxiv_session().stats,
+        "shared_indexes": SHARED.stats() if SHARED else None,
+        "stages": STAGE_SECONDS.summary(),
+    }
+
+
+@METRICS.register_collector
+def collect_state():
+    """Gauges and counters read from live state at scrape time."""
+    caches = {"rag": RAGDICT.stats(), "sessions": SESSIONS.stats(), "search": SEARCH_CACHE.stats()}
+    if ANSWERS:
+        caches["answers"] = ANSWERS.stats()
+    families = []
+    for name, kind, key in (
+        ("arxivai_cache_entries", "gauge", "entries"),
+        ("arxivai_cache_bytes", "gauge", "bytes"),
+        ("arxivai_cache_hits_total", "counter", "hits"),
+        ("arxivai_cache_misses_total", "counter", "misses"),
+        ("arxivai_cache_evictions_total", "counter", "evictions"),
+        ("arxivai_cache_hit_ratio", "gauge", "hit_ratio"),
+    ):
+        families.append((name, kind, f"Cache {key.replace('_', ' ')}.", [({"cache": c}, s[key]) for c, s in caches.items()]))
+
+    corpus = CORPUS.stats()
+    families.append(("arxivai_indexes", "gauge", "Indexes held in memory.", [
+        ({"kind": "paper"}, len(RAGDICT)),
+        ({"kind": "building"}, len(index_builds)),
+        ({"kind": "corpus_paper"}, corpus["papers"]),
+    ]))
+    families.append(("arxivai_corpus_size", "gauge", "Shared corpus index size.", [
+        ({"unit": "chunks"}, corpus["chunks"]), ({"unit": "terms"}, corpus["terms"]),
+    ]))
+    families.append(("arxivai_warmup_total", "counter", "Background warm-up outcomes.",
+                     [({"outcome": k}, v) for k, v in WARMUP.stats.items()]))
+    families.append(("arxivai_warmup_pending", "gauge", "Warm-ups waiting to run.", [({}, WARMUP.pending())]))
+    if EXTRACT_POOL:
+        families.append(("arxivai_extraction_jobs_total", "counter", "Extraction pool jobs by outcome.",
+                         [({"outcome": k}, v) for k, v in EXTRACT_POOL.stats.items()]))
+    families.append(("arxivai_arxiv_http_total", "counter", "Shared arXiv session activity.",
+                     [({"kind": k}, v) for k, v in arxiv_session().stats.items()]))
+    if SHARED:
+        families.append(("arxivai_shared_indexes", "gauge", "Shared index activity of this worker.",
+                         [({"kind": k}, v) for k, v in SHARED.stats().items()]))
+    families.append(("arxivai_process_memory_bytes", "gauge", "Memory of the serving process.",
+                     [({"kind": k}, v) for k, v in process_memory().items()]))
+    return families
+
+
+# 5b. Prometheus-style metrics: stage latency histograms, cache, index and memory gauges
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
 
-# 4. Optional: Block to run the script directly with Python
+# 6. Optional: Block to run the script directly with Python
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -1,8 +1,9 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 import os
 # from langgraph.prebuilt import create_react_agent
-from langchain.agents import create_agent
 from tools.arxivetool import get_arxiv_papers
+from tools.lazy import REGISTRY, lazy_import
+from tools.metrics import record_span, span
+import time
 import os
 from dotenv import load_dotenv
 
@@ -14,6 +15,7 @@ os.environ["GOOGLE_API_KEY"] = ""
 # Initialize the model
 
 # Use "gemini-2.5-flash" for speed or "gemini-2.5-pro" for complex reasoning
+# from langchain_google_genai import ChatGoogleGenerativeAI
 # llm = ChatGoogleGenerativeAI(
 #     model="gemini-2.5-flash",
 #     temperature=0.7,
@@ -22,18 +24,26 @@ os.environ["GOOGLE_API_KEY"] = ""
 #     max_retries=2,
 # )
 
-from langchain_groq import ChatGroq
+# Clients and agents are built on first use (see tools/lazy.py), so importing
+# this module neither loads the LangChain provider packages nor needs an API key.
+@REGISTRY.provides("llm")
+def _build_llm():
+    ChatGroq = lazy_import("langchain_groq", "ChatGroq")
+    return ChatGroq(
+        model="llama-3.1-8b-instant",
+
+    )
+
+
+def get_llm():
+    return REGISTRY.get("llm")
 
 
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
- 
-)
 from pydantic import BaseModel, Field
 
 
-def simplechat(query):
-    messages = [
+def chat_messages(query):
+    return [
 (
     "system",
     """You are a technical documentation assistant. Answer queries strictly based on the provided context.
@@ -48,8 +58,40 @@ def simplechat(query):
 ),
     ("human", query),
 ]
-    chat_completion = llm.invoke(messages)
+
+
+def simplechat(query):
+    with span("llm"):
+        chat_completion = get_llm().invoke(chat_messages(query))
+    return chat_completion.content
+
+
+async def asimplechat(query):
+    """Async ``simplechat``: awaits the Groq call without holding a worker thread."""
+    with span("llm"):
+        chat_completion = await get_llm().ainvoke(chat_messages(query))
     return chat_completion.content
+
+
+def stream_simplechat(query):
+    """Streaming ``simplechat``: yields content tokens as the model produces them."""
+    with span("llm"):
+        for chunk in get_llm().stream(chat_messages(query)):
+            if chunk.content:
+                yield chunk.content
+
+
+async def astream_simplechat(query):
+    """Async ``stream_simplechat``; also records the time to the first token."""
+    start = time.perf_counter()
+    first = True
+    with span("llm"):
+        async for chunk in get_llm().astream(chat_messages(query)):
+            if chunk.content:
+                if first:
+                    record_span("llm_first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk.content
     
 
 
@@ -75,22 +117,31 @@ You are a research assistant.
    - Do not output any conversational text, only the JSON.
 """
 
+tools = [get_arxiv_papers]
+
+
 # 3. Create Agent
-agent1 = create_agent(
-    llm, 
-    tools=[get_arxiv_papers], 
-    system_prompt=system_instruction, 
-    response_format=ResponseFormat
-)
+@REGISTRY.provides("agent1")
+def _build_agent():
+    create_agent = lazy_import("langchain.agents", "create_agent")
+    return create_agent(
+        get_llm(),
+        tools,
+        system_prompt=system_instruction,
+        response_format=ResponseFormat
+    )
+
+
+def get_agent():
+    return REGISTRY.get("agent1")
 
-tools = [get_arxiv_papers]
 
-# Create the agent
-agent1 = create_agent(
-    llm, 
-    tools, 
-    system_prompt=system_instruction, 
-    response_format=ResponseFormat
-)
+def __getattr__(name):
+    # ``from model import llm`` / ``agent1`` keep working, built on first access.
+    if name == "llm":
+        return get_llm()
+    if name == "agent1":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
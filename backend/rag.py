@@ -1,33 +1,59 @@
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-import faiss
 import numpy as np
+from tools.analyzer import default_analyzer
+from tools.bm25 import top_k_indices
+from tools.lazy import lazy_import
+
 
 class FastTfidfRAG:
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(stop_words='english', lowercase=True)
+        # norm='l2' makes every row unit length, so a dot product is cosine similarity.
+        # Terms come from the same analyzer as the BM25 retrievers (tools/analyzer.py).
+        TfidfVectorizer = lazy_import("sklearn.feature_extraction.text", "TfidfVectorizer")
+        self.vectorizer = TfidfVectorizer(analyzer=default_analyzer(), norm='l2', dtype=np.float32)
         self.index = None
         self.documents = []
 
     def build_index(self, documents: list):
         """
-        Builds the TF-IDF and Faiss index from a list of documents.
+        Builds the sparse TF-IDF index from a list of documents.
+
+        The CSR matrix is kept as-is (memory grows with the non-zeros, not
+        with chunks x vocabulary).
 
         Args:
             documents (list): A list of text documents.
         """
         self.documents = documents
         print("Building TF-IDF index...")
-        tfidf_matrix = self.vectorizer.fit_transform(self.documents)
-        
-        # Convert to a dense matrix for Faiss
-        dense_tfidf_matrix = tfidf_matrix.toarray().astype('float32')
-        
-        print("Building Faiss index...")
-        d = dense_tfidf_matrix.shape[1]
-        self.index = faiss.IndexFlatL2(d)  # Using L2 distance for similarity
-        self.index.add(dense_tfidf_matrix)
-        print("Index built successfully.")
+        self.index = self.vectorizer.fit_transform(self.documents).tocsr()
+        print(f"Index built successfully ({self.index.shape[0]} documents, {self.index.nnz} non-zeros).")
+
+    def score_batch(self, queries: list) -> np.ndarray:
+        """
+        Cosine similarity of every query against every document.
+
+        Returns:
+            np.ndarray: ``(len(queries), n_documents)`` float32 scores.
+        """
+        if self.index is None:
+            raise Exception("Index has not been built yet. Please call build_index() first.")
+        query_matrix = self.vectorizer.transform(queries)
+        # Sparse x sparse product; only the (small) result is densified.
+        return (query_matrix @ self.index.T).toarray()
+
+    def retrieve_batch(self, queries: list, k: int = 5) -> list:
+        """
+        Retrieves the top-k documents for each query in one sparse product.
+
+        Args:
+            queries (list): The user's queries.
+            k (int, optional): The number of documents per query. Defaults to 5.
+
+        Returns:
+            list: One list of the top-k relevant documents per query.
+        """
+        scores = self.score_batch(queries)
+        return [[self.documents[i] for i in top_k_indices(row, k)] for row in scores]
 
     def retrieve(self, query: str, k: int = 5) -> list:
         """
@@ -40,17 +66,7 @@ class FastTfidfRAG:
         Returns:
             list: A list of the top-k relevant documents.
         """
-        if self.index is None:
-            raise Exception("Index has not been built yet. Please call build_index() first.")
-
-        query_vector = self.vectorizer.transform([query]).toarray().astype('float32')
-        
-        # Search the Faiss index
-        distances, indices = self.index.search(query_vector, k)
-        
-        # Retrieve the documents
-        retrieved_docs = [self.documents[i] for i in indices[0]]
-        return retrieved_docs
+        return self.retrieve_batch([query], k)[0]
 
 # # --- Example Usage ---
 # if __name__ == '__main__':
@@ -0,0 +1,1108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds `import main` may take in a fresh interpreter (IMPORT_BUDGET_SECONDS overrides).
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "3.0"))
+
+# Libraries that must only load when an endpoint first needs them.
+LAZY_MODULES = [
+    "langchain_groq",
+    "langchain_google_genai",
+    "langchain.agents",
+    "langgraph",
+    "langchain_text_splitters",
+    "pdfminer",
+    "sklearn",
+]
+
+# Runs in a child interpreter: sockets fail loudly, then main is imported and timed.
+IMPORT_PROBE = """
+import json, socket, sys, time
+def no_network(*args, **kwargs):
+    raise RuntimeError("network access during import")
+socket.socket.connect = no_network
+socket.create_connection = no_network
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+class ImportBudgetTest(unittest.TestCase):
+    def test_import_main_is_fast_and_lazy(self):
+        env = dict(os.environ, EXTRACT_PROCESSES="0")
+        env.pop("GROQ_API_KEY", None)  # the LLM client must not be constructed at import
+        proc = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        loaded = set(result["modules"])
+        eager = [m for m in LAZY_MODULES if m in loaded]
+        self.assertEqual(eager, [], f"imported eagerly: {eager}")
+        self.assertLess(result["seconds"], IMPORT_BUDGET_SECONDS)
+
+
+class LRUCacheTest(unittest.TestCase):
+    """Entry limit, byte budget and idle TTL of ``LRUCache``."""
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        from tools.cache import LRUCache
+        removed = []
+        cache = LRUCache(max_entries=None, max_bytes=10, sizeof=len, on_remove=lambda k, v: removed.append(k))
+        cache.put("a", "xxxx")
+        cache.put("b", "xxxx")
+        cache.get("a")  # "b" is now the least recently used
+        cache.put("c", "xxxx")
+        self.assertEqual((sorted(cache._data), cache.total_bytes, removed), (["a", "c"], 8, ["b"]))
+        cache.put("big", "x" * 50)  # the newest entry is kept even alone over budget
+        self.assertEqual(list(cache._data), ["big"])
+
+    def test_zero_entries_disables_the_cache(self):
+        from tools.cache import LRUCache
+        removed = []
+        cache = LRUCache(max_entries=0, on_remove=lambda k, v: removed.append((k, v)))
+        self.assertEqual(cache.put("a", 1), 1)
+        self.assertNotIn("a", cache)
+        self.assertEqual(removed, [("a", 1)])  # refused values are released like evicted ones
+
+    def test_idle_entries_expire(self):
+        from unittest import mock
+        from tools.cache import LRUCache
+        now = [100.0]
+        with mock.patch("tools.cache.time.monotonic", side_effect=lambda: now[0]):
+            cache = LRUCache(ttl=10)
+            cache.put("a", 1)
+            cache.put("b", 2)
+            now[0] += 8
+            self.assertEqual(cache.get("a"), 1)  # a read refreshes the entry
+            now[0] += 8
+            self.assertEqual((cache.get("a"), cache.get("b")), (1, None))
+            now[0] += 20
+            self.assertEqual((cache.expire(), len(cache), cache.expirations), (1, 0, 2))
+
+
+class SingleFlightTest(unittest.TestCase):
+    """Callers share one call; it is cancelled only when the last waiter goes away."""
+
+    def test_cancelled_only_when_every_waiter_is_gone(self):
+        import asyncio
+        import threading
+        from tools.singleflight import SingleFlight
+        flights = SingleFlight(max_workers=2, cancellable=True)
+        started, calls = threading.Event(), []
+
+        def work(key, cancel_event):
+            calls.append(key)
+            started.set()
+            cancel_event.wait(5)
+            return cancel_event.is_set()
+
+        async def scenario():
+            first = asyncio.ensure_future(flights.run("k", work, "k"))
+            second = asyncio.ensure_future(flights.run("k", work, "k"))
+            await asyncio.to_thread(started.wait, 5)
+            first.cancel()
+            await asyncio.sleep(0.05)
+            still_running = flights.in_flight("k")
+            second.cancel()
+            await asyncio.gather(first, second, return_exceptions=True)
+            return still_running
+
+        self.assertTrue(asyncio.run(scenario()))
+        self.assertEqual(calls, ["k"])
+        self.assertFalse(flights.in_flight("k"))
+
+    def test_blocking_caller_pins_the_call(self):
+        import asyncio
+        from tools.singleflight import SingleFlight
+        flights = SingleFlight(max_workers=1, cancellable=True)
+        future = flights.submit("k", lambda cancel_event: cancel_event.wait(0.2) or "built")
+
+        async def cancelled_waiter():
+            task = asyncio.ensure_future(flights.run("k", lambda cancel_event: "other"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(cancelled_waiter())
+        self.assertEqual(future.result(timeout=5), "built")
+
+
+class PaperStoreTest(unittest.TestCase):
+    """A saved paper loads back with the same chunks, statistics and BM25 weights."""
+
+    def test_round_trip(self):
+        import tempfile
+        import numpy as np
+        from tools.analyzer import TermDictionary, default_analyzer
+        from tools.bm25 import BM25Index, term_stats_from_ids
+        from tools.paperstore import PaperStore
+        text = "Attention is all you need. We propose the Transformer. Résumé of results: BLEU 28.4."
+        chunks = ["Attention is all you need.", "We propose the Transformer.", "Résumé of results: BLEU 28.4."]
+        dictionary = TermDictionary()
+        stats = term_stats_from_ids(default_analyzer().encode_batch(chunks, dictionary), dictionary.terms)
+        index = BM25Index(stats)
+        url = "https://arxiv.org/pdf/1706.03762v7"
+        with tempfile.TemporaryDirectory() as root:
+            store = PaperStore(root)
+            self.assertIsNone(store.load(url))
+            store.save(url, text, chunks, stats, index=index)
+            stored = store.load(url)
+            self.assertEqual((stored.chunks(), list(stored.chunk_view()), stored.text()), (chunks, chunks, text))
+            self.assertEqual(stored.stats["vocab"], stats["vocab"])
+            for name in ("indptr", "indices", "data", "doc_len", "df"):
+                np.testing.assert_array_equal(stored.stats[name], stats[name])
+            loaded = BM25Index.from_arrays(stored.stats["vocab"], stored.stats["doc_len"], stored.bm25)
+            query = default_analyzer()("transformer results")
+            np.testing.assert_allclose(loaded.get_scores(query), index.get_scores(query))
+            self.assertTrue(store.remove(url))
+            self.assertIsNone(store.load(url))
+
+    def test_same_text_under_two_chunkings(self):
+        import tempfile
+        from tools.analyzer import TermDictionary, default_analyzer
+        from tools.bm25 import term_stats_from_ids
+        from tools.paperstore import PaperStore
+        text = "Attention is all you need. We propose the Transformer."
+        url = "https://arxiv.org/pdf/1706.03762v7"
+
+        def save(store, chunks):
+            dictionary = TermDictionary()
+            stats = term_stats_from_ids(default_analyzer().encode_batch(chunks, dictionary), dictionary.terms)
+            return store.save(url, text, chunks, stats)
+
+        with tempfile.TemporaryDirectory() as root:
+            large, small = PaperStore(root), PaperStore(root, chunk_size=20, chunk_overlap=0)
+            large_digest = save(large, [text])
+            small_digest = save(small, ["Attention is all you need.", "We propose the Transformer."])
+            self.assertNotEqual(large_digest, small_digest)
+            self.assertEqual(large.load(url).chunks(), [text])
+            self.assertEqual(len(small.load(url).chunks()), 2)
+            # A ref pointing at an object built with another configuration is ignored.
+            with open(small._ref_path(small.key_for(url)), "w") as f:
+                f.write(large_digest)
+            self.assertIsNone(small.load(url))
+
+
+class ProgressiveIndexTest(unittest.TestCase):
+    """Pages are searchable as they arrive; only a fully extracted paper is stored and reopened."""
+
+    URL = "https://arxiv.org/pdf/1706.03762v7"
+    PAGES = [
+        ["Attention is all you need.", "We propose the Transformer, based on attention alone."],
+        ["Results: the Transformer reaches 28.4 BLEU on translation."],
+    ]
+
+    def page_source(self, release, fail=False):
+        def source(pdf_url, cancel_event=None):
+            yield "page 1", self.PAGES[0]
+            release.wait(5)
+            if fail:
+                raise OSError("connection reset")
+            yield "page 2", self.PAGES[1]
+            yield None, []
+        return source
+
+    def test_pages_are_indexed_as_they_arrive(self):
+        import tempfile
+        import threading
+        from unittest import mock
+        from tools.paperstore import PaperStore
+        from tools.ragtool import FastTfidfRAG, ProgressiveRAG, open_paper_index
+        release, saved = threading.Event(), threading.Event()
+        with tempfile.TemporaryDirectory() as root:
+            store = PaperStore(root)
+            rag = open_paper_index(self.URL, page_source=self.page_source(release), store=store,
+                                   on_complete=lambda rag: saved.set())
+            self.assertIsInstance(rag, ProgressiveRAG)
+            self.assertEqual(rag.coverage(), {"complete": False, "pages": 1, "chunks": 2, "error": None})
+            self.assertEqual(rag.retrieve_ids("transformer attention", k=2)[0], 1)
+            self.assertIsNone(store.load(self.URL))
+
+            release.set()
+            self.assertTrue(saved.wait(5))  # set once the paper is in the store
+            self.assertEqual(rag.coverage(), {"complete": True, "pages": 2, "chunks": 3, "error": None})
+            self.assertEqual(rag.retrieve_ids("BLEU", k=1), [0, 2])
+
+            with mock.patch.object(store, "load", wraps=store.load) as load:
+                reopened = open_paper_index(self.URL, store=store)
+            self.assertIs(type(reopened), FastTfidfRAG)
+            self.assertEqual(load.call_count, 1)
+            self.assertEqual(list(reopened.documents), self.PAGES[0] + self.PAGES[1])
+
+    def test_failed_extraction_is_reported_and_not_stored(self):
+        import tempfile
+        import threading
+        from tools.paperstore import PaperStore
+        from tools.ragtool import open_paper_index
+        release, done = threading.Event(), threading.Event()
+        release.set()
+        with tempfile.TemporaryDirectory() as root:
+            store = PaperStore(root)
+            rag = open_paper_index(self.URL, page_source=self.page_source(release, fail=True), store=store,
+                                   on_complete=lambda rag: done.set())
+            self.assertTrue(done.wait(5))
+            self.assertEqual(rag.coverage(),
+                             {"complete": False, "pages": 1, "chunks": 2, "error": "connection reset"})
+            self.assertEqual(sorted(rag.retrieve("attention", k=2)), sorted(self.PAGES[0]))
+            self.assertIsNone(store.load(self.URL))
+
+
+class ExtractionPoolTest(unittest.TestCase):
+    """Worker processes return the same chunks and terms as in-process extraction, within a bounded queue."""
+
+    def test_matches_in_process_extraction(self):
+        from bench.fakes import FakeArxiv
+        from tools.analyzer import TermDictionary, TermRemap, default_analyzer
+        from tools.ragtool import iter_page_chunks
+        from tools.workers import ExtractionPool
+        pool = ExtractionPool(processes=1, max_pending=0)
+        try:
+            with FakeArxiv(pages=3) as fake:
+                url = fake.pdf_url("2401.00001")
+                expected = list(iter_page_chunks(url, pdf_bytes=fake.pdf("2401.00001")))
+                pages = list(pool.stream(url))
+        finally:
+            pool.shutdown()
+        self.assertEqual([(text, chunks) for text, chunks, _ in pages], expected)
+        local, remote = TermDictionary(), TermDictionary()
+        remap = TermRemap(remote)
+        for _, chunks, encoded in pages:
+            for ids, expected_ids in zip(remap(*encoded), default_analyzer().encode_batch(chunks, local)):
+                self.assertEqual(ids.tolist(), expected_ids.tolist())
+        self.assertEqual(remote.terms, local.terms)
+        self.assertEqual((pool.stats["submitted"], pool.stats["completed"]), (1, 1))
+
+    def test_full_queue_rejects_new_jobs(self):
+        from bench.fakes import FakeArxiv
+        from tools.workers import ExtractionPool, ExtractionQueueFull
+        pool = ExtractionPool(processes=1, max_pending=0)
+        try:
+            with FakeArxiv(pages=2) as fake:
+                running = pool.stream(fake.pdf_url("2401.00001"))
+                with self.assertRaises(ExtractionQueueFull):
+                    pool.stream(fake.pdf_url("2401.00002"))
+                self.assertEqual(len(list(running)), 3)  # two pages and the final flush
+                deadline = time.monotonic() + 5
+                while pool.stats["submitted"] == 1 and time.monotonic() < deadline:
+                    try:  # the slot frees once the worker has finished the job
+                        list(pool.stream(fake.pdf_url("2401.00002")))
+                    except ExtractionQueueFull:
+                        time.sleep(0.05)
+        finally:
+            pool.shutdown()
+        self.assertEqual((pool.stats["rejected"] >= 1, pool.stats["completed"]), (True, 2))
+
+
+class SharedIndexesTest(unittest.TestCase):
+    """Each process holds a shared paper while any of its indexes is attached, and only then."""
+
+    URL = "https://arxiv.org/pdf/1706.03762v7"
+
+    def shared_indexes(self, root):
+        from tools.analyzer import TermDictionary, default_analyzer
+        from tools.bm25 import BM25Index, term_stats_from_ids
+        from tools.sharedindex import SharedIndexes
+        chunks = ["Attention is all you need.", "We propose the Transformer."]
+        dictionary = TermDictionary()
+        stats = term_stats_from_ids(default_analyzer().encode_batch(chunks, dictionary), dictionary.terms)
+        shared = SharedIndexes(root, lock_wait=1)
+        shared.store.save(self.URL, "".join(chunks), chunks, stats, index=BM25Index(stats))
+        return shared
+
+    def test_holder_lasts_until_the_last_release(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as root:
+            shared = self.shared_indexes(root)
+            key = shared.store.key_for(self.URL)
+            self.assertIsNone(shared.attach("https://arxiv.org/pdf/2401.00001v1"))
+            first, second = shared.attach(self.URL), shared.attach(self.URL)
+            self.assertEqual(list(first.documents), ["Attention is all you need.", "We propose the Transformer."])
+            self.assertEqual(shared.live_holders(key), [os.getpid()])
+            shared.release(first)
+            self.assertEqual(shared.live_holders(key), [os.getpid()])
+            shared.release(second)
+            shared.release(second)  # extra releases are ignored
+            self.assertEqual(shared.live_holders(key), [])
+            stats = shared.stats()
+            self.assertEqual((stats["attached"], stats["released"], stats["held"]), (2, 1, 0))
+            with shared._eviction_guard(key) as evictable:
+                self.assertTrue(evictable)
+
+    def test_disabled_cache_releases_the_holder(self):
+        import tempfile
+        from tools.cache import LRUCache
+        with tempfile.TemporaryDirectory() as root:
+            shared = self.shared_indexes(root)
+            cache = LRUCache(max_entries=0, on_remove=lambda paper_id, rag: shared.release(rag))
+            cache.put("1706.03762v7", shared.attach(self.URL))
+            self.assertEqual(shared.live_holders(shared.store.key_for(self.URL)), [])
+            self.assertEqual(shared.stats()["held"], 0)
+
+
+class ContextPackerTest(unittest.TestCase):
+    """Selection by score within the budget, then merging of neighbouring chunks."""
+
+    def test_merges_neighbours_and_removes_overlap(self):
+        from tools.context import ContextPacker
+        documents = ["Title and abstract.", "The model uses attention. It is fast", "It is fast and accurate.",
+                     "Unrelated appendix."]
+        spans = ContextPacker(token_budget=1000).pack_chunks(documents, [2, 1, 0], [3.0, 2.0, 0.0])
+        self.assertEqual([s.chunk_ids for s in spans], [[0, 1, 2]])
+        self.assertEqual(spans[0].text,
+                         "Title and abstract.\nThe model uses attention. It is fast and accurate.")
+        self.assertEqual(spans[0].score, 3.0)
+
+    def test_budget_keeps_best_and_pinned_chunks(self):
+        from tools.context import ContextPacker
+        packer = ContextPacker(token_budget=16)  # two of the 8-token chunks
+        candidates = [("p1", 0, 0.0, "header " * 4), ("p1", 5, 1.0, "weak " * 10),
+                      ("p2", 3, 2.0, "strong " * 4), ("p2", 4, 1.5, "strong " * 4)]
+        chosen = packer.select(candidates, pinned=[("p1", 0)])
+        self.assertEqual([(c[0], c[1]) for c in chosen], [("p1", 0), ("p2", 3)])
+        spans = packer.merge(chosen)
+        self.assertEqual([(s.group, s.chunk_ids) for s in spans], [("p1", [0]), ("p2", [3])])
+
+    def test_duplicate_text_is_sent_once(self):
+        from tools.context import ContextPacker
+        spans = ContextPacker().pack([("a", 1, 2.0, "same text"), ("b", 7, 1.0, "same  text")])
+        self.assertEqual([(s.group, s.chunk_ids) for s in spans], [("a", [1])])
+
+
+class SearchResultCacheTest(unittest.TestCase):
+    """A cached larger search answers smaller ones; a cut-off one does not answer larger ones."""
+
+    @staticmethod
+    def papers(n):
+        return {f"http://arxiv.org/abs/2401.{i:05d}v1": {"title": f"paper {i}"} for i in range(n)}
+
+    def test_superset_answers_smaller_counts(self):
+        from tools.arxivetool import SearchResultCache, parse_search
+        cache = SearchResultCache(max_entries=8)
+        cache.put(parse_search("transformers", count=10), self.papers(10), answers_up_to=10)
+        five = cache.get(parse_search("transformers", count=5))
+        self.assertEqual(list(five), list(self.papers(10))[:5])
+        self.assertIsNone(cache.get(parse_search("transformers", count=20)))
+        self.assertIsNone(cache.get(parse_search("transformers", count=5, year_from=2020)))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_exhausted_search_answers_any_count(self):
+        from tools.arxivetool import SearchResultCache, parse_search
+        cache = SearchResultCache(max_entries=8)
+        cache.put(parse_search("rare topic", count=50), self.papers(3), answers_up_to=None)
+        self.assertEqual(len(cache.get(parse_search("rare topic", count=500))), 3)
+
+    def test_smaller_result_never_replaces_a_superset(self):
+        from tools.arxivetool import SearchResultCache, parse_search
+        cache = SearchResultCache(max_entries=8)
+        cache.put(parse_search("transformers", count=10), self.papers(10), answers_up_to=10)
+        cache.put(parse_search("transformers", count=3), self.papers(3), answers_up_to=3)
+        self.assertEqual(len(cache.get(parse_search("transformers", count=10))), 10)
+
+    def test_zero_entries_disables_the_cache(self):
+        from tools.arxivetool import SearchResultCache, parse_search
+        cache = SearchResultCache(max_entries=0)
+        spec = parse_search("transformers", count=10)
+        cache.put(spec, self.papers(10), answers_up_to=None)
+        self.assertIsNone(cache.get(spec))
+
+
+class ArxivQueryTest(unittest.TestCase):
+    """Filters parsed out of the query become arXiv clauses and never leak into the title phrase."""
+
+    def test_filter_only_queries(self):
+        from tools.arxivetool import build_arxiv_query, parse_search
+        self.assertEqual(build_arxiv_query(parse_search("author: Hinton")), 'au:"Hinton"')
+        self.assertEqual(build_arxiv_query(parse_search("category: cs.LG")), 'cat:cs.LG')
+        self.assertEqual(
+            build_arxiv_query(parse_search("since 2020 until 2022")),
+            'submittedDate:[202001010000 TO 202212312359]',
+        )
+
+    def test_phrase_and_filters(self):
+        from tools.arxivetool import build_arxiv_query, parse_search
+        self.assertEqual(build_arxiv_query(parse_search("diffusion author: Hinton")), 'ti:"diffusion" AND au:"Hinton"')
+        self.assertEqual(build_arxiv_query(parse_search("transformers", author="Vaswani")), 'ti:"transformers" AND au:"Vaswani"')
+
+
+class RouteQueryTest(unittest.TestCase):
+    """Deterministic /ask routing: which queries skip the LLM, and with which tool arguments."""
+
+    DIRECT = [
+        ("attention is all you need", {"query": "attention is all you need", "count": 100}),
+        ("find 5 papers about transformers", {"query": "transformers", "count": 5}),
+        ("list 20 papers on diffusion models", {"query": "diffusion models", "count": 20}),
+        ("top 10 papers on graph neural networks", {"query": "graph neural networks", "count": 10}),
+        ("find 5000 papers on mixture of experts", {"query": "mixture of experts", "count": 500}),
+        ("papers by Yann LeCun", {"query": "", "count": 100, "author": "Yann LeCun"}),
+        ("author: Hinton, capsule networks", {"query": "capsule networks", "count": 100, "author": "Hinton"}),
+        ("vision transformers since 2020", {"query": "vision transformers", "count": 100, "year_from": 2020}),
+        ("speech recognition from 2015 to 2018",
+         {"query": "speech recognition", "count": 100, "year_from": 2015, "year_to": 2018}),
+        ("papers on contrastive learning in cat cs.CV",
+         {"query": "contrastive learning", "count": 100, "category": "cs.cv"}),
+        ("category: cs.LG", {"query": "", "count": 100, "category": "cs.lg"}),
+        ("GPT-4 technical report", {"query": "GPT-4 technical report", "count": 100}),
+        ("ResNet-50 pruning", {"query": "ResNet-50 pruning", "count": 100}),
+    ]
+
+    # Questions, boolean logic, rankings and empty lead-ins are left to the LLM.
+    TO_LLM = [
+        "",
+        "papers",
+        "what is attention?",
+        "mixture of experts and routing",
+        "transformers not vision",
+        "latest papers on diffusion",
+        "most influential recent work on reinforcement learning",
+        "papers similar to BERT",
+        "one two three four five six seven eight nine",
+        # Leftovers the local parser cannot turn into a title phrase.
+        "papers in cat cs.CV about detection",
+        "LLM agents in 2023",
+        "diffusion models 2021-2023",
+        "cs.LG papers on transformers",
+        "nlp papers",
+        "quantum computing, please",
+        "find a paper",
+        "deep learning for",
+        "on the of",
+    ]
+
+    def test_direct_routes(self):
+        from tools.getpapers import route_query
+        for query, expected in self.DIRECT:
+            with self.subTest(query=query):
+                self.assertEqual(route_query(query, default_count=100), expected)
+
+    def test_relative_years(self):
+        from datetime import datetime
+        from tools.getpapers import route_query
+        args = route_query("graph neural networks last 3 years")
+        self.assertEqual(args["year_from"], datetime.utcnow().year - 3)
+        self.assertEqual(args["query"], "graph neural networks")
+
+    def test_ambiguous_queries_fall_back_to_llm(self):
+        from tools.getpapers import route_query
+        for query in self.TO_LLM:
+            with self.subTest(query=query):
+                self.assertIsNone(route_query(query, default_count=100))
+
+
+class ArxivClientTest(unittest.TestCase):
+    """Requests are spaced by priority, retried on 429/5xx and revalidated instead of downloaded twice."""
+
+    def test_token_bucket_bursts_then_serves_by_priority(self):
+        import threading
+        from tools.arxivclient import BACKGROUND, INTERACTIVE, TokenBucket
+        bucket = TokenBucket(rate=20, burst=2)
+        self.assertLess(bucket.acquire() + bucket.acquire(), 0.01)  # the burst is not throttled
+        served = []
+
+        def take(name, level):
+            bucket.acquire(level)
+            served.append(name)
+
+        threads = [threading.Thread(target=take, args=("warm-up", BACKGROUND))]
+        threads[0].start()
+        time.sleep(0.01)  # the warm-up queues first
+        threads += [threading.Thread(target=take, args=(f"user {i}", INTERACTIVE)) for i in range(2)]
+        for thread in threads[1:]:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(served, ["user 0", "user 1", "warm-up"])
+        self.assertEqual(TokenBucket(rate=0).acquire(), 0.0)
+
+    def test_retries_honour_retry_after(self):
+        import io
+        from unittest import mock
+        import requests
+        from tools.arxivclient import ArxivSession, TokenBucket
+
+        def response(status, headers=None):
+            r = requests.Response()
+            r.status_code, r.headers = status, requests.structures.CaseInsensitiveDict(headers or {})
+            r.raw = io.BytesIO(b"")
+            return r
+
+        session = ArxivSession(TokenBucket(0), TokenBucket(0), max_retries=2, backoff=0)
+        replies = [response(429, {"Retry-After": "0"}), response(503), response(200)]
+        with mock.patch.object(requests.Session, "request", side_effect=replies) as request:
+            self.assertEqual(session.get("https://export.arxiv.org/api/query").status_code, 200)
+        self.assertEqual((request.call_count, session.stats["requests"], session.stats["retries"]), (3, 3, 2))
+
+    def test_cached_download_is_revalidated(self):
+        from bench.fakes import FakeArxiv
+        from tools.arxivclient import ArxivSession, TokenBucket
+        session = ArxivSession(TokenBucket(0), TokenBucket(0), body_cache_bytes=1024 * 1024)
+        with FakeArxiv() as fake:
+            url = fake.pdf_url("2401.00001")
+            body = session.download(url)
+            self.assertTrue(body.startswith(b"%PDF"))
+            self.assertEqual(session.download(url), body)
+            self.assertEqual((fake.requests["pdf"], session.stats["not_modified"]), (2, 1))
+
+
+class AskCursorTest(unittest.TestCase):
+    """/ask cursors are signed and their search arguments and bounds validated."""
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi import HTTPException
+        import main
+        cls.main, cls.HTTPException = main, HTTPException
+
+    def test_round_trip(self):
+        cursor = self.main.encode_cursor({"query": "transformers", "count": 50}, "direct", 10, 10)
+        self.assertEqual(self.main.decode_cursor(cursor),
+                         {"args": {"query": "transformers", "count": 50}, "route": "direct", "offset": 10, "limit": 10})
+
+    def test_rejects_tampered_and_out_of_range_cursors(self):
+        import base64
+        import json
+        valid = self.main.encode_cursor({"query": "transformers"}, "direct", 10, 10)
+        payload, signature = valid.split(".")
+        unsigned_state = {"args": {"query": "transformers"}, "route": "direct", "offset": 0, "limit": 10}
+        forged = base64.urlsafe_b64encode(json.dumps(unsigned_state).encode()).decode() + "." + signature
+        cursors = {
+            "unsigned": payload,
+            "forged": forged,
+            "unknown argument": self.main.encode_cursor({"query": "x", "evil": 1}, "direct", 0, 10),
+            "offset past the search": self.main.encode_cursor({"query": "x", "count": 20}, "direct", 21, 10),
+            "huge limit": self.main.encode_cursor({"query": "x"}, "direct", 0, 10 ** 6),
+            "garbage": "not a cursor",
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(name), self.assertRaises(self.HTTPException):
+                self.main.decode_cursor(cursor)
+
+
+class TfidfRAGTest(unittest.TestCase):
+    """The sparse TF-IDF retriever ranks by cosine similarity, one query or many at a time."""
+
+    DOCUMENTS = [
+        "The Eiffel Tower is a wrought-iron lattice tower on the Champ de Mars in Paris, France.",
+        "The Great Wall of China is a series of fortifications made of stone, brick and wood.",
+        "The Colosseum is an oval amphitheatre in the centre of the city of Rome, Italy.",
+        "The Statue of Liberty is a colossal neoclassical sculpture in New York City.",
+    ]
+
+    def test_scores_are_cosine_similarities(self):
+        import numpy as np
+        from rag import FastTfidfRAG
+        rag = FastTfidfRAG()
+        with self.assertRaises(Exception):
+            rag.retrieve("tower")
+        rag.build_index(self.DOCUMENTS)
+        queries = ["towers in Paris", "ancient amphitheatre in Rome", "wall of China"]
+        docs = rag.index.toarray()
+        expected = rag.vectorizer.transform(queries).toarray() @ docs.T
+        np.testing.assert_allclose(rag.score_batch(queries), expected, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(np.linalg.norm(docs, axis=1), 1, rtol=1e-5)
+        self.assertEqual(rag.retrieve_batch(queries, k=1), [[self.DOCUMENTS[i]] for i in (0, 2, 1)])
+        self.assertEqual(rag.retrieve("towers in Paris", k=2)[0], self.DOCUMENTS[0])
+
+
+def okapi_scores(corpus, query, k1=1.5, b=0.75, epsilon=0.25):
+    """Reference scores, written out as ``rank_bm25.BM25Okapi`` computes them."""
+    import math
+    from collections import Counter
+    doc_freqs = [Counter(doc) for doc in corpus]
+    avgdl = sum(len(doc) for doc in corpus) / len(corpus)
+    nd = Counter(term for freqs in doc_freqs for term in freqs)
+    idf = {term: math.log(len(corpus) - n + 0.5) - math.log(n + 0.5) for term, n in nd.items()}
+    eps = epsilon * sum(idf.values()) / len(idf)
+    idf = {term: eps if value < 0 else value for term, value in idf.items()}
+    scores = [0.0] * len(corpus)
+    for q in query:
+        for i, (doc, freqs) in enumerate(zip(corpus, doc_freqs)):
+            tf = freqs.get(q, 0)
+            scores[i] += idf.get(q, 0) * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl)))
+    return scores
+
+
+class BM25Test(unittest.TestCase):
+    """The vectorized engine scores exactly like the ``rank_bm25`` implementation it replaced."""
+
+    CORPUS = [
+        "attention is all you need we propose the transformer".split(),
+        "the transformer uses attention attention and attention".split(),
+        "convolutional networks for image recognition".split(),
+        "deep residual learning for image recognition with residual networks".split(),
+        "the the the".split(),
+    ]
+    QUERIES = [
+        ["attention"],
+        ["transformer", "attention"],
+        ["image", "recognition", "networks"],
+        ["the"],  # negative IDF, floored at epsilon * mean IDF
+        ["residual", "residual"],  # repeated query terms count twice
+        ["unknown"],
+        [],
+    ]
+
+    def test_scores_match_okapi(self):
+        import numpy as np
+        from tools.bm25 import BM25Index
+        for params in ({}, {"k1": 1.2, "b": 0.5, "epsilon": 0.1}):
+            index = BM25Index.from_tokenized(self.CORPUS, **params)
+            batch = index.get_scores_batch(self.QUERIES)
+            for query, scores in zip(self.QUERIES, batch):
+                with self.subTest(query=query, **params):
+                    expected = okapi_scores(self.CORPUS, query, **params)
+                    np.testing.assert_allclose(scores, expected, rtol=1e-5, atol=1e-6)
+                    np.testing.assert_allclose(index.get_scores(query), expected, rtol=1e-5, atol=1e-6)
+
+    def test_top_k_is_best_first(self):
+        import numpy as np
+        from tools.bm25 import BM25Index
+        index = BM25Index.from_tokenized(self.CORPUS)
+        for query in self.QUERIES[:5]:
+            expected = np.asarray(okapi_scores(self.CORPUS, query))
+            top, scores = index.top_k(query, k=3)
+            with self.subTest(query=query):
+                np.testing.assert_allclose(scores, np.sort(expected)[::-1][:3], rtol=1e-5, atol=1e-6)
+                np.testing.assert_allclose(expected[top], scores, rtol=1e-5, atol=1e-6)
+
+    def test_extended_statistics_match_a_full_build(self):
+        import numpy as np
+        from tools.analyzer import TermDictionary
+        from tools.bm25 import BM25Index, extend_term_stats, term_stats_from_ids
+        dictionary, stats = TermDictionary(), None
+        for page in (self.CORPUS[:2], self.CORPUS[2:]):
+            stats = extend_term_stats(stats, [dictionary.intern(doc) for doc in page], dictionary.terms)
+        full = term_stats_from_ids([dictionary.intern(doc) for doc in self.CORPUS], dictionary.terms)
+        for name in ("indptr", "indices", "data", "doc_len", "df"):
+            np.testing.assert_array_equal(stats[name], full[name])
+        np.testing.assert_allclose(BM25Index(stats).get_scores(["image"]), okapi_scores(self.CORPUS, ["image"]),
+                                   rtol=1e-5, atol=1e-6)
+
+
+class CorpusIndexTest(unittest.TestCase):
+    """Papers removed from the corpus take their terms with them."""
+
+    def test_removal_compacts_the_vocabulary(self):
+        from tools.corpus import CorpusIndex
+        corpus = CorpusIndex(max_papers=2)
+        for i in range(20):
+            corpus.add_paper(f"p{i}", [f"shared attention term{i}a term{i}b", f"shared loss term{i}c"])
+        # 9 terms are live (3 shared, 3 per kept paper); compaction bounds the unused ones to as many.
+        self.assertLessEqual(len(corpus.terms), 2 * 9)
+        self.assertGreater(corpus.compactions, 0)
+        hits = corpus.search("attention term19a", k=1)
+        self.assertEqual((hits[0]["paper_id"], hits[0]["chunk_id"]), ("p19", 0))
+        self.assertIsNone(corpus.terms.get("term3a"))
+
+    def test_reuses_the_paper_index_statistics(self):
+        from tools.analyzer import TermDictionary, default_analyzer
+        from tools.bm25 import term_stats_from_ids
+        from tools.corpus import CorpusIndex
+        chunks = ["graph neural networks for molecules", "message passing layers", "molecular property prediction"]
+        dictionary = TermDictionary()
+        stats = term_stats_from_ids(default_analyzer().encode_batch(chunks, dictionary), dictionary.terms)
+        tokenized, reused = CorpusIndex(), CorpusIndex()
+        for corpus in (tokenized, reused):
+            corpus.add_paper("other", ["diffusion models for images", "message queues"])
+        tokenized.add_paper("paper", chunks)
+        reused.add_paper("paper", chunks, stats=stats)
+        for query in ("message passing", "molecules property", "images"):
+            with self.subTest(query=query):
+                self.assertEqual(reused.search(query, k=3), tokenized.search(query, k=3))
+
+
+class ChatSessionTest(unittest.TestCase):
+    """History stays within its token budget, keeping recent turns whole and summarizing older ones."""
+
+    @staticmethod
+    def fill(session, turns):
+        for i in range(turns):
+            session.add("USER_QUERY" if i % 2 == 0 else "BOT_RESPONSE", f"turn {i} " + "word " * 20)
+
+    def test_old_turns_are_summarized_within_the_budget(self):
+        from tools.chatmemory import ChatSession
+        session = ChatSession(token_budget=80, keep_recent=2, summary_chars=20)
+        self.fill(session, 8)
+        history = session.history()
+        self.assertLessEqual(session.tokens(), 80)
+        self.assertEqual([list(entry) for entry in history], [["EARLIER_SUMMARY"], ["USER_QUERY"], ["BOT_RESPONSE"]])
+        self.assertTrue(history[1]["USER_QUERY"].startswith("turn 6 "))
+        summary = history[0]["EARLIER_SUMMARY"].split(" | ")
+        # The oldest summary lines were dropped to fit; the rest are truncated snippets.
+        self.assertEqual(summary[0], "Assistant: turn 3 word word wor...")
+        self.assertEqual(summary[-1], "Assistant: turn 5 word word wor...")
+
+    def test_recent_turns_are_kept_even_over_budget(self):
+        from tools.chatmemory import ChatSession
+        session = ChatSession(token_budget=10, keep_recent=2)
+        self.fill(session, 4)
+        self.assertEqual([list(entry) for entry in session.history()], [["USER_QUERY"], ["BOT_RESPONSE"]])
+
+    def test_sessions_are_separate(self):
+        from tools.chatmemory import SessionStore
+        store = SessionStore(max_sessions=2)
+        store.get("a").add("USER_QUERY", "about transformers")
+        self.assertIs(store.get("a"), store.get("a"))
+        self.assertEqual(store.get("b").history(), [])
+        self.assertIs(store.get(None), store.get("default"))  # the former global history
+        self.assertEqual(store.get("a").history(), [])  # least recently used, evicted by "default"
+        store.drop("a")
+        self.assertEqual(store.stats()["entries"], 1)
+
+
+class AnswerCacheTest(unittest.TestCase):
+    """Cached answers are only reused for the same paper, question, context and chat history."""
+
+    def test_key_covers_the_chat_history(self):
+        from tools.answercache import AnswerCache
+        base = AnswerCache.key("2401.00001", "Who are the authors?", [0, 3])
+        self.assertEqual(AnswerCache.key("2401.00001", "  who are the AUTHORS ", [0, 3], []), base)
+        self.assertNotEqual(AnswerCache.key("2401.00001", "who are the authors", [0, 4]), base)
+        self.assertNotEqual(AnswerCache.key("2401.00002", "who are the authors", [0, 3]), base)
+        history = [{"USER_QUERY": "summarize the BERT paper"}]
+        self.assertNotEqual(AnswerCache.key("2401.00001", "who are the authors", [0, 3], history), base)
+        self.assertEqual(AnswerCache.key("2401.00001", "who are the authors", [0, 3], list(history)),
+                         AnswerCache.key("2401.00001", "who are the authors", [0, 3], history))
+
+    def test_follow_up_is_not_served_to_another_session(self):
+        from fastapi.testclient import TestClient
+        from bench.fakes import FakeChatModel, install_fake_llm
+        from tools.ragtool import ProgressiveRAG
+        import main
+        if main.ANSWERS is None:
+            self.skipTest("answer cache disabled by ANSWER_CACHE_ENTRIES")
+        install_fake_llm(FakeChatModel(latency=0))
+        chunks = ["Attention Is All You Need. Ashish Vaswani, Noam Shazeer.", "The Transformer uses attention only."]
+        pages = lambda url, cancel_event=None: iter([("page one", chunks), (None, [])])
+        paper_id = "test-answer-cache"
+        main.RAGDICT.put(paper_id, ProgressiveRAG("https://arxiv.org/pdf/0000.00000", store=None, page_source=pages))
+        client = TestClient(main.app)
+
+        def ask(question, session):
+            body = {"query": question, "paperId": paper_id, "sessionId": session}
+            return client.post("/question", json=body).json()["cached"]
+
+        try:
+            self.assertFalse(ask("what is the main idea?", "session-a"))
+            self.assertFalse(ask("who are the authors?", "session-a"))  # answered with session a's history
+            self.assertFalse(ask("who are the authors?", "session-b"))
+            self.assertTrue(ask("who are the authors?", "session-c"))  # same empty history as session b
+            batch = client.post("/question/batch", json={"questions": ["who are the authors?"], "paperId": paper_id})
+            self.assertTrue(batch.json()["answers"][0]["cached"])
+        finally:
+            main.RAGDICT.pop(paper_id)
+
+
+class MetricsTest(unittest.TestCase):
+    """Stage spans reach the histograms and the enclosing request; ``/metrics`` renders them."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        from tools.metrics import Histogram
+        hist = Histogram("test_seconds", "Test.", label="stage", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            hist.observe('a"b', value)
+        self.assertEqual(hist.render(), [
+            "# HELP test_seconds Test.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{stage="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{stage="a\\"b",le="1.0"} 2',
+            'test_seconds_bucket{stage="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{stage="a\\"b"} 5.55',
+            'test_seconds_count{stage="a\\"b"} 3',
+        ])
+        self.assertEqual(hist.summary(), {'a"b': {"count": 3, "sum": 5.55}})
+
+    def test_spans_follow_the_context_into_threads(self):
+        import asyncio
+        from tools.metrics import STAGE_SECONDS, collect_spans, server_timing, span
+
+        def work():
+            with span("test_thread"):
+                pass
+
+        async def request():
+            with collect_spans() as spans:
+                with self.assertRaises(ValueError), span("test_failing"):
+                    raise ValueError
+                await asyncio.to_thread(work)
+                await asyncio.to_thread(work)
+            return spans
+
+        before = STAGE_SECONDS.summary().get("test_thread", {"count": 0})["count"]
+        spans = asyncio.run(request())
+        self.assertEqual([stage for stage, _ in spans], ["test_failing", "test_thread", "test_thread"])
+        self.assertEqual(STAGE_SECONDS.summary()["test_thread"]["count"], before + 2)
+        self.assertEqual(server_timing([("a b", 0.001), ("c", 0.002), ("a b", 0.002)]), "a_b;dur=3.0, c;dur=2.0")
+
+    def test_metrics_endpoint(self):
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app)
+        client.get("/cache/stats")
+        client.get("/no/such/page")
+        text = client.get("/metrics").text
+        self.assertIn('arxivai_request_seconds_count{path="/cache/stats"}', text)
+        self.assertIn('arxivai_request_seconds_count{path="unmatched"}', text)
+        self.assertNotIn("/no/such/page", text)
+        for family in ("arxivai_cache_entries", "arxivai_indexes", "arxivai_process_memory_bytes"):
+            self.assertIn(f"# TYPE {family} gauge", text)
+
+
+class StreamQuestionTest(unittest.TestCase):
+    """``/question/stream`` sends the answer token by token, then a ``done`` (or ``error``) event."""
+
+    PAPER_ID = "test-stream"
+
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        from tools.ragtool import ProgressiveRAG
+        import main
+        chunks = ["Attention Is All You Need. Ashish Vaswani, Noam Shazeer.", "The Transformer uses attention only."]
+        pages = lambda url, cancel_event=None: iter([("page one", chunks), (None, [])])
+        main.RAGDICT.put(self.PAPER_ID, ProgressiveRAG("https://arxiv.org/pdf/0000.00000", store=None, page_source=pages))
+        self.main, self.client = main, TestClient(main.app)
+
+    def tearDown(self):
+        from bench.fakes import FakeChatModel, install_fake_llm
+        self.main.RAGDICT.pop(self.PAPER_ID)
+        install_fake_llm(FakeChatModel(latency=0))
+
+    def events(self, session):
+        body = {"query": "what is the main idea?", "paperId": self.PAPER_ID, "sessionId": session, "noCache": True}
+        with self.client.stream("POST", "/question/stream", json=body) as response:
+            self.assertEqual(response.headers["content-type"].split(";")[0], "text/event-stream")
+            text = "".join(response.iter_text())
+        events = []
+        for message in text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in message.splitlines())
+            events.append((fields.get("event", "message"), json.loads(fields["data"])))
+        return events
+
+    def test_tokens_then_done(self):
+        from bench.fakes import FakeChatModel, install_fake_llm
+        install_fake_llm(FakeChatModel(latency=0, answer_tokens=5))
+        events = self.events("stream-a")
+        self.assertEqual([name for name, _ in events], ["message"] * 5 + ["done"])
+        done = events[-1][1]
+        self.assertEqual(done["response"], "".join(data["token"] for _, data in events[:-1]))
+        self.assertEqual((done["partial"], done["cached"]), (False, False))
+        self.assertEqual(self.main.SESSIONS.get("stream-a").history()[-1], {"BOT_RESPONSE": done["response"]})
+
+    def test_failure_is_reported_as_an_error_event(self):
+        from bench.fakes import FakeChatModel, install_fake_llm
+
+        class FailingModel(FakeChatModel):
+            async def astream(self, messages, *args, **kwargs):
+                async for chunk in super().astream(messages, *args, **kwargs):
+                    yield chunk
+                    raise RuntimeError("rate limited")
+
+        install_fake_llm(FailingModel(latency=0))
+        events = self.events("stream-b")
+        self.assertEqual([name for name, _ in events], ["message", "error"])
+        self.assertEqual(events[-1][1], {"error": "rate limited"})
+        self.assertEqual(list(self.main.SESSIONS.get("stream-b").history()[-1]), ["USER_QUERY"])
+
+
+class BatchQuestionTest(unittest.TestCase):
+    """``/question/batch`` answers in order, bounds LLM concurrency and reports failures per question."""
+
+    PAPER_ID = "test-batch"
+    CHUNKS = ["Attention Is All You Need. Ashish Vaswani, Noam Shazeer.", "The Transformer uses attention only.",
+              "It reaches 28.4 BLEU on WMT 2014 English-German."]
+
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        from tools.ragtool import ProgressiveRAG
+        import main
+        pages = lambda url, cancel_event=None: iter([("page one", self.CHUNKS), (None, [])])
+        main.RAGDICT.put(self.PAPER_ID, ProgressiveRAG("https://arxiv.org/pdf/0000.00000", store=None, page_source=pages))
+        self.main, self.client = main, TestClient(main.app)
+
+    def tearDown(self):
+        from bench.fakes import FakeChatModel, install_fake_llm
+        self.main.RAGDICT.pop(self.PAPER_ID)
+        install_fake_llm(FakeChatModel(latency=0))
+
+    def ask(self, questions):
+        body = {"questions": questions, "paperId": self.PAPER_ID, "noCache": True}
+        return self.client.post("/question/batch", json=body)
+
+    def test_answers_in_order_with_bounded_concurrency(self):
+        import asyncio
+        from unittest import mock
+        from bench.fakes import FakeChatModel, install_fake_llm
+        running, peak = 0, 0
+
+        class CountingModel(FakeChatModel):
+            async def ainvoke(self, messages, *args, **kwargs):
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+                if "Question: what BLEU score?" in str(messages[-1]):
+                    raise RuntimeError("rate limited")
+                return await super().ainvoke(messages, *args, **kwargs)
+
+        install_fake_llm(CountingModel(latency=0))
+        questions = [f"question {i} about attention" for i in range(5)] + ["what BLEU score?"]
+        with mock.patch.object(self.main, "BATCH_LLM_CONCURRENCY", 2):
+            answers = self.ask(questions).json()["answers"]
+        self.assertEqual([a["question"] for a in answers], questions)
+        self.assertEqual(peak, 2)
+        self.assertTrue(all(a["response"] and 0 in a["chunkIds"] for a in answers[:5]))
+        self.assertEqual((answers[5]["response"], answers[5]["error"]), (None, "rate limited"))
+        self.assertIn(2, answers[5]["chunkIds"])
+
+    def test_batch_limits(self):
+        from unittest import mock
+        self.assertEqual(self.ask([]).json(), {"answers": [], "partial": False, "coverage": None})
+        with mock.patch.object(self.main, "BATCH_MAX_QUESTIONS", 2):
+            self.assertEqual(self.ask(["a", "b", "c"]).status_code, 400)
+
+
+class AnalyzerTest(unittest.TestCase):
+    """Text -> term pipeline, interned ids and their remapping across processes."""
+
+    def test_normalizes_and_stems(self):
+        from tools.analyzer import Analyzer
+        text = "The ﬁne-tuned Trans-\nformers use \\mathbf{x} and \\alpha while training embeddings"
+        self.assertEqual(Analyzer()(text), ["fine", "tuned", "transformer", "use", "alpha", "train", "embed"])
+        self.assertEqual(Analyzer(stem=False)("The transformers are training"), ["transformers", "training"])
+        self.assertEqual(Analyzer(stop_words=False, stem=False, latex=False)("The \\alpha of résumé"),
+                         ["the", "alpha", "of", "resume"])
+
+    def test_signature_follows_the_configuration(self):
+        from tools.analyzer import Analyzer
+        self.assertEqual(Analyzer().signature, Analyzer().signature)
+        self.assertNotEqual(Analyzer().signature, Analyzer(stem=False).signature)
+
+    def test_dictionary_interns_first_seen_first_numbered(self):
+        from tools.analyzer import TermDictionary
+        dictionary = TermDictionary()
+        self.assertEqual(dictionary.intern(["b", "a", "b"]).tolist(), [0, 1, 0])
+        ids = dictionary.intern(["a", "c"])
+        self.assertEqual((ids.tolist(), ids.dtype.name, dictionary.terms), ([1, 2], "int32", ["b", "a", "c"]))
+        self.assertIsNone(dictionary.get("d"))
+
+    def test_remap_matches_encoding_in_process(self):
+        from tools.analyzer import Analyzer, TermDictionary, TermRemap
+        analyzer = Analyzer()
+        pages = [["attention heads", "graph networks"], ["attention is all", "diffusion of graphs"]]
+        worker, parent = TermDictionary(), TermDictionary()
+        parent.intern(["unrelated", "attention"])
+        remap, direct = TermRemap(parent), TermDictionary()
+        direct.intern(["unrelated", "attention"])
+        for chunks in pages:
+            seen = len(worker)
+            received = remap(analyzer.encode_batch(chunks, worker), worker.terms[seen:])
+            expected = analyzer.encode_batch(chunks, direct)
+            self.assertEqual([ids.tolist() for ids in received], [ids.tolist() for ids in expected])
+        self.assertEqual(parent.terms, direct.terms)
+
+    def test_switching_the_analyzer_forces_a_re_encode(self):
+        import tempfile
+        from tools.analyzer import Analyzer, TermDictionary
+        from tools.bm25 import term_stats_from_ids
+        from tools.paperstore import PaperStore
+        text, chunks = "Transformers are training.", ["Transformers are training."]
+        url = "https://arxiv.org/pdf/1706.03762v7"
+
+        def save(store, analyzer):
+            dictionary = TermDictionary()
+            store.save(url, text, chunks, term_stats_from_ids(analyzer.encode_batch(chunks, dictionary),
+                                                              dictionary.terms))
+
+        with tempfile.TemporaryDirectory() as root:
+            stemmed, plain = Analyzer(), Analyzer(stem=False)
+            stemmed_store = PaperStore(root, analyzer=stemmed.signature)
+            plain_store = PaperStore(root, analyzer=plain.signature)
+            save(stemmed_store, stemmed)
+            self.assertIsNone(plain_store.load(url))  # the stemmed term ids are not reused
+            save(plain_store, plain)
+            self.assertEqual(stemmed_store.load(url).stats["vocab"], ["transformer", "train"])
+            self.assertEqual(plain_store.load(url).stats["vocab"], ["transformers", "training"])
+
+
+class WarmupSchedulerTest(unittest.TestCase):
+    """Superseded and cancelled warm-ups never run, and finished sessions are forgotten."""
+
+    def run_scheduler(self, schedule):
+        import threading
+        from tools.prefetch import WarmupScheduler
+        release, built = threading.Event(), []
+
+        def build(paper_id, url):
+            release.wait(5)
+            built.append(paper_id)
+
+        scheduler = WarmupScheduler(build=build, is_ready=lambda paper_id: False, max_downloads=1)
+        schedule(scheduler)
+        release.set()
+        deadline = time.monotonic() + 5
+        while scheduler.active_groups() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return scheduler, built
+
+    def test_superseded_and_cancelled_warmups_do_not_run(self):
+        urls = [f"https://arxiv.org/pdf/2401.0000{i}" for i in range(6)]
+
+        def schedule(scheduler):
+            scheduler.schedule(urls[:1], group="blocker", top_n=1)  # occupies the only worker
+            time.sleep(0.05)
+            scheduler.schedule(urls[1:3], group="a", top_n=2)
+            scheduler.schedule(urls[3:4], group="a", top_n=1)  # supersedes 2401.00001 and 2401.00002
+            scheduler.schedule(urls[4:5], group="b", top_n=1)
+            scheduler.cancel("b")
+            scheduler.schedule(urls[5:], group="c", top_n=0)
+
+        scheduler, built = self.run_scheduler(schedule)
+        self.assertEqual(sorted(built), ["2401.00000", "2401.00003"])
+        self.assertEqual((scheduler.stats["completed"], scheduler.stats["cancelled"]), (2, 3))
+        self.assertEqual((scheduler.active_groups(), scheduler.pending()), (0, 0))
+
+    def test_forgotten_group_schedules_again(self):
+        urls = [f"https://arxiv.org/pdf/2401.0000{i}" for i in range(3)]
+
+        def schedule(scheduler):
+            scheduler.schedule(urls[:1], group="a", top_n=1)
+            time.sleep(0.05)
+            scheduler.schedule(urls[1:2], group="a", top_n=1)  # queued behind the first
+            scheduler.cancel("a")  # the group is forgotten
+            scheduler.schedule(urls[2:], group="a", top_n=1)
+
+        scheduler, built = self.run_scheduler(schedule)
+        self.assertEqual(sorted(built), ["2401.00000", "2401.00002"])
+        self.assertEqual(scheduler.active_groups(), 0)
+
+    def test_searches_without_session_do_not_supersede_each_other(self):
+        from unittest import mock
+        import main
+        urls = [f"https://arxiv.org/pdf/2401.0000{i}" for i in range(3)]
+
+        def schedule(scheduler):
+            with mock.patch.object(main, "WARMUP", scheduler):
+                scheduler.schedule(urls[:1], group="blocker", top_n=1)
+                time.sleep(0.05)
+                main.schedule_warmup(main.QueryRequest(query="a", prefetch=1), urls[1:2])
+                main.schedule_warmup(main.QueryRequest(query="b", prefetch=1), urls[2:])
+
+        scheduler, built = self.run_scheduler(schedule)
+        self.assertEqual(sorted(built), ["2401.00000", "2401.00001", "2401.00002"])
+        self.assertEqual(scheduler.stats["cancelled"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import functools
+import hashlib
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+# Common English function words; they carry no retrieval signal but make up
+# a large share of every chunk's postings.
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either et etc few for from further had
+has have having he her here hers herself him himself his how however i if in into is it its itself just
+may me might more most must my myself no nor not of off on once only or other our ours ourselves out over
+own same she should so some such than that the their theirs them themselves then there these they this
+those through thus to too under until up upon us very via was we were what when where which while who
+whom why will with within without would you your yours yourself yourselves
+""".split())
+
+# LaTeX commands that only format their argument (``\\mathbf{x}`` -> ``x``);
+# every other command keeps its name as a token (``\\alpha`` -> ``alpha``).
+LATEX_FORMAT_COMMANDS = frozenset("""
+begin end left right big bigg bigl bigr biggl biggr mathbf mathrm mathit mathcal mathbb mathsf mathtt
+mathfrak boldsymbol bm text textbf textit textrm texttt emph operatorname label ref eqref cite citep citet
+hat tilde bar vec dot ddot overline underline widehat widetilde displaystyle scriptstyle quad qquad
+""".split())
+
+LATEX_COMMAND_RE = re.compile(r'\\([A-Za-z]+)')
+# Words hyphenated across a line break by the PDF layout ("trans-\nformer").
+LINE_BREAK_HYPHEN_RE = re.compile(r'(\w)-\s*\n\s*(\w)')
+TOKEN_RE = re.compile(r'[^\W_]+')
+VOWEL_RE = re.compile(r'[aeiouy]')
+
+
+@functools.lru_cache(maxsize=100_000)
+def light_stem(word: str) -> str:
+    """
+    Conservative suffix stripper for English (plural, ``-ing``, ``-ed``).
+
+    Far lighter than Porter: it only merges the inflections that most often
+    split a term in papers ("transformers" / "transformer", "trained" / "training").
+    """
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies') and len(word) > 4:
+        word = word[:-3] + 'y'
+    elif word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    for suffix in ('ing', 'ed'):
+        stem = word[:-len(suffix)]
+        if word.endswith(suffix) and len(stem) >= 4 and VOWEL_RE.search(stem):
+            word = stem
+            # "embedd" -> "embed", "runn" -> "run"
+            if word[-1] == word[-2] and word[-1] not in 'aeioulsz':
+                word = word[:-1]
+            break
+    return word
+
+
+class TermDictionary:
+    """Interns terms to dense integer ids (first seen, first numbered)."""
+
+    def __init__(self):
+        self.term_ids = {}
+        self.terms = []
+
+    def __len__(self):
+        return len(self.terms)
+
+    def get(self, term: str):
+        return self.term_ids.get(term)
+
+    def intern(self, tokens: list) -> np.ndarray:
+        """Ids of ``tokens`` as an int32 array, adding unseen terms."""
+        term_ids, terms = self.term_ids, self.terms
+        ids = np.empty(len(tokens), dtype=np.int32)
+        for i, tok in enumerate(tokens):
+            tid = term_ids.get(tok)
+            if tid is None:
+                tid = term_ids[tok] = len(terms)
+                terms.append(tok)
+            ids[i] = tid
+        return ids
+
+
+class TermRemap:
+    """
+    Maps term ids of another process's ``TermDictionary`` onto ``dictionary``.
+
+    The other side sends each batch of ids together with the terms its
+    dictionary gained since the previous batch (see ``ExtractionPool``), so
+    only new terms are interned here and the ids themselves are translated
+    with one array lookup.
+    """
+
+    def __init__(self, dictionary: TermDictionary):
+        self.dictionary = dictionary
+        self.mapping = np.zeros(0, dtype=np.int32)
+
+    def __call__(self, term_ids: list, new_terms: list) -> list:
+        if new_terms:
+            self.mapping = np.concatenate([self.mapping, self.dictionary.intern(new_terms)])
+        return [self.mapping[ids] for ids in term_ids]
+
+
+class Analyzer:
+    """
+    Text -> terms pipeline shared by every retriever.
+
+    Steps: Unicode NFKC normalization (ligatures, full-width forms) with
+    accent folding, re-joining words hyphenated across line breaks, LaTeX
+    command handling, lowercasing, splitting on anything that is not a
+    letter or digit, stop word removal and optional light stemming.
+
+    Instances are callables returning a list of terms, so they can be passed
+    directly as a scikit-learn ``analyzer=``.
+
+    Args:
+        stop_words (bool): Drop ``STOP_WORDS``.
+        stem (bool): Apply ``light_stem`` to every term.
+        latex (bool): Drop formatting commands and keep the names of the others.
+        min_length (int): Shortest term kept (digits included).
+    """
+
+    def __init__(self, stop_words: bool = True, stem: bool = True, latex: bool = True, min_length: int = 2):
+        self.stop_words = stop_words
+        self.stem = stem
+        self.latex = latex
+        self.min_length = min_length
+
+    @property
+    def signature(self) -> str:
+        """Short stable id of the configuration, for cache and store keys."""
+        config = f"v1:{self.stop_words}:{self.stem}:{self.latex}:{self.min_length}"
+        return hashlib.sha1(config.encode('utf-8')).hexdigest()[:8]
+
+    def normalize(self, text: str) -> str:
+        if not text.isascii():
+            text = unicodedata.normalize('NFKC', text)
+            folded = unicodedata.normalize('NFKD', text)
+            text = ''.join(c for c in folded if not unicodedata.combining(c))
+        if '-' in text:
+            text = LINE_BREAK_HYPHEN_RE.sub(r'\1\2', text)
+        if self.latex and '\\' in text:
+            text = LATEX_COMMAND_RE.sub(
+                lambda m: ' ' if m.group(1) in LATEX_FORMAT_COMMANDS else f' {m.group(1)} ', text
+            )
+        return text.lower()
+
+    def __call__(self, text: str) -> list:
+        tokens = TOKEN_RE.findall(self.normalize(text))
+        min_length = self.min_length
+        if self.stop_words:
+            tokens = [t for t in tokens if len(t) >= min_length and t not in STOP_WORDS]
+        else:
+            tokens = [t for t in tokens if len(t) >= min_length]
+        if self.stem:
+            tokens = [light_stem(t) for t in tokens]
+        return tokens
+
+    def encode(self, text: str, dictionary: TermDictionary) -> np.ndarray:
+        """Term ids of ``text`` (int32), interning new terms into ``dictionary``."""
+        return dictionary.intern(self(text))
+
+    def encode_batch(self, texts: list, dictionary: TermDictionary) -> list:
+        return [self.encode(text, dictionary) for text in texts]
+
+
+_default_analyzer = None
+
+
+def default_analyzer() -> Analyzer:
+    """
+    Process-wide analyzer configured by ``ANALYZER_STOP_WORDS``, ``ANALYZER_STEM``
+    and ``ANALYZER_LATEX`` (``1``/``0``, all on by default).
+    """
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = Analyzer(
+            stop_words=os.getenv("ANALYZER_STOP_WORDS", "1") == "1",
+            stem=os.getenv("ANALYZER_STEM", "1") == "1",
+            latex=os.getenv("ANALYZER_LATEX", "1") == "1",
+        )
+    return _default_analyzer
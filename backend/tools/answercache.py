@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from tools.cache import LRUCache
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the question."""
+    return re.sub(r'[\s?!.]+$', '', " ".join(question.lower().split()))
+
+
+class AnswerCache:
+    """
+    Two-tier cache of LLM answers: an in-memory LRU plus an optional
+    directory of JSON files shared between workers and restarts.
+
+    Keys combine the paper id, the normalized question, a hash of the
+    retrieved chunk ids and a hash of the chat history in the prompt, so an
+    answer is only reused for the exact context it was generated from (a
+    follow-up answered in one session is never served to another).
+
+    Args:
+        max_entries (int): Size of the in-memory tier.
+        ttl (float): Seconds an answer stays valid.
+        disk_dir (str, optional): Directory of the on-disk tier; ``None`` disables it.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 86400, disk_dir: str | None = None):
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.memory = LRUCache(max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(paper_id: str, question: str, chunk_ids: list, history=None) -> str:
+        """``history`` is the chat history as put in the prompt; empty or ``None`` when there is none."""
+        context = hashlib.sha256(",".join(str(int(i)) for i in chunk_ids).encode('utf-8')).hexdigest()[:16]
+        turns = hashlib.sha256(json.dumps(history, sort_keys=True).encode('utf-8')).hexdigest()[:16] \
+            if history else ''
+        raw = json.dumps([paper_id, normalize_question(question), context, turns])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + '.json')
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.time() - entry["created"] <= self.ttl
+
+    def get(self, key: str) -> str | None:
+        entry = self.memory.get(key)
+        if not self._fresh(entry) and self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if self._fresh(entry):
+                self.memory.put(key, entry)
+        if not self._fresh(entry):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["answer"]
+
+    def put(self, key: str, answer: str):
+        entry = {"created": time.time(), "answer": answer}
+        self.memory.put(key, entry)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Could not write answer cache entry: {e}")
+
+    def stats(self) -> dict:
+        """Memory-tier stats, with ``hits``/``misses`` counted over both tiers."""
+        lookups = self.hits + self.misses
+        return dict(self.memory.stats(), hits=self.hits, misses=self.misses,
+                    hit_ratio=(self.hits / lookups) if lookups else 0.0)
+
+
+def answer_cache_from_env() -> AnswerCache | None:
+    """Configured by ``ANSWER_CACHE_ENTRIES`` (``0`` disables), ``ANSWER_CACHE_TTL`` and ``ANSWER_CACHE_DIR``."""
+    max_entries = int(os.getenv("ANSWER_CACHE_ENTRIES", "2048"))
+    if max_entries <= 0:
+        return None
+    return AnswerCache(
+        max_entries=max_entries,
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+        disk_dir=os.getenv("ANSWER_CACHE_DIR") or None,
+    )
@@ -0,0 +1,251 @@
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tools.cache import LRUCache
+from tools.lazy import REGISTRY, lazy_import
+from tools.metrics import record_span
+
+# Request priorities, lower runs first: user-facing work jumps ahead of warm-ups.
+INTERACTIVE = 0
+BACKGROUND = 10
+
+_priority = contextvars.ContextVar("arxiv_priority", default=INTERACTIVE)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@contextmanager
+def priority(level: int):
+    """Runs the enclosed arXiv requests (in this context) at ``level``."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket whose waiters are served in priority order (FIFO within a
+    priority), so queued requests are spaced out instead of colliding.
+
+    Args:
+        rate (float): Tokens added per second; ``0`` disables throttling.
+        burst (int): Bucket capacity.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, level: int = INTERACTIVE) -> float:
+        """Blocks until a token is available for this caller; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        start = time.monotonic()
+        me = (level, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, me)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == me and self.tokens >= 1:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    wait = (1 - self.tokens) / self.rate if self._waiters[0] == me else None
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiters.remove(me)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+
+def retry_after_seconds(response) -> float | None:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class ArxivSession(requests.Session):
+    """
+    Process-wide HTTP session for everything that talks to arXiv.
+
+    Keeps pooled keep-alive connections, spaces requests through one token
+    bucket for the export API and another for PDF downloads (served in
+    ``priority`` order), and retries connection errors, 429 and 5xx
+    responses with exponential backoff, honouring ``Retry-After``. Since it
+    is a ``requests.Session``, it can be handed to ``arxiv.Client``.
+
+    Args:
+        api_bucket (TokenBucket): Throttle for ``/api/`` requests.
+        pdf_bucket (TokenBucket): Throttle for every other request.
+        max_retries (int): Retries per request.
+        backoff (float): First backoff in seconds, doubled on every retry.
+        pool_size (int): Connections kept alive per host.
+        timeout (float): Default request timeout in seconds.
+        body_cache_bytes (int): Budget of the in-memory cache of validated
+            downloads (``download``); ``0`` disables it.
+    """
+
+    def __init__(self, api_bucket: TokenBucket, pdf_bucket: TokenBucket, max_retries: int = 3,
+                 backoff: float = 1.0, pool_size: int = 16, timeout: float = 60, body_cache_bytes: int = 0):
+        super().__init__()
+        self.api_bucket = api_bucket
+        self.pdf_bucket = pdf_bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.bodies = LRUCache(max_entries=None, max_bytes=body_cache_bytes, sizeof=lambda e: len(e["body"])) if body_cache_bytes else None
+        self.stats = {"requests": 0, "retries": 0, "throttled_seconds": 0.0, "not_modified": 0, "resumed": 0}
+
+    def _bucket(self, url: str) -> TokenBucket:
+        return self.api_bucket if "/api/" in url else self.pdf_bucket
+
+    def _sleep_backoff(self, attempt: int, response=None):
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+        self.stats["retries"] += 1
+        time.sleep(delay)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        bucket = self._bucket(url)
+        for attempt in range(self.max_retries + 1):
+            waited = bucket.acquire(_priority.get())
+            if waited:
+                self.stats["throttled_seconds"] += waited
+                record_span("arxiv_throttle", waited)
+            self.stats["requests"] += 1
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_backoff(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                response.close()
+                self._sleep_backoff(attempt, response)
+                continue
+            return response
+
+    def download(self, url: str, timeout: float | None = None) -> bytes:
+        """
+        GETs ``url`` into memory.
+
+        A download cut off mid-body resumes with a ``Range`` request (guarded
+        by ``If-Range``), and a body already in the cache is revalidated with
+        ``If-None-Match`` / ``If-Modified-Since`` instead of being fetched again.
+        """
+        cached = self.bodies.get(url) if self.bodies is not None else None
+        body = bytearray()
+        validator = None
+        for attempt in range(self.max_retries + 1):
+            headers = {}
+            if body:
+                headers["Range"] = f"bytes={len(body)}-"
+                if validator:
+                    headers["If-Range"] = validator
+            elif cached is not None:
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+            response = self.get(url, headers=headers, stream=True, timeout=timeout or self.timeout)
+            try:
+                if response.status_code == 304 and cached is not None:
+                    self.stats["not_modified"] += 1
+                    return cached["body"]
+                response.raise_for_status()
+                if body and response.status_code == 206:
+                    self.stats["resumed"] += 1
+                else:
+                    body.clear()  # no resume: the server sent the whole file
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                validator = etag or last_modified
+                for part in response.iter_content(chunk_size=16 * 1024):
+                    body.extend(part)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_backoff(attempt)
+                continue
+            finally:
+                response.close()
+            data = bytes(body)
+            if self.bodies is not None and validator:
+                self.bodies.put(url, {"body": data, "etag": etag, "last_modified": last_modified})
+            return data
+        raise RuntimeError(f"Download of {url} did not complete.")
+
+
+@REGISTRY.provides("arxiv_session")
+def _build_session() -> ArxivSession:
+    api_interval = float(os.getenv("ARXIV_API_INTERVAL", "3"))
+    return ArxivSession(
+        api_bucket=TokenBucket(rate=1 / api_interval if api_interval > 0 else 0,
+                               burst=int(os.getenv("ARXIV_API_BURST", "1"))),
+        pdf_bucket=TokenBucket(rate=float(os.getenv("ARXIV_PDF_RATE", "4")),
+                               burst=int(os.getenv("ARXIV_PDF_BURST", "4"))),
+        max_retries=int(os.getenv("ARXIV_MAX_RETRIES", "3")),
+        backoff=float(os.getenv("ARXIV_BACKOFF", "1")),
+        pool_size=int(os.getenv("ARXIV_POOL_SIZE", "16")),
+        body_cache_bytes=int(os.getenv("ARXIV_BODY_CACHE_MB", "32")) * 1024 * 1024,
+    )
+
+
+def arxiv_session() -> ArxivSession:
+    """
+    The shared session, configured by ``ARXIV_API_INTERVAL`` (seconds between
+    export API calls, default 3 as arXiv asks; ``0`` disables), ``ARXIV_API_BURST``,
+    ``ARXIV_PDF_RATE`` / ``ARXIV_PDF_BURST`` (downloads per second), ``ARXIV_MAX_RETRIES``,
+    ``ARXIV_BACKOFF``, ``ARXIV_POOL_SIZE`` and ``ARXIV_BODY_CACHE_MB``.
+    """
+    return REGISTRY.get("arxiv_session")
+
+
+def arxiv_client(page_size: int = 100):
+    """
+    ``arxiv.Client`` that sends its requests through the shared session, at
+    ``ARXIV_API_URL`` (default: the public export API).
+
+    The client's own per-instance delay is turned off; spacing is the
+    session's token bucket, shared by every search in the process.
+    """
+    arxiv = lazy_import("arxiv")
+    client = arxiv.Client(page_size=page_size, delay_seconds=0, num_retries=1)
+    client._session = arxiv_session()
+    client.query_url_format = os.getenv("ARXIV_API_URL", "https://export.arxiv.org/api/query") + "?{}"
+    return client
@@ -1,10 +1,26 @@
 import arxiv
+import hashlib
+import json
+import os
 import re
+import time
 from datetime import datetime
 from langchain_core.tools import tool
+from tools.arxivclient import arxiv_client
+from tools.cache import LRUCache
+from tools.metrics import span
 
-@tool
-def get_arxiv_papers(
+
+# Largest number of papers one search may ask for, whoever chose the count
+# (the user's query, the deterministic router or the LLM tool call).
+MAX_SEARCH_COUNT = int(os.getenv("ARXIV_MAX_COUNT", "500"))
+
+
+def clamp_count(count) -> int:
+    return max(1, min(int(count), MAX_SEARCH_COUNT))
+
+
+def parse_search(
     query: str,
     count: int = 100,
     year_from: int | None = None,
@@ -15,18 +31,19 @@ def get_arxiv_papers(
     sort_order: str = 'desc',
 ) -> dict:
     """
-    Searches Arxiv specifically within paper TITLES (equivalent to searchtype=title).
-    
-    Args:
-        query: The phrase to find in the title (e.g., "mixture of expert").
-        count: The number of papers to retrieve.
-    """
-    # Increase page_size to fetch more results per request (user-requested).
-    # Note: arXiv API may enforce limits; use responsibly.
-    client = arxiv.Client()
+    Resolves the effective search for ``get_arxiv_papers``.
+
+    If explicit filters are given they are used as-is; otherwise simple
+    natural-language filters ("last N years", "since YYYY", "author:",
+    "category:", "top N", ...) are parsed out of ``query``.
 
+    Returns:
+        dict: ``phrase``, ``formatted_query``, ``year_from``, ``year_to``,
+        ``author``, ``category``, ``sort_by``, ``sort_order``, ``count`` and
+        ``parsed_from_query``.
+    """
     # If explicit parameters are provided (from LLM/tool call), prefer them; otherwise parse from `query` text.
-    desired_count = int(count)
+    desired_count = clamp_count(count)
     author_filter = author
     category_filter = category
 
@@ -72,7 +89,7 @@ def get_arxiv_papers(
         # top N / limit N
         m = re.search(r'(?:top|first|limit|show)\s+(\d{1,3})', q_lower)
         if m:
-            desired_count = int(m.group(1))
+            desired_count = clamp_count(m.group(1))
 
         # Build a base search phrase: remove known filter phrases so title search is cleaner
         cleaned = query
@@ -89,101 +106,355 @@ def get_arxiv_papers(
         # use the provided query text as base phrase
         base_phrase = query
 
+    has_filters = any((year_from, year_to, author_filter, category_filter))
     if base_phrase:
         formatted_query = f'ti:"{base_phrase}"'
+    elif parsed_from_query and has_filters:
+        # The whole query was filters; they become their own clauses.
+        formatted_query = ''
     else:
         formatted_query = query
 
-    # print(f"DEBUG: Using filters -> year_from={year_from}, year_to={year_to}, author={author_filter}, category={category_filter}, desired_count={desired_count} (parsed_from_query={parsed_from_query})")
+    return {
+        "phrase": base_phrase,
+        "formatted_query": formatted_query,
+        "year_from": int(year_from) if year_from else None,
+        "year_to": int(year_to) if year_to else None,
+        "author": author_filter,
+        "category": category_filter,
+        "sort_by": sort_by,
+        "sort_order": sort_order,
+        "count": desired_count,
+        "parsed_from_query": parsed_from_query,
+    }
 
-    # Increase fetch size when filters are applied to have a larger pool for client-side filtering
-    fetch_count = max(desired_count, 200) if (year_from or year_to or author_filter or category_filter) else desired_count
 
-    search = arxiv.Search(
-        query=formatted_query,
-        max_results=int(fetch_count),
-        sort_by=arxiv.SortCriterion.SubmittedDate if sort_by == 'date' else arxiv.SortCriterion.Relevance,
-        sort_order=arxiv.SortOrder.Descending if sort_order == 'desc' else arxiv.SortOrder.Ascending
-    )
-   
-    papers_dict = {}
-    
-    # 2. Fetch results
-    # No need to filter with Python 'if' statements anymore; 
-    # the API now only returns papers with the query in the title.
-    # for r in client.results(search):
-    #     print("-"*100)
-    #     print(r,dir(r))
-    #     papers_dict[r.entry_id] = {
-    #         "title": r.title,
-    #         "pdf_url": r.pdf_url,
-    #         "date": r.published.isoformat()
-    #     }
-    result = [r for r in client.results(search)]
-    # print(type(result), len(result), dir(result[0]))
-
-    # Apply python-side filters (year, author, category) to the result list
-    filtered = []
-    for r in result:
-        try:
-            # year filter
-            pub = getattr(r, 'published', None)
-            if pub and year_from and pub.year < int(year_from):
-                continue
-            if pub and year_to and pub.year > int(year_to):
-                continue
-
-            # author filter
-            if author_filter:
-                authors = []
-                if getattr(r, 'authors', None):
-                    for a in r.authors:
-                        if isinstance(a, str):
-                            authors.append(a.lower())
-                        else:
-                            authors.append(getattr(a, 'name', str(a)).lower())
-                if not any(author_filter.lower() in a for a in authors):
-                    continue
-
-            # category filter (check primary_category and categories)
-            if category_filter:
-                pc = (getattr(r, 'primary_category', '') or '').lower()
-                cats = [c.lower() for c in (getattr(r, 'categories', []) or [])]
-                if category_filter.lower() not in pc and category_filter.lower() not in cats:
-                    continue
-
-            filtered.append(r)
-        except Exception:
-            continue
+def search_key(spec: dict) -> str:
+    """
+    Cache key of an effective search. ``count`` is deliberately left out so a
+    cached larger result can answer a smaller request.
+    """
+    def norm(value):
+        return " ".join(str(value).lower().split()) if value else None
 
-    # Trim to desired_count
-    result = filtered[:desired_count]
+    return json.dumps([
+        norm(spec["formatted_query"]),
+        spec["year_from"],
+        spec["year_to"],
+        norm(spec["author"]),
+        norm(spec["category"]),
+        spec["sort_by"],
+        spec["sort_order"],
+    ])
 
-    # Convert arxiv.Result objects into JSON-serializable dicts
-    papers_dict = {}
-    for r in result:
-        try:
+
+class SearchResultCache:
+    """
+    TTL cache of arXiv search results with an in-process LRU tier and an
+    optional on-disk tier (one JSON file per search).
+
+    Each entry holds the ordered ``(entry_id, paper)`` pairs of a search plus
+    the largest ``count`` it is a complete answer for (``None`` once arXiv
+    ran out of results), so a cached larger search also serves smaller ones.
+
+    Args:
+        max_entries (int): Size of the in-memory tier; ``0`` disables the
+            whole cache (both tiers).
+        ttl (float): Seconds a search result stays fresh.
+        disk_dir (str, optional): Directory of the on-disk tier; ``None`` disables it.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, disk_dir: str | None = None):
+        self.enabled = max_entries > 0
+        self.ttl = ttl
+        self.disk_dir = disk_dir if self.enabled else None
+        self.memory = LRUCache(max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.time() - entry["created"] <= self.ttl
+
+    def _load(self, key: str):
+        entry = self.memory.get(key)
+        if self._fresh(entry):
+            return entry
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if self._fresh(entry):
+                self.memory.put(key, entry)
+                return entry
+        return None
+
+    def get(self, spec: dict) -> dict | None:
+        """Returns the cached papers for ``spec`` or ``None`` if they cannot answer it."""
+        entry = self._load(search_key(spec)) if self.enabled else None
+        if entry is None:
+            self.misses += 1
+            return None
+        limit = entry["answers_up_to"]
+        if len(entry["papers"]) < spec["count"] and limit is not None and spec["count"] > limit:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry["papers"][:spec["count"]])
+
+    def stats(self) -> dict:
+        """Memory-tier stats, with ``hits``/``misses`` counted over both tiers."""
+        lookups = self.hits + self.misses
+        return dict(self.memory.stats(), hits=self.hits, misses=self.misses,
+                    hit_ratio=(self.hits / lookups) if lookups else 0.0)
+
+    def put(self, spec: dict, papers: dict, answers_up_to: int | None):
+        if not self.enabled:
+            return
+        key = search_key(spec)
+        old = self.memory.get(key)
+        # Never replace a fresh, larger superset with a smaller result.
+        if self._fresh(old) and len(old["papers"]) > len(papers) and answers_up_to is not None:
+            return
+        entry = {"created": time.time(), "answers_up_to": answers_up_to, "papers": list(papers.items())}
+        self.memory.put(key, entry)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Could not write search cache entry: {e}")
+
+
+# ARXIV_CACHE_ENTRIES searches kept in memory (0 disables the search cache,
+# like ANSWER_CACHE_ENTRIES=0), ARXIV_CACHE_TTL seconds, ARXIV_CACHE_DIR for the disk tier.
+SEARCH_CACHE = SearchResultCache(
+    max_entries=int(os.getenv("ARXIV_CACHE_ENTRIES", "512")),
+    ttl=float(os.getenv("ARXIV_CACHE_TTL", "3600")),
+    disk_dir=os.getenv("ARXIV_CACHE_DIR") or None,
+)
+
+
+@tool
+def get_arxiv_papers(
+    query: str,
+    count: int = 100,
+    year_from: int | None = None,
+    year_to: int | None = None,
+    author: str | None = None,
+    category: str | None = None,
+    sort_by: str = 'date',
+    sort_order: str = 'desc',
+) -> dict:
+    """
+    Searches Arxiv specifically within paper TITLES (equivalent to searchtype=title).
+
+    Args:
+        query: The phrase to find in the title (e.g., "mixture of expert").
+        count: The number of papers to retrieve.
+    """
+    spec = parse_search(query, count, year_from, year_to, author, category, sort_by, sort_order)
+
+    cached = SEARCH_CACHE.get(spec)
+    if cached is not None:
+        return cached
+
+    with span("arxiv_fetch"):
+        papers_dict, answers_up_to = fetch_papers(spec)
+    SEARCH_CACHE.put(spec, papers_dict, answers_up_to)
+    return papers_dict
+
+
+def canonical_category(category: str) -> str:
+    """
+    arXiv category names are case-sensitive in ``cat:`` queries: two-letter
+    subject classes are upper case (``cs.LG``, ``astro-ph.CO``), the rest lower
+    case (``cond-mat.mes-hall``). A bare archive (``cs``) matches all of it.
+    """
+    archive, _, subject = category.strip().partition('.')
+    archive = archive.lower()
+    if not subject:
+        return f'{archive}.*' if archive in ('cs', 'math', 'stat', 'eess', 'econ', 'q-bio', 'q-fin', 'physics', 'astro-ph', 'cond-mat') else archive
+    return f'{archive}.{subject.upper() if len(subject) <= 2 else subject.lower()}'
+
+
+def build_arxiv_query(spec: dict) -> str:
+    """
+    Translates the effective search into arXiv query syntax so filtering
+    happens server-side: the ``ti:`` phrase combined with ``au:``, ``cat:``
+    and a ``submittedDate`` range.
+    """
+    parts = [spec["formatted_query"]] if spec["formatted_query"] else []
+    if spec["author"]:
+        author = spec["author"].replace('"', '')
+        parts.append(f'au:"{author}"')
+    if spec["category"]:
+        parts.append(f'cat:{canonical_category(spec["category"])}')
+    if spec["year_from"] or spec["year_to"]:
+        year_from = spec["year_from"] or 1991  # arXiv's first year
+        year_to = spec["year_to"] or datetime.utcnow().year
+        parts.append(f'submittedDate:[{year_from}01010000 TO {year_to}12312359]')
+    return ' AND '.join(parts)
+
+
+def matches_filters(r, spec: dict) -> bool:
+    """Client-side check of the filters, guarding against looser server-side matching."""
+    year_from, year_to = spec["year_from"], spec["year_to"]
+    author_filter, category_filter = spec["author"], spec["category"]
+    try:
+        # year filter
+        pub = getattr(r, 'published', None)
+        if pub and year_from and pub.year < int(year_from):
+            return False
+        if pub and year_to and pub.year > int(year_to):
+            return False
+
+        # author filter
+        if author_filter:
             authors = []
             if getattr(r, 'authors', None):
                 for a in r.authors:
-                    # arxiv.Author has .name
                     if isinstance(a, str):
-                        authors.append(a)
+                        authors.append(a.lower())
                     else:
-                        authors.append(getattr(a, 'name', str(a)))
-
-            papers_dict[getattr(r, 'entry_id', str(r))] = {
-                "title": getattr(r, 'title', '') or '',
-                "pdf_url": getattr(r, 'pdf_url', '') or '',
-                "date": (getattr(r, 'published', None).isoformat() if getattr(r, 'published', None) else ''),
-                "summary": getattr(r, 'summary', '') or '',
-                "authors": authors,
-                "primary_category": getattr(r, 'primary_category', '') or '',
-                "categories": (list(getattr(r, 'categories', [])) if getattr(r, 'categories', None) else [])
-            }
+                        authors.append(getattr(a, 'name', str(a)).lower())
+            if not any(author_filter.lower() in a for a in authors):
+                return False
+
+        # category filter (check primary_category and categories)
+        if category_filter:
+            wanted = category_filter.lower()
+            pc = (getattr(r, 'primary_category', '') or '').lower()
+            cats = [c.lower() for c in (getattr(r, 'categories', []) or [])]
+            if '.' not in wanted:
+                # bare archive, e.g. "cs" matches "cs.LG"
+                cats = [c.split('.')[0] for c in cats + [pc]]
+            if wanted not in pc and wanted not in cats:
+                return False
+        return True
+    except Exception:
+        return False
+
+
+def paper_from_result(r) -> tuple:
+    """Converts an ``arxiv.Result`` into a JSON-serializable ``(entry_id, paper)`` pair."""
+    authors = []
+    if getattr(r, 'authors', None):
+        for a in r.authors:
+            # arxiv.Author has .name
+            if isinstance(a, str):
+                authors.append(a)
+            else:
+                authors.append(getattr(a, 'name', str(a)))
+
+    return getattr(r, 'entry_id', str(r)), {
+        "title": getattr(r, 'title', '') or '',
+        "pdf_url": getattr(r, 'pdf_url', '') or '',
+        "date": (getattr(r, 'published', None).isoformat() if getattr(r, 'published', None) else ''),
+        "summary": getattr(r, 'summary', '') or '',
+        "authors": authors,
+        "primary_category": getattr(r, 'primary_category', '') or '',
+        "categories": (list(getattr(r, 'categories', [])) if getattr(r, 'categories', None) else [])
+    }
+
+
+def iter_papers(spec: dict, progress: dict | None = None):
+    """
+    Lazily yields ``(entry_id, paper)`` pairs matching ``spec``.
+
+    Pages are requested from arXiv only as the generator is consumed, so
+    stopping after ``spec["count"]`` matches stops fetching as well.
+
+    Args:
+        spec (dict): Effective search from ``parse_search``.
+        progress (dict, optional): Receives ``scanned`` (results read from
+            arXiv) and ``exhausted`` (arXiv had no more results).
+    """
+    desired_count = spec["count"]
+    if progress is None:
+        progress = {}
+    progress.update(scanned=0, exhausted=False)
+    if desired_count <= 0:
+        return
+
+    # Filters are applied server-side; the small over-fetch allowance only
+    # covers results the stricter client-side check rejects.
+    max_scan = desired_count * 2 + 50
+    # Shares the process-wide pooled, rate-limited session (tools/arxivclient.py).
+    client = arxiv_client(page_size=min(max(desired_count, 10), 100))
+    search = arxiv.Search(
+        query=build_arxiv_query(spec),
+        max_results=max_scan,
+        sort_by=arxiv.SortCriterion.SubmittedDate if spec["sort_by"] == 'date' else arxiv.SortCriterion.Relevance,
+        sort_order=arxiv.SortOrder.Descending if spec["sort_order"] == 'desc' else arxiv.SortOrder.Ascending
+    )
+
+    found = 0
+    for r in client.results(search):
+        progress["scanned"] += 1
+        if not matches_filters(r, spec):
+            continue
+        try:
+            yield paper_from_result(r)
         except Exception as e:
             print('Error serializing result', e)
+            continue
+        found += 1
+        if found >= desired_count:
+            return
+    progress["exhausted"] = progress["scanned"] < max_scan
 
-    return papers_dict
-    
-# get_arxiv_papers("Mixture-of-Experts",5)
\ No newline at end of file
+
+def iter_search(spec: dict):
+    """
+    Yields ``(entry_id, paper)`` pairs for ``spec`` as soon as each is known:
+    from the search cache when it can answer, otherwise straight from the
+    arXiv result iterator. A stream read to the end is cached like
+    ``get_arxiv_papers`` results; one abandoned part-way is not.
+    """
+    cached = SEARCH_CACHE.get(spec)
+    if cached is not None:
+        yield from cached.items()
+        return
+    progress = {}
+    papers = {}
+    for entry_id, paper in iter_papers(spec, progress):
+        papers[entry_id] = paper
+        yield entry_id, paper
+    SEARCH_CACHE.put(spec, papers, None if progress["exhausted"] else spec["count"])
+
+
+# Keys of the paper dicts produced by ``paper_from_result``.
+PAPER_FIELDS = ("title", "pdf_url", "date", "summary", "authors", "primary_category", "categories")
+
+
+def project_paper(paper: dict, fields) -> dict:
+    """Only ``fields`` of ``paper`` (all of them when ``fields`` is empty)."""
+    if not fields:
+        return paper
+    return {name: paper[name] for name in fields if name in paper}
+
+
+def fetch_papers(spec: dict) -> tuple:
+    """
+    Runs the search described by ``spec`` against arXiv.
+
+    Returns:
+        tuple: ``(papers_dict, answers_up_to)``: the largest ``count`` for
+        which ``papers_dict`` is the complete answer, or ``None`` when arXiv
+        ran out of results (so it answers any ``count``).
+    """
+    progress = {}
+    papers_dict = dict(iter_papers(spec, progress))
+    # A larger request reads the same result stream further, so this one is a prefix of it.
+    answers_up_to = None if progress["exhausted"] else spec["count"]
+    return papers_dict, answers_up_to
@@ -0,0 +1,208 @@
+import numpy as np
+import scipy.sparse as sp
+
+from tools.analyzer import TermDictionary
+from tools.cache import approx_sizeof
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the ``k`` highest scores, best first.
+
+    Uses ``np.argpartition`` (linear time) and only sorts the selected ``k``.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def build_term_stats(tokenized_docs: list) -> dict:
+    """
+    Builds a CSR term-document matrix (rows = chunks) plus document
+    frequencies from tokenized chunks.
+
+    Returns:
+        dict: ``vocab`` (list of terms), ``indptr``, ``indices`` (term ids),
+        ``data`` (term frequencies), ``doc_len`` and ``df`` arrays.
+    """
+    dictionary = TermDictionary()
+    doc_ids = [dictionary.intern(tokens) for tokens in tokenized_docs]
+    return term_stats_from_ids(doc_ids, dictionary.terms)
+
+
+def term_stats_from_ids(doc_ids: list, vocab: list) -> dict:
+    """
+    ``build_term_stats`` for chunks that are already interned, e.g. by
+    ``Analyzer.encode``: ``doc_ids`` holds one int term id array per chunk,
+    ``vocab`` the terms those ids refer to. Counting is fully vectorized.
+    """
+    n_terms = max(len(vocab), 1)
+    doc_len = np.fromiter((len(ids) for ids in doc_ids), dtype=np.int32, count=len(doc_ids))
+    all_ids = np.concatenate(doc_ids).astype(np.int64) if doc_ids else np.zeros(0, dtype=np.int64)
+    doc_of_token = np.repeat(np.arange(len(doc_ids), dtype=np.int64), doc_len)
+    # One key per (chunk, term) pair; np.unique both sorts and counts them.
+    pairs, counts = np.unique(doc_of_token * n_terms + all_ids, return_counts=True)
+    indices = (pairs % n_terms).astype(np.int32)
+    indptr = np.zeros(len(doc_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // n_terms, minlength=len(doc_ids)), out=indptr[1:])
+    return {
+        "vocab": list(vocab),
+        "indptr": indptr,
+        "indices": indices,
+        "data": counts.astype(np.int32),
+        "doc_len": doc_len,
+        "df": np.bincount(indices, minlength=len(vocab)).astype(np.int32),
+    }
+
+
+def extend_term_stats(stats: dict, doc_ids: list, vocab: list) -> dict:
+    """
+    ``stats`` followed by the chunks in ``doc_ids`` (interned against a
+    dictionary that only ever grew, so older ids keep their meaning). Only
+    the new chunks are counted; the existing arrays are appended to.
+    """
+    new = term_stats_from_ids(doc_ids, vocab)
+    if stats is None:
+        return new
+    df = np.zeros(len(vocab), dtype=np.int32)
+    df[:len(stats["df"])] = stats["df"]
+    df += new["df"]
+    return {
+        "vocab": new["vocab"],
+        "indptr": np.concatenate([stats["indptr"], new["indptr"][1:] + stats["indptr"][-1]]),
+        "indices": np.concatenate([stats["indices"], new["indices"]]),
+        "data": np.concatenate([stats["data"], new["data"]]),
+        "doc_len": np.concatenate([stats["doc_len"], new["doc_len"]]),
+        "df": df,
+    }
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a sparse term-document matrix with interned term ids.
+
+    IDF and per-document length normalization are folded into the matrix at
+    build time, so scoring a query is one sparse product followed by a
+    partial top-k selection. Scores match ``rank_bm25.BM25Okapi``.
+
+    Args:
+        stats (dict): Term statistics as produced by ``build_term_stats``
+            (arrays may be read-only memory maps).
+        k1 (float): Term frequency saturation.
+        b (float): Length normalization strength.
+        epsilon (float): Floor for negative IDFs, as a fraction of the mean IDF.
+    """
+
+    def __init__(self, stats: dict, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.vocab = stats["vocab"]
+        self.term_ids = {term: i for i, term in enumerate(self.vocab)}
+        self.doc_len = np.asarray(stats["doc_len"])
+        self.corpus_size = len(self.doc_len)
+        self.avgdl = float(self.doc_len.sum()) / max(self.corpus_size, 1)
+        self.idf = self._idf(np.asarray(stats["df"], dtype=np.float64))
+
+        indptr = np.asarray(stats["indptr"])
+        indices = np.asarray(stats["indices"])
+        tf = np.asarray(stats["data"], dtype=np.float32)
+        # Per-posting BM25 weight: tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        doc_of_posting = np.repeat(np.arange(self.corpus_size), np.diff(indptr))
+        norm = k1 * (1 - b + b * self.doc_len / max(self.avgdl, 1e-9)).astype(np.float32)
+        weights = tf * (k1 + 1) / (tf + norm[doc_of_posting])
+        # Stored term-major (terms x docs) so a query only touches its own rows.
+        self.matrix = sp.csr_matrix(
+            (weights, (indices, doc_of_posting)),
+            shape=(len(self.vocab), self.corpus_size),
+            dtype=np.float32,
+        )
+        self.shared = False
+
+    @classmethod
+    def from_tokenized(cls, tokenized_docs: list, **kwargs):
+        return cls(build_term_stats(tokenized_docs), **kwargs)
+
+    @classmethod
+    def from_arrays(cls, vocab: list, doc_len, arrays: dict):
+        """
+        Rebuilds an index from the output of ``arrays`` without recomputing or
+        copying the weights: memory-mapped arrays stay mapped, so every
+        process that loads the same files shares one physical copy.
+        """
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon = arrays["k1"], arrays["b"], arrays["epsilon"]
+        index.vocab = vocab
+        index.term_ids = {term: i for i, term in enumerate(vocab)}
+        index.doc_len = np.asarray(doc_len)
+        index.corpus_size = len(index.doc_len)
+        index.avgdl = float(index.doc_len.sum()) / max(index.corpus_size, 1)
+        index.idf = arrays["idf"]
+        index.matrix = sp.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(vocab), index.corpus_size),
+            copy=False,
+        )
+        index.shared = isinstance(arrays["data"], np.memmap)
+        return index
+
+    def arrays(self) -> dict:
+        """The weight matrix, IDFs and parameters, as accepted by ``from_arrays``."""
+        m = self.matrix
+        return {"data": m.data, "indices": m.indices, "indptr": m.indptr, "idf": self.idf,
+                "k1": self.k1, "b": self.b, "epsilon": self.epsilon}
+
+    def _idf(self, df: np.ndarray) -> np.ndarray:
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        if idf.size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        return idf.astype(np.float32)
+
+    def query_matrix(self, tokenized_queries: list) -> sp.csr_matrix:
+        """Sparse ``(n_queries, n_terms)`` matrix of IDF-weighted query term counts."""
+        rows, cols = [], []
+        for row, tokens in enumerate(tokenized_queries):
+            for tok in tokens:
+                tid = self.term_ids.get(tok)
+                if tid is not None:
+                    rows.append(row)
+                    cols.append(tid)
+        cols = np.asarray(cols, dtype=np.int64)
+        return sp.csr_matrix(
+            (self.idf[cols], (np.asarray(rows, dtype=np.int64), cols)),
+            shape=(len(tokenized_queries), len(self.vocab)),
+            dtype=np.float32,
+        )
+
+    def get_scores_batch(self, tokenized_queries: list) -> np.ndarray:
+        """BM25 scores as a dense ``(n_queries, n_docs)`` array."""
+        return (self.query_matrix(tokenized_queries) @ self.matrix).toarray()
+
+    def get_scores(self, tokenized_query: list) -> np.ndarray:
+        return self.get_scores_batch([tokenized_query])[0]
+
+    def top_k(self, tokenized_query: list, k: int = 5) -> tuple:
+        """Returns ``(doc_indices, scores)`` of the ``k`` best documents."""
+        scores = self.get_scores(tokenized_query)
+        top = top_k_indices(scores, k)
+        return top, scores[top]
+
+    def top_k_batch(self, tokenized_queries: list, k: int = 5) -> list:
+        """``top_k`` for many queries with a single sparse product."""
+        results = []
+        for scores in self.get_scores_batch(tokenized_queries):
+            top = top_k_indices(scores, k)
+            results.append((top, scores[top]))
+        return results
+
+    @property
+    def nbytes(self) -> int:
+        """Private memory; mapped (shared) arrays are not counted."""
+        if self.shared:
+            return approx_sizeof(self.term_ids)
+        m = self.matrix
+        arrays = m.data.nbytes + m.indices.nbytes + m.indptr.nbytes + self.idf.nbytes + self.doc_len.nbytes
+        return arrays + approx_sizeof(self.term_ids)
@@ -0,0 +1,192 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def approx_sizeof(obj, _seen=None) -> int:
+    """
+    Rough, recursive estimate of the memory held by ``obj`` in bytes.
+
+    Only walks the container types we actually keep in caches (str, bytes,
+    list, tuple, set, dict); anything exposing an ``nbytes`` attribute (numpy
+    arrays) is counted by that instead.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_sizeof(k, _seen) + approx_sizeof(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approx_sizeof(item, _seen)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an entry limit, an approximate byte budget and
+    idle-TTL expiry.
+
+    Args:
+        max_entries (int, optional): Maximum number of entries kept; ``None``
+            means unlimited and ``0`` disables the cache (``put`` stores nothing),
+            matching the ``*_ENTRIES=0`` environment settings.
+        max_bytes (int): Approximate byte budget for all entries (0 = unlimited).
+        ttl (float): Seconds an entry may stay unused before it expires (0 = never).
+        sizeof (callable): Returns the approximate size in bytes of a value.
+        on_remove (callable, optional): Called with ``(key, value)`` whenever an
+            entry leaves the cache (eviction, expiry, ``pop``, ``clear``,
+            replacement by a different value, or refusal by a disabled cache),
+            e.g. to release resources. It runs after the cache lock is
+            released, so it may block or re-enter.
+    """
+
+    def __init__(self, max_entries: int | None = 128, max_bytes: int = 0, ttl: float = 0, sizeof=approx_sizeof,
+                 on_remove=None):
+        self.max_entries = None if max_entries is None else int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self.sizeof = sizeof
+        self.on_remove = on_remove
+        self._data = OrderedDict()  # key -> (value, size, last_access)
+        self._lock = threading.RLock()
+        self._removed = []  # (key, value) awaiting on_remove, collected under the lock
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry, time.monotonic())
+
+    def _expired(self, entry, now) -> bool:
+        return self.ttl > 0 and now - entry[2] > self.ttl
+
+    def _drop(self, key, replacement=None):
+        value, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+        if self.on_remove is not None and value is not replacement:
+            self._removed.append((key, value))
+
+    def _notify(self):
+        """Runs ``on_remove`` for everything dropped so far; call without holding the lock."""
+        if self.on_remove is None:
+            return
+        with self._lock:
+            removed, self._removed = self._removed, []
+        for key, value in removed:
+            self.on_remove(key, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry, now):
+                if entry is not None:
+                    self._drop(key)
+                    self.expirations += 1
+                self.misses += 1
+                value = default
+            else:
+                value, size, _ = entry
+                self._data[key] = (value, size, now)
+                self._data.move_to_end(key)
+                self.hits += 1
+        self._notify()
+        return value
+
+    def put(self, key, value):
+        if self.max_entries == 0:
+            # The value is refused at once, so it leaves the cache like an eviction.
+            if self.on_remove is not None:
+                self.on_remove(key, value)
+            return value
+        size = int(self.sizeof(value))
+        with self._lock:
+            if key in self._data:
+                self._drop(key, replacement=value)
+            self._data[key] = (value, size, time.monotonic())
+            self.total_bytes += size
+            self._evict()
+        self._notify()
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+        self._notify()
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._drop(key)
+        self._notify()
+
+    def expire(self) -> int:
+        """Drop every idle-expired entry; returns how many were removed."""
+        removed = 0
+        with self._lock:
+            now = time.monotonic()
+            for key in [k for k, e in self._data.items() if self._expired(e, now)]:
+                self._drop(key)
+                removed += 1
+            self.expirations += removed
+        self._notify()
+        return removed
+
+    def _evict(self):
+        # Least recently used entries sit at the front of the OrderedDict, so
+        # idle-expired entries are always found there first.
+        now = time.monotonic()
+        while self._data:
+            key = next(iter(self._data))
+            if not self._expired(self._data[key], now):
+                break
+            self._drop(key)
+            self.expirations += 1
+
+        # The newest entry is never evicted, even if it alone exceeds the budget.
+        while len(self._data) > 1 and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._drop(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import deque
+
+from tools.cache import LRUCache
+
+DEFAULT_SESSION = "default"
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English LLM tokenizers)."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """
+    Conversation memory of one client, kept within a token budget.
+
+    The most recent ``keep_recent`` turns are always kept in full. Older turns
+    are folded into a short extractive summary, whose oldest lines are dropped
+    once it no longer fits the budget.
+
+    Args:
+        token_budget (int): Approximate token budget of the rendered history.
+        keep_recent (int): Number of latest turns that are never summarized.
+        summary_chars (int): Characters of each old turn kept in the summary.
+    """
+
+    def __init__(self, token_budget: int = 1024, keep_recent: int = 4, summary_chars: int = 160):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_chars = summary_chars
+        self.turns = deque()    # (key, text, tokens), e.g. ("USER_QUERY", "...", 12)
+        self.summary = deque()  # (line, tokens)
+        self.turn_tokens = 0
+        self.summary_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, key: str, text: str):
+        """Appends a turn; ``key`` is ``"USER_QUERY"`` or ``"BOT_RESPONSE"``."""
+        with self._lock:
+            tokens = count_tokens(text)
+            self.turns.append((key, text, tokens))
+            self.turn_tokens += tokens
+            self._compact()
+
+    def _compact(self):
+        while len(self.turns) > self.keep_recent and self.turn_tokens + self.summary_tokens > self.token_budget:
+            key, text, tokens = self.turns.popleft()
+            self.turn_tokens -= tokens
+            snippet = " ".join(text.split())
+            if len(snippet) > self.summary_chars:
+                snippet = snippet[:self.summary_chars].rstrip() + "..."
+            line = f"{'User' if key == 'USER_QUERY' else 'Assistant'}: {snippet}"
+            line_tokens = count_tokens(line)
+            self.summary.append((line, line_tokens))
+            self.summary_tokens += line_tokens
+
+        while self.summary and self.turn_tokens + self.summary_tokens > self.token_budget:
+            _, line_tokens = self.summary.popleft()
+            self.summary_tokens -= line_tokens
+
+    def history(self) -> list:
+        """History for the prompt: an optional summary entry, then the kept turns."""
+        with self._lock:
+            history = []
+            if self.summary:
+                history.append({"EARLIER_SUMMARY": " | ".join(line for line, _ in self.summary)})
+            history.extend({key: text} for key, text, _ in self.turns)
+            return history
+
+    def tokens(self) -> int:
+        return self.turn_tokens + self.summary_tokens
+
+
+class SessionStore:
+    """
+    Chat sessions keyed by client session id, with idle expiry.
+
+    Args:
+        max_sessions (int): Maximum number of live sessions (LRU beyond that).
+        ttl (float): Seconds of inactivity after which a session expires.
+        token_budget (int): Per-session history budget, see ``ChatSession``.
+        keep_recent (int): Per-session number of turns kept in full.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800, token_budget: int = 1024, keep_recent: int = 4):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self._sessions = LRUCache(max_entries=max_sessions, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str | None) -> ChatSession:
+        """Returns the session for ``session_id``, creating it if needed."""
+        session_id = session_id or DEFAULT_SESSION
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions.put(session_id, ChatSession(self.token_budget, self.keep_recent))
+            return session
+
+    def drop(self, session_id: str):
+        self._sessions.pop(session_id)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
+
+
+def session_store_from_env() -> SessionStore:
+    return SessionStore(
+        max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "10000")),
+        ttl=float(os.getenv("CHAT_SESSION_TTL", "1800")),
+        token_budget=int(os.getenv("CHAT_HISTORY_TOKENS", "1024")),
+        keep_recent=int(os.getenv("CHAT_KEEP_RECENT_TURNS", "4")),
+    )
@@ -0,0 +1,112 @@
+import os
+
+from tools.chatmemory import count_tokens
+
+
+def overlap_length(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``."""
+    for n in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:n]):
+            return n
+    return 0
+
+
+class ContextSpan:
+    """Consecutive chunks of one paper merged into continuous text."""
+
+    def __init__(self, group, chunk_ids: list, text: str, score: float):
+        self.group = group          # paper id (or None for a single-paper context)
+        self.chunk_ids = chunk_ids
+        self.text = text
+        self.score = score
+
+    def to_dict(self) -> dict:
+        return {"group": self.group, "chunkIds": self.chunk_ids, "score": self.score}
+
+
+class ContextPacker:
+    """
+    Turns retrieved chunks into the context block of a prompt.
+
+    Candidates are taken best score first (``pinned`` ones before anything
+    else) while their estimated tokens fit ``token_budget``; chunks whose
+    text was already taken are skipped. The selected chunks are then put
+    back in reading order, and neighbours from the same paper are merged into
+    one span with the splitter's overlap removed, so no text is sent twice.
+
+    Args:
+        token_budget (int): Estimated tokens (``count_tokens``) the context may use.
+        max_overlap (int): Longest overlap, in characters, looked for between
+            neighbouring chunks (the splitter's ``chunk_overlap`` plus slack).
+        separator (str): Placed between spans.
+    """
+
+    def __init__(self, token_budget: int = 2000, max_overlap: int = 400, separator: str = "\n\n---\n\n"):
+        self.token_budget = token_budget
+        self.max_overlap = max_overlap
+        self.separator = separator
+
+    def select(self, candidates: list, pinned=()) -> list:
+        """
+        Picks the candidates that fit the budget.
+
+        Args:
+            candidates (list): ``(group, chunk_id, score, text)`` tuples.
+            pinned (iterable): ``(group, chunk_id)`` pairs taken first, counted
+                toward the budget like everything else (e.g. chunk 0).
+
+        Returns:
+            list: The chosen candidates, in reading order.
+        """
+        pinned = set(pinned)
+        order = sorted(candidates, key=lambda c: ((c[0], c[1]) not in pinned, -c[2]))
+        chosen, seen_keys, seen_text = [], set(), set()
+        used = 0
+        for group, chunk_id, score, text in order:
+            key, normalized = (group, chunk_id), " ".join(text.split())
+            if key in seen_keys or normalized in seen_text:
+                continue
+            cost = count_tokens(text)
+            if used + cost > self.token_budget:
+                if key not in pinned or chosen:
+                    continue
+                # A pinned chunk that alone exceeds the budget is cut to fit.
+                text = text[:max(self.token_budget - used, 0) * 4]
+                cost = count_tokens(text)
+            seen_keys.add(key)
+            seen_text.add(normalized)
+            chosen.append((group, chunk_id, score, text))
+            used += cost
+        return sorted(chosen, key=lambda c: (str(c[0]), c[1]))
+
+    def merge(self, chosen: list) -> list:
+        """Merges consecutive chunks of the same group into ``ContextSpan``s."""
+        spans = []
+        for group, chunk_id, score, text in chosen:
+            last = spans[-1] if spans else None
+            if last is not None and last.group == group and last.chunk_ids[-1] == chunk_id - 1:
+                cut = overlap_length(last.text, text, self.max_overlap)
+                last.text += text[cut:] if cut else "\n" + text
+                last.chunk_ids.append(chunk_id)
+                last.score = max(last.score, score)
+            else:
+                spans.append(ContextSpan(group, [chunk_id], text, score))
+        return spans
+
+    def pack(self, candidates: list, pinned=()) -> list:
+        return self.merge(self.select(candidates, pinned))
+
+    def pack_chunks(self, documents: list, chunk_ids: list, scores: list) -> list:
+        """``pack`` for one paper's retrieval result; chunk 0 is pinned when present."""
+        candidates = [(None, i, s, documents[i]) for i, s in zip(chunk_ids, scores)]
+        return self.pack(candidates, pinned=[(None, 0)] if 0 in chunk_ids else ())
+
+    def render(self, spans: list, label=None) -> str:
+        """Joins span texts; ``label(span)`` may return a heading such as the paper id."""
+        parts = [f"{label(s)}\n{s.text}" if label else s.text for s in spans]
+        return self.separator.join(parts)
+
+
+def context_packer_from_env() -> ContextPacker:
+    """Budget from ``CONTEXT_TOKEN_BUDGET`` (default 2000 estimated tokens)."""
+    return ContextPacker(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000")))
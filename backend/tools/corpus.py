@@ -0,0 +1,196 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+
+from tools.analyzer import TermDictionary, default_analyzer
+from tools.bm25 import term_stats_from_ids, top_k_indices
+
+
+class PaperSegment:
+    """
+    Chunks of one paper plus its raw term frequencies, kept over the paper's
+    own vocabulary: ``term_ids`` maps those local term ids to the shared
+    vocabulary, so the arrays of the paper's index are reused as they are.
+    """
+
+    def __init__(self, paper_id: str, chunks: list, stats: dict, term_ids: np.ndarray):
+        self.paper_id = paper_id
+        self.chunks = chunks
+        # (n_chunks, n_local_terms); not copied, so memory-mapped stored papers stay mapped
+        self.tf = sp.csr_matrix((stats["data"], stats["indices"], stats["indptr"]),
+                                shape=(len(chunks), len(term_ids)), copy=False)
+        self.doc_len = np.asarray(stats["doc_len"])
+        self.df = np.asarray(stats["df"], dtype=np.int64)  # this paper's share of the corpus document frequencies
+        self.remap(term_ids)
+
+    def remap(self, term_ids: np.ndarray):
+        """Points the local terms at new shared ids (in the same relative order after a compaction)."""
+        self.term_ids = np.asarray(term_ids, dtype=np.int64)
+        self._order = np.argsort(self.term_ids, kind='stable')
+        self._sorted_ids = self.term_ids[self._order]
+
+    def local_ids(self, shared_ids: np.ndarray) -> tuple:
+        """``(local_ids, found)``: local term ids of ``shared_ids``, valid where ``found``."""
+        if not len(self._sorted_ids):
+            return np.zeros(len(shared_ids), dtype=np.int64), np.zeros(len(shared_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self._sorted_ids, shared_ids), len(self._sorted_ids) - 1)
+        return self._order[pos], self._sorted_ids[pos] == shared_ids
+
+
+class CorpusIndex:
+    """
+    One BM25 index shared by many papers.
+
+    Papers are added and removed incrementally: each paper keeps its own
+    term-frequency segment, mapped onto a shared interned vocabulary, while
+    document frequencies, chunk counts and lengths are kept corpus-wide. IDF
+    and length normalization are computed at query time from those totals,
+    so adding or removing a paper never rebuilds the other segments. Terms
+    left without any paper are dropped once they make up ``compact_ratio``
+    of the vocabulary, which only renumbers the segments' term id arrays.
+
+    Args:
+        max_papers (int): Papers kept before the least recently used is removed (0 = unlimited).
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 length normalization strength.
+        epsilon (float): Floor for negative IDFs, as a fraction of the mean IDF.
+        compact_ratio (float): Share of unused terms that triggers a compaction.
+    """
+
+    def __init__(self, max_papers: int = 0, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 compact_ratio: float = 0.5):
+        self.max_papers = max_papers
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.compact_ratio = compact_ratio
+        self.analyzer = default_analyzer()
+        self.terms = TermDictionary()  # shared by every paper
+        self.df = np.zeros(0, dtype=np.int64)
+        self.n_chunks = 0
+        self.total_len = 0
+        self.compactions = 0
+        self.papers = OrderedDict()  # paper_id -> PaperSegment, least recently used first
+        self._lock = threading.RLock()
+
+    def __contains__(self, paper_id):
+        with self._lock:
+            return paper_id in self.papers
+
+    def __len__(self):
+        with self._lock:
+            return len(self.papers)
+
+    def add_paper(self, paper_id: str, chunks: list, stats: dict | None = None):
+        """
+        Adds (or replaces) a paper, e.g. with the chunks from ``extract_text_from_pdf``.
+
+        ``stats`` are the chunks' term statistics when they are already known,
+        e.g. ``rag.term_stats()`` of the paper's own index: they are then
+        used as they are instead of tokenizing the chunks again.
+        """
+        if stats is None:
+            dictionary = TermDictionary()
+            stats = term_stats_from_ids(self.analyzer.encode_batch(chunks, dictionary), dictionary.terms)
+        with self._lock:
+            if paper_id in self.papers:
+                self.remove_paper(paper_id)
+            # Only the paper's vocabulary is interned into the shared one.
+            seg = PaperSegment(paper_id, chunks, stats, self.terms.intern(stats["vocab"]))
+            n_terms = len(self.terms)
+            if n_terms > len(self.df):
+                self.df = np.concatenate([self.df, np.zeros(n_terms - len(self.df), dtype=np.int64)])
+            self.df[seg.term_ids] += seg.df
+            self.n_chunks += len(chunks)
+            self.total_len += int(seg.doc_len.sum())
+            self.papers[paper_id] = seg
+            while self.max_papers and len(self.papers) > self.max_papers:
+                self.remove_paper(next(iter(self.papers)))
+
+    def remove_paper(self, paper_id: str) -> bool:
+        """Removes a paper and its contribution to the corpus statistics."""
+        with self._lock:
+            seg = self.papers.pop(paper_id, None)
+            if seg is None:
+                return False
+            self.df[seg.term_ids] -= seg.df
+            self.n_chunks -= len(seg.chunks)
+            self.total_len -= int(seg.doc_len.sum())
+            if len(self.df) - np.count_nonzero(self.df) > self.compact_ratio * len(self.df):
+                self._compact()
+            return True
+
+    def _compact(self):
+        """Drops terms no paper uses any more and renumbers the rest, keeping their order."""
+        live = self.df > 0
+        new_ids = np.cumsum(live) - 1
+        terms = TermDictionary()
+        terms.intern([term for term, keep in zip(self.terms.terms, live.tolist()) if keep])
+        self.terms = terms
+        self.df = self.df[live]
+        for seg in self.papers.values():
+            seg.remap(new_ids[seg.term_ids])
+        self.compactions += 1
+
+    def _query_weights(self, tokens: list) -> tuple:
+        """Unique query term ids and their IDF * query-count weights."""
+        counts = {}
+        for tok in tokens:
+            tid = self.terms.get(tok)
+            if tid is not None:
+                counts[tid] = counts.get(tid, 0) + 1
+        ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        qcount = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+
+        live = self.df > 0
+        idf_all = np.log(self.n_chunks - self.df[live] + 0.5) - np.log(self.df[live] + 0.5)
+        mean_idf = idf_all.mean() if idf_all.size else 0.0
+        df = self.df[ids]
+        idf = np.log(self.n_chunks - df + 0.5) - np.log(df + 0.5)
+        idf[idf < 0] = self.epsilon * mean_idf
+        return ids, idf * qcount
+
+    def search(self, query: str, k: int = 5, paper_ids: list | None = None) -> list:
+        """
+        Top-k chunks for ``query`` across ``paper_ids`` (default: every paper).
+
+        Returns:
+            list: Dicts with ``paper_id``, ``chunk_id``, ``score`` and ``text``, best first.
+        """
+        with self._lock:
+            selected = [self.papers[p] for p in (paper_ids if paper_ids is not None else list(self.papers)) if p in self.papers]
+            if not selected or not self.n_chunks:
+                return []
+            for seg in selected:
+                self.papers.move_to_end(seg.paper_id)
+
+            ids, weights = self._query_weights(self.analyzer(query))
+            avgdl = self.total_len / self.n_chunks
+            per_paper = []
+            for seg in selected:
+                scores = np.zeros(len(seg.chunks), dtype=np.float64)
+                local, found = seg.local_ids(ids)  # query terms this paper does not contain are skipped
+                if found.any():
+                    tf = seg.tf[:, local[found]].toarray().astype(np.float64)
+                    norm = self.k1 * (1 - self.b + self.b * seg.doc_len / avgdl)
+                    scores = (tf * (self.k1 + 1) / (tf + norm[:, None])) @ weights[found]
+                per_paper.append(scores)
+
+        offsets = np.cumsum([0] + [len(s) for s in per_paper])
+        all_scores = np.concatenate(per_paper)
+        results = []
+        for flat in top_k_indices(all_scores, k):
+            p = int(np.searchsorted(offsets, flat, side='right') - 1)
+            chunk_id = int(flat - offsets[p])
+            results.append({
+                "paper_id": selected[p].paper_id,
+                "chunk_id": chunk_id,
+                "score": float(all_scores[flat]),
+                "text": selected[p].chunks[chunk_id],
+            })
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"papers": len(self.papers), "chunks": self.n_chunks, "terms": len(self.terms),
+                    "compactions": self.compactions}
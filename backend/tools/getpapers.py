@@ -1,18 +1,124 @@
 # from langchain_openai import ChatOpenAI
+import re
 from langchain_core.tools import tool
-from tools.arxivetool import get_arxiv_papers
+from tools.arxivetool import clamp_count, get_arxiv_papers, parse_search
+from tools.analyzer import STOP_WORDS
+from tools.metrics import span
+from tools.lazy import REGISTRY
 
 
 
 
-from model import llm
-llm_with_tools = llm.bind_tools([get_arxiv_papers])
+from model import get_llm
 
-def getpapers(query):
+
+@REGISTRY.provides("llm_with_tools")
+def _build_llm_with_tools():
+    return get_llm().bind_tools([get_arxiv_papers])
+
+# Conversational lead-ins that carry no search meaning, e.g. "find me 5 papers about ..."
+FILLER_RE = re.compile(
+    r'^\s*(?:please\s+)?(?:(?:find|search(?:\s+for)?|get|list|give\s+me|show\s+me|fetch|look\s+up)\s+)?'
+    r'(?:me\s+)?(?:(?P<count>\d+)\s+)?(?:(?:arxiv\s+)?(?:papers?|articles?|preprints?|publications?)\s+)?'
+    r'(?:on|about|regarding|titled|for|with\s+title)?\s*',
+    flags=re.IGNORECASE,
+)
+
+# Words that need interpretation (boolean logic, ranking, questions); leave those to the LLM.
+AMBIGUOUS_WORDS = {
+    "and", "or", "not", "without", "except", "recent", "latest", "newest", "best",
+    "popular", "influential", "similar", "like", "related", "compare", "versus", "vs",
+    "explain", "what", "how", "why", "which", "who", "when", "year", "years",
+}
+MAX_PHRASE_WORDS = 8
+
+# A phrase made only of these words is a lead-in ("papers by X"), not a title to search for.
+LEAD_IN_WORDS = {"arxiv", "paper", "papers", "article", "articles", "preprint", "preprints",
+                 "publication", "publications", "me", "some", "any", "all"}
+# Lead-in nouns left inside a phrase ("nlp papers", "cs.LG papers on ...") mean the parser missed its structure.
+LEAD_IN_NOUNS = LEAD_IN_WORDS - {"me", "some", "any", "all"}
+PREPOSITIONS = {"in", "on", "of", "from", "with", "about", "for", "to", "by", "at", "since", "before", "until"}
+# Leftovers the title search cannot use: numbers and year ranges (but not "GPT-4" or "ResNet-50"),
+# category codes ("cs.LG", "astro-ph.CO") and punctuation other than hyphens and apostrophes.
+NUMBER_RE = re.compile(r'(?<![\w-])\d[\d\-–/]*(?![\w-])')
+CATEGORY_RE = re.compile(r'\b[a-z]{2,}(?:-[a-z]{2,})?\.[a-z]{2,}\b', flags=re.IGNORECASE)
+PUNCTUATION_RE = re.compile(r"[^\w\s'-]")
+
+
+def leftover_is_clean(phrase: str, filtered: bool) -> bool:
+    """
+    Whether ``phrase`` (what remains of a query after the lead-in and the
+    filters ``parse_search`` understood) is a plain title phrase. Trailing
+    prepositions are only expected when a filter was removed after them.
+    """
+    words = phrase.lower().split()
+    if NUMBER_RE.search(phrase) or CATEGORY_RE.search(phrase) or PUNCTUATION_RE.search(phrase):
+        return False
+    if LEAD_IN_NOUNS.intersection(words) or words[0] in PREPOSITIONS:
+        return False
+    if words[-1] in PREPOSITIONS and not filtered:
+        return False
+    return not STOP_WORDS.issuperset(words)
+
+
+def route_query(query, default_count=100):
+    """
+    Parses ``query`` deterministically into ``get_arxiv_papers`` arguments.
+
+    Returns:
+        dict | None: Tool arguments when the query is a plain title phrase plus
+        the filters ``parse_search`` understands, ``None`` when it is
+        ambiguous or leaves anything the title search cannot use, so that it
+        goes through the LLM.
+    """
+    if not query or '?' in query:
+        return None
+    spec = parse_search(query, count=default_count)
+    filler = FILLER_RE.match(spec["phrase"] or '')
+    phrase = (spec["phrase"] or '')[filler.end():].strip().strip('"\'')
+    filters = {name: spec[name] for name in ("year_from", "year_to", "author", "category") if spec[name]}
+    words = phrase.lower().split()
+    if LEAD_IN_WORDS.issuperset(words):
+        # Nothing but filters, e.g. "papers by Yann LeCun".
+        phrase, words = '', []
+    elif filters:
+        # Separators and prepositions left behind by removed filters ("... in cat cs.CV").
+        phrase = re.sub(r'(?:[\s,;:.]+|\s+(?:in|on|of|from|with|about|for))+$', '', phrase, flags=re.IGNORECASE)
+        phrase = phrase.strip(' ,;:.')
+        words = phrase.lower().split()
+    if not words and not filters:
+        return None
+    if words and not leftover_is_clean(phrase, bool(filters)):
+        return None
+    if len(words) > MAX_PHRASE_WORDS or AMBIGUOUS_WORDS.intersection(words):
+        return None
+
+    count = spec["count"]
+    if filler.group('count') and count == clamp_count(default_count):
+        # "find 5 papers about ...": the number in the lead-in is the count.
+        count = clamp_count(filler.group('count'))
+    return dict({"query": phrase, "count": count}, **filters)
+
+
+def resolve_search(query, default_count=100):
+    """
+    Resolves ``query`` into ``get_arxiv_papers`` arguments without running the search.
+
+    Simple queries are parsed by ``route_query``; only ambiguous ones pay for
+    the LLM tool-call round trip.
+
+    Returns:
+        tuple: ``(func_args, route)`` with ``route`` one of ``"direct"``,
+        ``"llm"`` or ``"llm-no-tool"`` (then ``func_args`` is ``None``).
+    """
+    func_args = route_query(query, default_count)
+    if func_args is not None:
+        return func_args, "direct"
 
     # 3. Call LLM (It will return the ARGUMENTS, not the result)
-    
-    response_msg = llm_with_tools.invoke(query)
+
+    with span("ask_llm"):
+        response_msg = REGISTRY.get("llm_with_tools").invoke(f"{query} If count is not given use {default_count} as count")
 
     print(response_msg)
     # 4. Check if LLM wants to call the tool
@@ -20,14 +126,27 @@ def getpapers(query):
         # Extract arguments provided by LLM
         tool_call = response_msg.tool_calls[0]
         func_args = tool_call["args"]
-        
+
         # print(f"LLM decided to call function with args: {func_args}")
-        
-        # 5. Execute Manually (Output stays in Python variable, never goes to LLM)
-        huge_result = get_arxiv_papers.invoke(func_args)
-        
-        # print(f"Result Length: {len(huge_result)}")
-        # print("Done. The LLM never saw the huge data.")
-    else:
-        print("LLM didn't call the tool. It said:", response_msg.content)
-    return huge_result
\ No newline at end of file
+        return func_args, "llm"
+
+    print("LLM didn't call the tool. It said:", response_msg.content)
+    return None, "llm-no-tool"
+
+
+def getpapers_with_route(query, default_count=100):
+    """
+    Resolves ``query`` into arXiv papers (see ``resolve_search``).
+
+    Returns:
+        tuple: ``(papers_dict, route)``.
+    """
+    func_args, route = resolve_search(query, default_count)
+    if func_args is None:
+        return {}, route
+    # Execute Manually (Output stays in Python variable, never goes to LLM)
+    return get_arxiv_papers.invoke(func_args), route
+
+
+def getpapers(query, default_count=100):
+    return getpapers_with_route(query, default_count)[0]
@@ -0,0 +1,71 @@
+import importlib
+import threading
+import time
+
+
+class LazyRegistry:
+    """
+    Named objects built on first use instead of at import time.
+
+    Factories are registered up front (usually with the ``provides``
+    decorator) and run once, under a lock, the first time ``get`` asks for
+    their name; LLM clients, agents and heavy libraries therefore cost
+    nothing until an endpoint actually needs them.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._load_seconds = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory, replace: bool = True):
+        """Registers ``factory`` under ``name``; with ``replace=False`` an existing one is kept."""
+        with self._lock:
+            if replace or name not in self._factories:
+                self._factories[name] = factory
+                self._instances.pop(name, None)
+        return factory
+
+    def provides(self, name: str):
+        """Decorator form of ``register``."""
+        return lambda factory: self.register(name, factory)
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._load_seconds[name] = time.perf_counter() - start
+            return self._instances[name]
+
+    def reset(self, name: str | None = None):
+        """Drops built instances (all of them by default) so the next ``get`` rebuilds."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def loaded(self) -> dict:
+        """Seconds each built object took to construct, by name."""
+        with self._lock:
+            return dict(self._load_seconds)
+
+
+REGISTRY = LazyRegistry()
+
+
+def lazy_import(module: str, attr: str | None = None):
+    """Imports ``module`` (and returns ``attr`` from it) through the registry, on first call."""
+    name = f"{module}:{attr}" if attr else module
+
+    def load():
+        mod = importlib.import_module(module)
+        return getattr(mod, attr) if attr else mod
+
+    REGISTRY.register(name, load, replace=False)
+    return REGISTRY.get(name)
@@ -0,0 +1,178 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans range from sub-millisecond retrieval to multi-minute PDF extraction.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram keyed by one label, rendered in the
+    Prometheus text format.
+
+    Args:
+        name (str): Metric name (``_bucket``/``_sum``/``_count`` are appended).
+        help (str): One-line description.
+        label (str): Name of the label the series are split by.
+        buckets (tuple): Upper bounds in seconds, ascending.
+    """
+
+    def __init__(self, name: str, help: str, label: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def summary(self) -> dict:
+        """``{label value: {"count", "sum"}}``, e.g. for JSON stats."""
+        with self._lock:
+            return {k: {"count": s[-1], "sum": s[-2]} for k, s in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in sorted(self._series.items())}
+        for label_value, s in series.items():
+            base = {self.label: label_value}
+            for bound, count in zip(self.buckets, s):
+                lines.append(f'{self.name}_bucket{_labels({**base, "le": _number(float(bound))})} {count}')
+            lines.append(f'{self.name}_bucket{_labels({**base, "le": "+Inf"})} {s[-1]}')
+            lines.append(f'{self.name}_sum{_labels(base)} {_number(s[-2])}')
+            lines.append(f'{self.name}_count{_labels(base)} {s[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms plus gauge collectors, rendered together for ``/metrics``.
+
+    Collectors are callables run at scrape time that return
+    ``(name, type, help, samples)`` tuples, ``samples`` being a list of
+    ``(labels_dict, value)``; they read live state (cache stats, index
+    counts, memory) instead of being updated on every change.
+    """
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        hist = Histogram(*args, **kwargs)
+        self.histograms.append(hist)
+        return hist
+
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for hist in self.histograms:
+            lines.extend(hist.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector {collector.__name__} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+STAGE_SECONDS = METRICS.histogram(
+    'arxivai_stage_seconds', 'Time spent per pipeline stage.', label='stage',
+)
+REQUEST_SECONDS = METRICS.histogram(
+    'arxivai_request_seconds', 'HTTP request latency per route.', label='path',
+)
+
+# Span lists of the enclosing ``collect_spans`` blocks (e.g. the current HTTP request).
+_span_sinks = contextvars.ContextVar('span_sinks', default=())
+
+
+def record_span(stage: str, seconds: float):
+    """Records a finished stage in ``STAGE_SECONDS`` and in every active ``collect_spans``."""
+    STAGE_SECONDS.observe(stage, seconds)
+    for sink in _span_sinks.get():
+        sink.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as one ``stage`` (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_spans():
+    """
+    Collects the ``(stage, seconds)`` spans recorded inside the block, in
+    this context and in threads started with a copy of it
+    (``asyncio.to_thread``, Starlette's thread pool).
+    """
+    spans = []
+    token = _span_sinks.set(_span_sinks.get() + (spans,))
+    try:
+        yield spans
+    finally:
+        _span_sinks.reset(token)
+
+
+def server_timing(spans: list) -> str:
+    """``Server-Timing`` header value; repeated stages are summed."""
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f'{re.sub(r"[^A-Za-z0-9_-]", "_", stage)};dur={seconds * 1000:.1f}' for stage, seconds in totals.items())
+
+
+def process_memory() -> dict:
+    """Resident and virtual memory of this process in bytes (Linux; empty elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            size, resident = (int(v) for v in f.read().split()[:2])
+    except (OSError, ValueError):
+        return {}
+    page = os.sysconf('SC_PAGE_SIZE')
+    return {"rss": resident * page, "vms": size * page}
@@ -0,0 +1,343 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from collections.abc import Sequence
+
+import numpy as np
+
+from tools.analyzer import default_analyzer
+
+# Bump whenever the on-disk layout, the chunker or the tokenizer changes so
+# stale entries are never loaded.
+FORMAT_VERSION = 4
+
+BM25_ARRAYS = ('data', 'indices', 'indptr', 'idf')
+
+ARXIV_ID_RE = re.compile(
+    r'(?P<id>\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Za-z\-]+)?/\d{7})(?:v(?P<version>\d+))?'
+)
+
+
+def parse_arxiv_id(pdf_url: str) -> tuple:
+    """
+    Extracts ``(arxiv_id, version)`` from an arXiv PDF/abs URL or bare id.
+
+    ``version`` is ``None`` when the URL points at the latest version.
+    Returns ``(None, None)`` when no arXiv id can be found.
+    """
+    m = ARXIV_ID_RE.search(pdf_url or '')
+    if not m:
+        return None, None
+    version = m.group('version')
+    return m.group('id'), (int(version) if version else None)
+
+
+def locate_chunks(text: str, chunks: list) -> tuple:
+    """
+    Finds the UTF-8 byte span of every chunk inside ``text``.
+
+    Chunks produced by the splitter are substrings of the text; any chunk that
+    cannot be located is appended after the text so it still round-trips.
+
+    Returns:
+        tuple: ``(blob, offsets)`` where ``blob`` is the UTF-8 bytes and
+        ``offsets`` an ``(n_chunks, 2)`` int64 array of ``[start, end)`` spans.
+    """
+    blob = bytearray(text.encode('utf-8'))
+    offsets = np.zeros((len(chunks), 2), dtype=np.int64)
+    cursor = 0  # character position where the previous chunk started
+    byte_cursor = 0  # its UTF-8 byte offset
+    for i, chunk in enumerate(chunks):
+        pos = text.find(chunk, cursor)
+        if pos < 0:
+            pos = text.find(chunk)
+            if pos >= 0:
+                cursor = byte_cursor = 0
+        if pos >= 0:
+            start = byte_cursor + len(text[cursor:pos].encode('utf-8'))
+            offsets[i] = (start, start + len(chunk.encode('utf-8')))
+            cursor, byte_cursor = pos, start
+        else:
+            start = len(blob)
+            blob.extend(chunk.encode('utf-8'))
+            offsets[i] = (start, len(blob))
+    return bytes(blob), offsets
+
+
+class ChunkView(Sequence):
+    """
+    Read-only list of chunk strings backed by a memory-mapped text blob;
+    chunks are decoded on access, so processes mapping the same file share
+    the text instead of each holding a copy.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.offsets[i]
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+
+class StoredPaper:
+    """A paper loaded from the store; array members are read-only memory maps."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.text_blob = np.memmap(os.path.join(path, 'text.bin'), dtype=np.uint8, mode='r') \
+            if self.meta["text_bytes"] else np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.stats = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in ('indptr', 'indices', 'data', 'doc_len', 'df')
+        }
+        with open(os.path.join(path, 'vocab.txt'), encoding='utf-8') as f:
+            vocab = f.read()
+        self.stats["vocab"] = vocab.split('\n') if vocab else []
+        # Precomputed BM25 weights (see ``BM25Index.arrays``), when the paper was saved with them.
+        self.bm25 = None
+        if self.meta.get("bm25"):
+            self.bm25 = dict(self.meta["bm25"], **{
+                name: np.load(os.path.join(path, f'bm25_{name}.npy'), mmap_mode='r')
+                for name in BM25_ARRAYS
+            })
+
+    def chunks(self) -> list:
+        blob = self.text_blob
+        return [bytes(blob[s:e]).decode('utf-8') for s, e in self.offsets]
+
+    def chunk_view(self) -> ChunkView:
+        return ChunkView(self.text_blob, self.offsets)
+
+    def text(self) -> str:
+        return bytes(self.text_blob[:self.meta["text_length"]]).decode('utf-8')
+
+
+class PaperStore:
+    """
+    Content-addressed on-disk store of extracted papers.
+
+    Objects live under ``objects/<digest>/`` and hold the extracted text, the
+    chunk byte offsets and the BM25 term statistics as raw ``.npy`` arrays
+    that are memory-mapped on load. The digest covers the text together with
+    the chunking parameters and the analyzer signature, since chunks and term
+    ids depend on both. ``refs/<key>`` maps an arXiv id and version (plus the
+    same configuration) to an object, so the same content reached through
+    different keys is stored only once.
+
+    Args:
+        root (str): Directory holding the store.
+        chunk_size (int): Chunk size the stored chunks were produced with.
+        chunk_overlap (int): Chunk overlap the stored chunks were produced with.
+        analyzer (str): Signature of the analyzer the term statistics were built
+            with (``Analyzer.signature``); part of every key.
+        max_bytes (int): Budget for all objects; after a save the least recently
+            loaded papers are removed until the store fits (``0`` = unlimited).
+    """
+
+    def __init__(self, root: str, chunk_size: int = 1500, chunk_overlap: int = 200, analyzer: str = '',
+                 max_bytes: int = 0):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.analyzer = analyzer
+        self.max_bytes = max_bytes
+        # ``eviction_guard(key)`` is a context manager yielding whether ``key`` may be
+        # evicted, held while it is removed (e.g. to skip papers other processes use).
+        self.eviction_guard = lambda key: contextlib.nullcontext(True)
+        self.evictions = 0
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'refs'), exist_ok=True)
+
+    @property
+    def config(self) -> str:
+        """Everything besides the text that the stored chunks and statistics depend on."""
+        return f'f{FORMAT_VERSION}:c{self.chunk_size}-{self.chunk_overlap}:a{self.analyzer}'
+
+    def key_for(self, pdf_url: str) -> str:
+        """
+        Store key for a PDF URL. Versionless URLs are keyed by id alone and
+        therefore keep serving the version that was first extracted.
+        """
+        arxiv_id, version = parse_arxiv_id(pdf_url)
+        if arxiv_id is None:
+            name = 'url-' + hashlib.sha256(pdf_url.encode('utf-8')).hexdigest()[:32]
+        else:
+            name = arxiv_id.replace('/', '_') + (f'v{version}' if version else '')
+        suffix = f'.a{self.analyzer}' if self.analyzer else ''
+        return f'{name}.f{FORMAT_VERSION}.c{self.chunk_size}-{self.chunk_overlap}{suffix}'
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self.root, 'refs', key)
+
+    def load(self, pdf_url: str) -> StoredPaper | None:
+        ref_path = self._ref_path(self.key_for(pdf_url))
+        try:
+            with open(ref_path) as f:
+                digest = f.read().strip()
+            paper = StoredPaper(os.path.join(self.root, 'objects', digest))
+            if paper.meta.get("config") != self.config:
+                raise ValueError(f"object {digest} was built with {paper.meta.get('config')}, not {self.config}")
+            if self.max_bytes:
+                os.utime(ref_path)  # recency for ``trim``
+            return paper
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable store entry for {pdf_url}: {e}")
+            return None
+
+    def save(self, pdf_url: str, text: str, chunks: list, stats: dict, index=None) -> str:
+        """
+        Writes a paper to the store and returns its content digest.
+
+        With ``index`` (a ``BM25Index``) its weight matrix is stored as well,
+        so loading maps it instead of recomputing it.
+        """
+        digest = hashlib.sha256(f'{self.config}\n{text}'.encode('utf-8')).hexdigest()
+        obj_dir = os.path.join(self.root, 'objects', digest)
+        if not os.path.isdir(obj_dir):
+            blob, offsets = locate_chunks(text, chunks)
+            tmp_dir = tempfile.mkdtemp(dir=os.path.join(self.root, 'objects'), prefix='.tmp-')
+            try:
+                with open(os.path.join(tmp_dir, 'text.bin'), 'wb') as f:
+                    f.write(blob)
+                np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+                for name in ('indptr', 'indices', 'data', 'doc_len', 'df'):
+                    np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(stats[name]))
+                with open(os.path.join(tmp_dir, 'vocab.txt'), 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(stats["vocab"]))
+                bm25_params = None
+                if index is not None:
+                    arrays = index.arrays()
+                    for name in BM25_ARRAYS:
+                        np.save(os.path.join(tmp_dir, f'bm25_{name}.npy'), np.ascontiguousarray(arrays[name]))
+                    bm25_params = {k: arrays[k] for k in ("k1", "b", "epsilon")}
+                with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                    json.dump({
+                        "format": FORMAT_VERSION,
+                        "config": self.config,
+                        "text_length": len(text.encode('utf-8')),
+                        "text_bytes": len(blob),
+                        "n_chunks": len(chunks),
+                        "n_terms": len(stats["vocab"]),
+                        "bm25": bm25_params,
+                    }, f)
+                os.rename(tmp_dir, obj_dir)
+            except OSError:
+                # Another worker won the race (or the disk is unhappy).
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                if not os.path.isdir(obj_dir):
+                    raise
+
+        ref_path = self._ref_path(self.key_for(pdf_url))
+        tmp_ref = f'{ref_path}.{os.getpid()}.tmp'
+        with open(tmp_ref, 'w') as f:
+            f.write(digest)
+        os.replace(tmp_ref, ref_path)
+        self.trim(keep=self.key_for(pdf_url))
+        return digest
+
+    def _refs(self) -> dict:
+        """``key -> (mtime, digest)`` of every ref."""
+        refs = {}
+        refs_dir = os.path.join(self.root, 'refs')
+        for name in os.listdir(refs_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(refs_dir, name)
+            try:
+                with open(path) as f:
+                    refs[name] = (os.path.getmtime(path), f.read().strip())
+            except OSError:
+                continue
+        return refs
+
+    def _remove_key(self, key: str) -> str | None:
+        """
+        Deletes the ref ``key``, and its object once no other ref points at it;
+        returns the digest of a deleted object. Processes that already mapped
+        the files keep reading them until they let go.
+        """
+        ref_path = self._ref_path(key)
+        try:
+            with open(ref_path) as f:
+                digest = f.read().strip()
+            os.remove(ref_path)
+        except OSError:
+            return None
+        if any(d == digest for _, d in self._refs().values()):
+            return None
+        shutil.rmtree(os.path.join(self.root, 'objects', digest), ignore_errors=True)
+        return digest
+
+    def remove(self, pdf_url: str) -> bool:
+        """Deletes the entry for ``pdf_url``; returns whether its ref existed."""
+        ref_path = self._ref_path(self.key_for(pdf_url))
+        existed = os.path.exists(ref_path)
+        self._remove_key(self.key_for(pdf_url))
+        return existed
+
+    def trim(self, keep: str | None = None) -> int:
+        """
+        Removes the least recently loaded papers (never ``keep``) until the
+        objects fit ``max_bytes``; returns how many were removed.
+        """
+        if not self.max_bytes:
+            return 0
+        refs = self._refs()
+        sizes = {}
+        for _, digest in refs.values():
+            if digest not in sizes:
+                obj_dir = os.path.join(self.root, 'objects', digest)
+                try:
+                    sizes[digest] = sum(e.stat().st_size for e in os.scandir(obj_dir))
+                except OSError:
+                    sizes[digest] = 0
+        total = sum(sizes.values())
+        removed = 0
+        for key, (_, digest) in sorted(refs.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with self.eviction_guard(key) as allowed:
+                if not allowed:
+                    continue
+                deleted = self._remove_key(key)
+            removed += 1
+            if deleted:
+                total -= sizes.get(deleted, 0)
+        self.evictions += removed
+        return removed
+
+
+_default_store = None
+
+
+def default_store() -> PaperStore | None:
+    """
+    Process-wide store rooted at ``PAPER_STORE_DIR`` (default ``.paperstore``).
+    Setting ``PAPER_STORE_DIR`` to an empty string disables the store;
+    ``PAPER_STORE_MAX_MB`` bounds its size (default ``0``, unlimited).
+    """
+    global _default_store
+    root = os.getenv("PAPER_STORE_DIR", ".paperstore")
+    if not root:
+        return None
+    if _default_store is None or _default_store.root != root:
+        _default_store = PaperStore(root, analyzer=default_analyzer().signature,
+                                    max_bytes=int(os.getenv("PAPER_STORE_MAX_MB", "0")) * 1024 * 1024)
+    return _default_store
@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import threading
+
+
+def paper_id_from_url(pdf_url: str) -> str:
+    """Paper id as the frontend derives it: last URL segment without ``.pdf``."""
+    last = (pdf_url or '').rstrip('/').split('/')[-1]
+    return last[:-4] if last.lower().endswith('.pdf') else last
+
+
+class WarmupScheduler:
+    """
+    Builds paper indexes in the background before anyone asks for them.
+
+    Jobs are ordered by rank (the paper's position in a search result) and
+    then by recency, and run on a small pool of daemon threads, which also
+    caps the number of concurrent PDF downloads. Jobs are scheduled in groups
+    (one per client session); scheduling a new group for the same session, or
+    calling ``cancel``, drops that session's jobs that have not started yet.
+    A session is forgotten once its last job has run or was dropped.
+
+    Args:
+        build (callable): ``build(paper_id, pdf_url)``; blocks until the index is built.
+        is_ready (callable): ``is_ready(paper_id)``; True if cached or already being built.
+        max_downloads (int): Number of worker threads, i.e. concurrent warm-ups.
+        max_queue (int): Pending jobs kept; the lowest-priority ones are dropped beyond that.
+    """
+
+    def __init__(self, build, is_ready, max_downloads: int = 2, max_queue: int = 64):
+        self.build = build
+        self.is_ready = is_ready
+        self.max_queue = max_queue
+        self._heap = []  # (rank, -seq, group, generation, paper_id, pdf_url)
+        self._seq = itertools.count()
+        # Generations are unique across groups, so a forgotten group never revives stale jobs.
+        self._generation_ids = itertools.count(1)
+        self._generations = {}  # group -> current generation, while it has jobs left
+        self._outstanding = {}  # generation -> its jobs queued or running
+        self._cond = threading.Condition()
+        self.stats = {"scheduled": 0, "completed": 0, "skipped": 0, "cancelled": 0, "dropped": 0, "failed": 0}
+        self._workers = [
+            threading.Thread(target=self._run, name=f"warmup-{i}", daemon=True)
+            for i in range(max_downloads)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def schedule(self, pdf_urls: list, group: str = "default", top_n: int = 3) -> int:
+        """
+        Queues the first ``top_n`` URLs of a search result for warm-up and
+        cancels any pending warm-ups previously scheduled for ``group``.
+
+        Returns:
+            int: Number of jobs queued.
+        """
+        queued = 0
+        with self._cond:
+            generation = self._generations[group] = next(self._generation_ids)
+            seq = next(self._seq)
+            for rank, pdf_url in enumerate(u for u in pdf_urls if u):
+                if rank >= top_n:
+                    break
+                paper_id = paper_id_from_url(pdf_url)
+                heapq.heappush(self._heap, (rank, -seq, group, generation, paper_id, pdf_url))
+                queued += 1
+            self.stats["scheduled"] += queued
+            if queued:
+                self._outstanding[generation] = queued
+            else:
+                del self._generations[group]
+            if len(self._heap) > self.max_queue:
+                kept = heapq.nsmallest(self.max_queue, self._heap)
+                self.stats["dropped"] += len(self._heap) - len(kept)
+                for job in set(self._heap).difference(kept):
+                    self._finish(job[2], job[3])
+                self._heap = kept
+                heapq.heapify(self._heap)
+            self._cond.notify_all()
+        return queued
+
+    def cancel(self, group: str = "default"):
+        """Drops the pending warm-ups of ``group``; running builds finish normally."""
+        with self._cond:
+            self._generations.pop(group, None)
+
+    def _finish(self, group, generation):
+        """Accounts for one job that ran or was dropped; the caller holds ``_cond``."""
+        left = self._outstanding[generation] - 1
+        if left:
+            self._outstanding[generation] = left
+            return
+        del self._outstanding[generation]
+        if self._generations.get(group) == generation:
+            del self._generations[group]
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def active_groups(self) -> int:
+        """Groups (sessions) with warm-ups still queued or running."""
+        with self._cond:
+            return len(self._generations)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, group, generation, paper_id, pdf_url = heapq.heappop(self._heap)
+                if self._generations.get(group) != generation:
+                    self.stats["cancelled"] += 1
+                    self._finish(group, generation)
+                    continue
+            try:
+                if self.is_ready(paper_id):
+                    self.stats["skipped"] += 1
+                    continue
+                self.build(paper_id, pdf_url)
+                self.stats["completed"] += 1
+            except Exception as e:
+                print(f"Warm-up of {paper_id} failed: {e}")
+                self.stats["failed"] += 1
+            finally:
+                with self._cond:
+                    self._finish(group, generation)
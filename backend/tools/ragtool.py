@@ -1,66 +1,406 @@
-import pandas as pd
-from rank_bm25 import BM25Okapi
-import numpy as np
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from arxiv2text import arxiv_to_text
+import contextvars
+import io
+import os
+import re
+import threading
+import time
+from tools.arxivclient import arxiv_session
+from tools.cache import approx_sizeof
+from tools.analyzer import TermDictionary, TermRemap, default_analyzer
+from tools.bm25 import BM25Index, extend_term_stats, term_stats_from_ids
+from tools.metrics import span
+from tools.paperstore import default_store
+from tools.lazy import lazy_import
+
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200 # Added a small overlap
+
+
+def make_text_splitter():
+    # The splitter and PDF libraries are imported on first use to keep startup fast.
+    RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
 
 # --- Step 1: Text Extraction and Chunking ---
-def extract_text_from_pdf(pdf_url):
+def download_pdf(pdf_url) -> bytes:
+    """
+    The PDF in one go (its cross-reference table sits at the end of the
+    file), through the shared, rate-limited arXiv session.
+    """
+    with span("pdf_download"):
+        return arxiv_session().download(pdf_url)
+
+
+def iter_pdf_pages(pdf_url, pdf_bytes: bytes | None = None):
+    """
+    Yields the text of a PDF one page at a time.
+
+    Uses the same pdfminer pipeline as ``arxiv_to_text``, so the concatenated
+    pages equal its output. The file is downloaded with ``download_pdf``
+    unless its contents are passed as ``pdf_bytes``.
+    """
+    pdf_file = io.BytesIO(pdf_bytes if pdf_bytes is not None else download_pdf(pdf_url))
+
+    TextConverter = lazy_import("pdfminer.converter", "TextConverter")
+    LAParams = lazy_import("pdfminer.layout", "LAParams")
+    PDFPage = lazy_import("pdfminer.pdfpage", "PDFPage")
+    pdfinterp = lazy_import("pdfminer.pdfinterp")
+
+    resource_manager = pdfinterp.PDFResourceManager()
+    laparams = LAParams()
+    for page in PDFPage.get_pages(pdf_file):
+        with span("pdf_extract"):
+            text_stream = io.StringIO()
+            device = TextConverter(resource_manager, text_stream, laparams=laparams)
+            pdfinterp.PDFPageInterpreter(resource_manager, device).process_page(page)
+            device.close()
+        yield text_stream.getvalue()
+
+
+def iter_page_chunks(pdf_url, cancel_event=None, pdf_bytes: bytes | None = None):
+    """
+    Streams the chunks of a PDF as its pages are parsed.
+
+    Yields ``(page_text, new_chunks)`` once per page, then a final
+    ``(None, remaining_chunks)`` flush. The last chunk of a page is held back
+    and re-split together with the next page, since it may continue there.
+    Stops early once ``cancel_event`` (a ``threading.Event``-like object) is set.
+    ``pdf_bytes`` is the already downloaded file (see ``iter_pdf_pages``).
+    """
+    text_splitter = make_text_splitter()
+    tail = ""
+    for page_text in iter_pdf_pages(pdf_url, pdf_bytes):
+        if cancel_event is not None and cancel_event.is_set():
+            raise InterruptedError(f"Extraction of {pdf_url} was cancelled.")
+        buffer = tail + page_text
+        with span("chunk"):
+            pieces = text_splitter.split_text(buffer) if buffer.strip() else []
+        chunks = []
+        if pieces:
+            tail = buffer[max(buffer.rfind(pieces[-1]), 0):]
+            chunks = pieces[:-1]
+        yield page_text, chunks
+    yield None, (text_splitter.split_text(tail) if tail.strip() else [])
+
+
+def extract_text_and_chunks(pdf_url):
     """
     Extracts text from an arXiv PDF URL and splits it into chunks.
+
+    Returns:
+        tuple: ``(extracted_text, chunks)``; both empty on failure.
     """
     print(f"Extracting text from: {pdf_url}")
     try:
-        extracted_text = arxiv_to_text(pdf_url)
+        with span("pdf_download_extract"):
+            extracted_text = "".join(iter_pdf_pages(pdf_url))
     except Exception as e:
         print(f"Error extracting text: {e}")
-        return []
+        return "", []
     
     # Check if text was actually extracted
     if not extracted_text or not extracted_text.strip():
         print("Failed to extract text or the document is empty.")
-        return []
+        return "", []
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200) # Added a small overlap
-    texts = text_splitter.split_text(extracted_text)
+    text_splitter = make_text_splitter()
+    with span("chunk"):
+        texts = text_splitter.split_text(extracted_text)
     
     # --- Crucial Debugging Step ---
     print(f"Successfully split the document into {len(texts)} chunks.")
-    return texts
+    return extracted_text, texts
+
+
+def extract_text_from_pdf(pdf_url):
+    """
+    Extracts text from an arXiv PDF URL and splits it into chunks.
+    """
+    return extract_text_and_chunks(pdf_url)[1]
 
 # --- Step 2: RAG Class ---
 class FastTfidfRAG:
-    def __init__(self, pdf_url: str):
-        self.documents = extract_text_from_pdf(pdf_url)
-        # Tokenize documents for BM25
-        self.tokenized_docs = [doc.split() for doc in self.documents]
-        self.bm25 = BM25Okapi(self.tokenized_docs)
+    # True once every page of the paper is indexed (see ProgressiveRAG).
+    complete = True
+    error = None
+
+    def __init__(self, pdf_url: str, store=None, stored=None):
+        """
+        Args:
+            pdf_url (str): arXiv PDF URL of the paper to index.
+            store (PaperStore, optional): On-disk store to load from / save to.
+                Defaults to the process-wide store (see ``default_store``).
+            stored (StoredPaper, optional): The paper already loaded from
+                ``store``, so it is not looked up again.
+        """
+        self.pdf_url = pdf_url
+        self.analyzer = default_analyzer()
+        self.store = store if store is not None else default_store()
+
+        if stored is None:
+            with span("store_load"):
+                stored = self.store.load(pdf_url) if self.store else None
+        if stored is not None:
+            # Chunks and BM25 statistics come straight from the memory-mapped store.
+            # Chunks are decoded from the mapped text on access, and a stored
+            # BM25 matrix is used in place, so workers share the pages.
+            print(f"Loaded {len(stored.offsets)} chunks for {pdf_url} from the paper store.")
+            self.documents = stored.chunk_view()
+            self._stats = stored.stats
+            with span("bm25_build"):
+                if stored.bm25:
+                    self.bm25 = BM25Index.from_arrays(stored.stats["vocab"], stored.stats["doc_len"], stored.bm25)
+                else:
+                    self.bm25 = BM25Index(stored.stats)
+        else:
+            extracted_text, self.documents = extract_text_and_chunks(pdf_url)
+            # Tokenize documents for BM25 (interned term ids, one int32 array per chunk)
+            with span("tokenize"):
+                dictionary = TermDictionary()
+                stats = term_stats_from_ids(self.analyzer.encode_batch(self.documents, dictionary), dictionary.terms)
+            self._stats = stats
+            with span("bm25_build"):
+                self.bm25 = BM25Index(stats)
+            if self.store and self.documents:
+                try:
+                    self.store.save(pdf_url, extracted_text, self.documents, stats, index=self.bm25)
+                except OSError as e:
+                    print(f"Could not write {pdf_url} to the paper store: {e}")
         self.index = None
         self.build_index()
+        self.nbytes = self.memory_usage()
 
     def build_index(self):
-        """Build a BM25 index.  The BM25Okapi instance already holds the
+        """Build a BM25 index.  The BM25Index instance already holds the
         necessary statistics, so this method simply confirms that the
         index is ready.
         """
-        print("\nBM25 index ready with", len(self.tokenized_docs), "documents.")
+        print("\nBM25 index ready with", len(self.documents), "documents.")
 
-    def retrieve(self, query: str, k: int = 5) -> list:
-        if not self.tokenized_docs:
+    def memory_usage(self) -> int:
+        """Approximate private bytes held by the chunk text and BM25 statistics (mapped files excluded)."""
+        return approx_sizeof(self.documents) + self.bm25.nbytes
+
+    def term_stats(self) -> dict:
+        """Raw term statistics of the indexed chunks (``term_stats_from_ids`` layout), e.g. for ``CorpusIndex``."""
+        return self._stats if self._stats is not None else term_stats_from_ids([], [])
+
+    def retrieve_scored_batch(self, queries: list, k: int = 5) -> list:
+        """
+        Top-k matches for many queries, scored in one vectorized pass.
+
+        Returns:
+            list: One ``(chunk_ids, scores)`` pair per query, best first, with
+            chunk 0 always present (first, with score 0, if it was not retrieved).
+        """
+        if not self.documents:
             raise Exception("No documents indexed.")
 
-        query_tokens = query.split()
-        scores = self.bm25.get_scores(query_tokens)
-        
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-        top_indices = [idx for idx, _ in ranked[:k]]
-        
-        # --- FIX: Always include the first chunk (Header/Abstract) ---
-        # Metadata (Authors/Date) is always here. 
-        if 0 not in top_indices:
-            top_indices.insert(0, 0) # Force add the first chunk
-            
-        return [self.documents[i] for i in top_indices]
+        with span("retrieve"):
+            results = self.bm25.top_k_batch([self.analyzer(q) for q in queries], k)
+        scored = []
+        for top_indices, scores in results:
+            ids, scores = [int(i) for i in top_indices], [float(x) for x in scores]
+            # --- FIX: Always include the first chunk (Header/Abstract) ---
+            # Metadata (Authors/Date) is always here.
+            if 0 not in ids:
+                ids.insert(0, 0) # Force add the first chunk
+                scores.insert(0, 0.0)
+            scored.append((ids, scores))
+        return scored
+
+    def retrieve_scored(self, query: str, k: int = 5) -> tuple:
+        return self.retrieve_scored_batch([query], k)[0]
+
+    def retrieve_ids(self, query: str, k: int = 5) -> list:
+        """Chunk indices of the top-k matches, with chunk 0 always first if not already present."""
+        return self.retrieve_scored(query, k)[0]
+
+    def retrieve_ids_batch(self, queries: list, k: int = 5) -> list:
+        """``retrieve_ids`` for many queries, scored in one vectorized pass."""
+        return [ids for ids, _ in self.retrieve_scored_batch(queries, k)]
+
+    def retrieve(self, query: str, k: int = 5) -> list:
+        return [self.documents[i] for i in self.retrieve_ids(query, k)]
+
+    def retrieve_batch(self, queries: list, k: int = 5) -> list:
+        return [[self.documents[i] for i in ids] for ids in self.retrieve_ids_batch(queries, k)]
+
+    def wait_until_complete(self, timeout=None) -> bool:
+        return True
+
+    def coverage(self) -> dict:
+        return {"complete": self.complete, "pages": None, "chunks": len(self.documents), "error": None}
+
+
+# Questions about these parts of a paper can only be answered once late pages are indexed.
+LATE_SECTION_RE = re.compile(
+    r'\b(conclusions?|results?|experiments?|evaluation|discussion|limitations?|future work|'
+    r'references?|bibliography|appendix|ablations?|tables?|figures?|fig\.)\b',
+    flags=re.IGNORECASE,
+)
+
+
+class ProgressiveRAG(FastTfidfRAG):
+    """
+    BM25 index that grows page by page while the PDF is still being parsed.
+
+    The constructor returns as soon as the first page is indexed; extraction
+    continues on a background thread. Queries are answered from what is
+    indexed so far (``complete`` / ``coverage()`` report partial coverage)
+    and only wait for more pages when the question targets a late section or
+    nothing indexed yet matches it. The finished paper is written to the
+    paper store like a regular ``FastTfidfRAG``.
+
+    Args:
+        pdf_url (str): arXiv PDF URL of the paper to index.
+        store (PaperStore, optional): Store the finished paper is saved to.
+        first_page_timeout (float): Seconds to wait for the first page.
+        max_wait (float): Longest a query waits for unindexed pages.
+        on_complete (callable, optional): Called with the index once extraction ends.
+        page_source (callable, optional): ``page_source(pdf_url, cancel_event=...)``
+            iterating like ``iter_page_chunks`` (the default), e.g. an
+            ``ExtractionPool.stream`` running the work in another process;
+            pages may carry their chunks already encoded (see ``stream``).
+        cancel_event (threading.Event, optional): Aborts extraction when set.
+    """
+
+    def __init__(self, pdf_url: str, store=None, first_page_timeout: float = 120, max_wait: float = 30,
+                 on_complete=None, page_source=None, cancel_event=None):
+        self.pdf_url = pdf_url
+        self.analyzer = default_analyzer()
+        self.page_source = page_source or iter_page_chunks
+        self.cancel_event = cancel_event
+        self.error = None
+        self.store = store if store is not None else default_store()
+        self.max_wait = max_wait
+        self.on_complete = on_complete
+        self.complete = False
+        self.pages_indexed = 0
+        self.documents = []
+        self.bm25 = BM25Index.from_tokenized([])
+        self.index = None
+        self.nbytes = 0
+        self._dictionary = TermDictionary()
+        self._remap = TermRemap(self._dictionary)  # for chunks encoded by another process
+        self._stats = None  # cumulative term statistics, extended page by page
+        self._text_parts = []
+        self._cond = threading.Condition()
+
+        # Copies the context so request priority and timing spans follow the extraction.
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._extract,), name="progressive-extract", daemon=True).start()
+        with self._cond:
+            self._cond.wait_for(lambda: self.pages_indexed > 0 or self.complete, timeout=first_page_timeout)
+        if self.error is not None and not self.documents:
+            raise self.error
+
+    def _extract(self):
+        print(f"Extracting text page by page from: {self.pdf_url}")
+        try:
+            for page_text, chunks, *encoded in self.page_source(self.pdf_url, cancel_event=self.cancel_event):
+                self._add_chunks(chunks, *encoded)
+                if page_text is None:
+                    continue  # final flush, not a page
+                self._text_parts.append(page_text)
+                with self._cond:
+                    self.pages_indexed += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"Error extracting text: {e}")
+            self.error = e
+        finally:
+            with self._cond:
+                self.complete = True
+                self._cond.notify_all()
+
+        print(f"Successfully split the document into {len(self.documents)} chunks ({self.pages_indexed} pages).")
+        # Only a fully extracted paper may be persisted.
+        if self.store and self.documents and self.error is None:
+            try:
+                self.store.save(self.pdf_url, "".join(self._text_parts), self.documents, self.term_stats(),
+                                index=self.bm25)
+            except OSError as e:
+                print(f"Could not write {self.pdf_url} to the paper store: {e}")
+        self._text_parts = []
+        if self.on_complete:
+            self.on_complete(self)
+
+    def _add_chunks(self, chunks: list, encoded: tuple | None = None):
+        if not chunks:
+            return
+        with span("bm25_build"):
+            if encoded is not None:
+                # Tokenized by the extraction worker; only its new terms are interned here.
+                term_ids = self._remap(*encoded)
+            else:
+                term_ids = self.analyzer.encode_batch(chunks, self._dictionary)
+            # Only the new chunks are counted; earlier pages' statistics are reused.
+            self._stats = extend_term_stats(self._stats, term_ids, self._dictionary.terms)
+            # Documents only ever grow, so ids from an older BM25 snapshot stay valid.
+            self.documents.extend(chunks)
+            bm25 = BM25Index(self._stats)
+        with self._cond:
+            self.bm25 = bm25
+            self.nbytes = self.memory_usage()
+
+    def needs_more_pages(self, query: str) -> bool:
+        """True if ``query`` probably cannot be answered from the pages indexed so far."""
+        if self.complete:
+            return False
+        if not self.documents or LATE_SECTION_RE.search(query):
+            return True
+        _, scores = self.bm25.top_k(self.analyzer(query), 1)
+        return not (scores.size and scores[0] > 0)
+
+    def _wait_for(self, queries: list):
+        deadline = time.monotonic() + self.max_wait
+        with span("retrieve_wait"), self._cond:
+            while any(self.needs_more_pages(q) for q in queries):
+                pages = self.pages_indexed
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait_for(lambda: self.complete or self.pages_indexed > pages, timeout=remaining)
+
+    def retrieve_scored_batch(self, queries: list, k: int = 5) -> list:
+        self._wait_for(queries)
+        return super().retrieve_scored_batch(queries, k)
+
+    def wait_until_complete(self, timeout=None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.complete, timeout=timeout)
+
+    def coverage(self) -> dict:
+        # A failed extraction is finished but not complete: answers came from part of the paper.
+        return {"complete": self.complete and self.error is None, "pages": self.pages_indexed,
+                "chunks": len(self.documents), "error": str(self.error) if self.error is not None else None}
+
+
+def open_paper_index(pdf_url: str, progressive: bool = True, on_complete=None, page_source=None, cancel_event=None,
+                     store=None):
+    """
+    Index for ``pdf_url``: loaded from the paper store when available,
+    otherwise built progressively (or in one go with ``progressive=False``).
+    See ``ProgressiveRAG`` for ``page_source`` and ``cancel_event``; ``store``
+    defaults to ``default_store()``.
+    """
+    store = store if store is not None else default_store()
+    if not progressive:
+        return FastTfidfRAG(pdf_url, store=store)
+    with span("store_load"):
+        stored = store.load(pdf_url) if store else None
+    if stored is not None:
+        return FastTfidfRAG(pdf_url, store=store, stored=stored)
+    return ProgressiveRAG(
+        pdf_url,
+        store=store,
+        max_wait=float(os.getenv("PROGRESSIVE_MAX_WAIT", "30")),
+        on_complete=on_complete,
+        page_source=page_source,
+        cancel_event=cancel_event,
+    )
 
 # # --- Step 3: Running the RAG System ---
 # if __name__ == '__main__':
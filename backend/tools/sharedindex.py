@@ -0,0 +1,203 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from tools.analyzer import default_analyzer
+from tools.paperstore import PaperStore
+from tools.ragtool import FastTfidfRAG
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BuildLock:
+    """Exclusive ``flock`` on one paper's build; held across threads until ``release``."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class SharedIndexes:
+    """
+    Paper indexes shared by every worker process on the host.
+
+    Indexes live in a ``PaperStore`` under ``root`` (put it on a tmpfs such
+    as ``/dev/shm`` to keep them in memory), written with their BM25 matrix
+    so that attaching is a handful of ``mmap`` calls and all workers share
+    the same physical pages. One worker builds a given paper while the
+    others wait on its build lock, then attach.
+
+    Papers outlive the workers that use them, like the regular paper store:
+    they are only evicted by the store's byte budget, least recently loaded
+    first. Holder files, one per attached process (``holders/<key>/<pid>``),
+    count references so that a paper some live worker still maps is never
+    evicted; holders of processes that died are ignored.
+
+    Args:
+        root (str): Directory for the store, locks and holder files.
+        lock_wait (float): Seconds to wait for another worker's build before
+            building anyway.
+        max_bytes (int): Byte budget of the store (``0`` = unlimited).
+    """
+
+    def __init__(self, root: str, lock_wait: float = 120, max_bytes: int = 0):
+        self.root = root
+        self.lock_wait = lock_wait
+        self.store = PaperStore(os.path.join(root, 'store'), analyzer=default_analyzer().signature,
+                                max_bytes=max_bytes)
+        self.store.eviction_guard = self._eviction_guard
+        os.makedirs(os.path.join(root, 'locks'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'holders'), exist_ok=True)
+        self._held = {}  # store key -> [pdf_url, number of attached indexes in this process]
+        self._lock = threading.Lock()
+        self.stats_counts = {"attached": 0, "released": 0, "lock_waits": 0, "lock_timeouts": 0}
+        atexit.register(self.release_all)
+
+    def _lock_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.root, 'locks', f'{key}.{kind}')
+
+    def _holder_dir(self, key: str) -> str:
+        return os.path.join(self.root, 'holders', key)
+
+    def _flock(self, key: str, kind: str, timeout: float | None = None, cancel_event=None) -> BuildLock | None:
+        fd = os.open(self._lock_path(key, kind), os.O_RDWR | os.O_CREAT, 0o644)
+        if timeout is None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            return BuildLock(fd)
+        deadline = time.monotonic() + timeout
+        waited = False
+        # Non-blocking polls so a cancelled request stops waiting.
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if waited:
+                    self.stats_counts["lock_waits"] += 1
+                return BuildLock(fd)
+            except BlockingIOError:
+                waited = True
+            if (cancel_event is not None and cancel_event.is_set()) or time.monotonic() >= deadline:
+                os.close(fd)
+                if time.monotonic() >= deadline:
+                    self.stats_counts["lock_timeouts"] += 1
+                return None
+            time.sleep(0.1)
+
+    def live_holders(self, key: str) -> list:
+        """Pids holding ``key``; holder files of dead processes are removed."""
+        pids = []
+        try:
+            names = os.listdir(self._holder_dir(key))
+        except FileNotFoundError:
+            return pids
+        for name in names:
+            pid = int(name) if name.isdigit() else None
+            if pid is not None and pid_alive(pid):
+                pids.append(pid)
+            else:
+                try:
+                    os.remove(os.path.join(self._holder_dir(key), name))
+                except OSError:
+                    pass
+        return pids
+
+    @contextmanager
+    def _eviction_guard(self, key: str):
+        """Store eviction hook: holds the ref lock, allows eviction only without live holders."""
+        ref = self._flock(key, 'ref')
+        try:
+            yield not self.live_holders(key)
+        finally:
+            ref.release()
+
+    def attach(self, pdf_url: str) -> FastTfidfRAG | None:
+        """The shared index for ``pdf_url``, or ``None`` if no worker has built it yet."""
+        key = self.store.key_for(pdf_url)
+        # The ref lock keeps the store from evicting the paper between loading and registering.
+        ref = self._flock(key, 'ref')
+        try:
+            stored = self.store.load(pdf_url)
+            if stored is None:
+                return None
+            rag = FastTfidfRAG(pdf_url, store=self.store, stored=stored)
+            # Registered only once the index loaded, so a failed load leaves no holder behind.
+            os.makedirs(self._holder_dir(key), exist_ok=True)
+            open(os.path.join(self._holder_dir(key), str(os.getpid())), 'a').close()
+        finally:
+            ref.release()
+        rag.shared_key = key
+        with self._lock:
+            self._held.setdefault(key, [pdf_url, 0])[1] += 1
+        self.stats_counts["attached"] += 1
+        return rag
+
+    def lock_build(self, pdf_url: str, cancel_event=None) -> BuildLock | None:
+        """
+        Takes the build lock for ``pdf_url``, waiting up to ``lock_wait`` for
+        another worker's build. ``None`` on timeout or cancellation.
+        """
+        return self._flock(self.store.key_for(pdf_url), 'build', timeout=self.lock_wait, cancel_event=cancel_event)
+
+    def release(self, rag):
+        """Drops one reference taken by ``attach``; the paper stays in the store."""
+        key = getattr(rag, 'shared_key', None)
+        with self._lock:
+            held = self._held.get(key)
+            if held is None:
+                return
+            held[1] -= 1
+            if held[1] > 0:
+                return
+            del self._held[key]
+        self._drop(key)
+
+    def _drop(self, key: str):
+        ref = self._flock(key, 'ref')
+        try:
+            os.remove(os.path.join(self._holder_dir(key), str(os.getpid())))
+        except OSError:
+            pass
+        finally:
+            ref.release()
+        self.stats_counts["released"] += 1
+
+    def release_all(self):
+        with self._lock:
+            held, self._held = self._held, {}
+        for key in held:
+            self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = list(self._held)
+        return dict(self.stats_counts, held=len(keys), evicted=self.store.evictions,
+                    holders=sum(len(self.live_holders(k)) for k in keys))
+
+
+def shared_indexes_from_env() -> SharedIndexes | None:
+    """
+    Enabled by ``SHARED_INDEX_DIR`` (e.g. ``/dev/shm/arxivai``; unset or empty
+    keeps indexes private to each worker). ``SHARED_INDEX_LOCK_WAIT`` bounds
+    the wait for another worker's build and ``SHARED_INDEX_MAX_MB`` the size
+    of the shared store (default 1024; ``0`` = unlimited).
+    """
+    root = os.getenv("SHARED_INDEX_DIR", "")
+    if not root:
+        return None
+    return SharedIndexes(root, lock_wait=float(os.getenv("SHARED_INDEX_LOCK_WAIT", "120")),
+                         max_bytes=int(os.getenv("SHARED_INDEX_MAX_MB", "1024")) * 1024 * 1024)
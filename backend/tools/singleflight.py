@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Flight:
+    def __init__(self):
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.waiters = 0      # event-loop callers currently awaiting the result
+        self.pinned = False   # a blocking caller is waiting; never cancel
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers for the same
+    key share the in-flight result instead of starting their own.
+
+    Work runs on a thread pool, so both threads (``submit``) and the event
+    loop (``run``) can wait on the same build.
+
+    Args:
+        max_workers (int): Size of the thread pool the work runs on.
+        name (str): Thread name prefix, handy in stack dumps.
+        cancellable (bool): Pass a ``cancel_event`` keyword to the call; it is
+            set once every ``run`` caller has been cancelled and no ``submit``
+            caller is waiting.
+    """
+
+    def __init__(self, max_workers: int = 4, name: str = "singleflight", cancellable: bool = False):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.cancellable = cancellable
+        self._lock = threading.RLock()
+        self._inflight = {}
+
+    def _flight(self, key, fn, args, kwargs) -> _Flight:
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = _Flight()
+                if self.cancellable:
+                    kwargs = dict(kwargs, cancel_event=flight.cancel_event)
+                # The first caller's context (request priority, timing spans) carries over.
+                flight.future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+                self._inflight[key] = flight
+                flight.future.add_done_callback(lambda f, key=key, flight=flight: self._forget(key, flight))
+            return flight
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Returns the ``concurrent.futures.Future`` of the in-flight call for ``key``."""
+        flight = self._flight(key, fn, args, kwargs)
+        flight.pinned = True
+        return flight.future
+
+    def _forget(self, key, flight):
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    async def run(self, key, fn, *args, **kwargs):
+        """
+        Awaitable variant of ``submit``. Cancelling one awaiting task does not
+        cancel the shared call while other callers still wait on it; once the
+        last one is gone the call is cancelled (see ``cancellable``).
+        """
+        with self._lock:
+            flight = self._flight(key, fn, args, kwargs)
+            flight.waiters += 1
+        cancelled = False
+        try:
+            return await asyncio.shield(asyncio.wrap_future(flight.future))
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if cancelled and flight.waiters == 0 and not flight.pinned and not flight.future.done():
+                    flight.cancel_event.set()
+                    flight.future.cancel()
+                    # Later callers start a fresh call instead of joining the cancelled one.
+                    self._forget(key, flight)
+
+
+# Shared by every code path that builds per-paper indexes.
+index_builds = SingleFlight(
+    max_workers=int(os.getenv("INDEX_BUILD_WORKERS", "4")),
+    name="index-build",
+    cancellable=True,
+)
@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tools.analyzer import TermDictionary, default_analyzer
+from tools.metrics import collect_spans, record_span, span
+from tools.ragtool import download_pdf, iter_page_chunks
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction pool already has ``max_pending`` jobs queued."""
+
+
+def _pack_chunks(chunks: list) -> tuple:
+    """Chunks as one string plus an int32 length array: far cheaper to pickle than a list of str."""
+    return "".join(chunks), np.fromiter((len(c) for c in chunks), dtype=np.int32, count=len(chunks))
+
+
+def _unpack_chunks(joined: str, lengths: np.ndarray) -> list:
+    ends = np.cumsum(lengths)
+    return [joined[end - n:end] for n, end in zip(lengths.tolist(), ends.tolist())]
+
+
+def _pack_ids(term_ids: list) -> tuple:
+    """Per-chunk term id arrays as one int32 array plus the number of ids of each chunk."""
+    counts = np.fromiter((len(ids) for ids in term_ids), dtype=np.int32, count=len(term_ids))
+    return (np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32)), counts
+
+
+def _unpack_ids(ids: np.ndarray, counts: np.ndarray) -> list:
+    return np.split(ids, np.cumsum(counts)[:-1]) if len(counts) else []
+
+
+def _page_chunks_job(pdf_url, pdf_bytes, results, stop, analyzer):
+    """
+    Runs in a worker process: per-page extraction, chunking and term
+    encoding of one PDF downloaded by the parent. Ids refer to a dictionary local to the job;
+    each page carries the terms it added, so the parent can remap them.
+    """
+    try:
+        dictionary = TermDictionary()
+        with collect_spans() as spans:
+            for page_text, chunks in iter_page_chunks(pdf_url, cancel_event=stop, pdf_bytes=pdf_bytes):
+                seen = len(dictionary)
+                with span("tokenize"):
+                    term_ids = analyzer.encode_batch(chunks, dictionary)
+                results.put(("page", page_text, *_pack_chunks(chunks), *_pack_ids(term_ids), dictionary.terms[seen:]))
+        # Stage timings are recorded by the serving process, not this one.
+        results.put(("done", spans))
+    except Exception as e:
+        results.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class ExtractionPool:
+    """
+    Process pool for the CPU-bound extract -> chunk -> tokenize stage, so PDF
+    parsing and term encoding do not hold the GIL of the serving process.
+
+    ``stream`` has the shape of ``ragtool.iter_page_chunks`` plus the encoded
+    chunks and can be passed to ``ProgressiveRAG`` as its ``page_source``;
+    pages are sent back as they are parsed, in compact form (page text,
+    joined chunk text and int32 length and term id arrays).
+
+    The PDF itself is downloaded by the serving process, through the shared
+    arXiv session, so workers neither multiply the configured download rate
+    nor lose the request's priority; they only receive the file's bytes.
+
+    Args:
+        processes (int): Worker processes.
+        max_pending (int): Jobs allowed to wait for a free worker; beyond
+            that ``stream`` raises ``ExtractionQueueFull``.
+        job_timeout (float): Seconds a job may run before it is abandoned.
+    """
+
+    def __init__(self, processes: int = 2, max_pending: int = 8, job_timeout: float = 300):
+        self.job_timeout = job_timeout
+        # forkserver avoids forking a process that already runs threads.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=self._context)
+        self._slots = threading.BoundedSemaphore(processes + max_pending)
+        self._manager = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "completed": 0, "rejected": 0, "timed_out": 0, "cancelled": 0, "failed": 0}
+
+    def _get_manager(self):
+        # Manager queues/events can be handed to pool workers; plain multiprocessing ones cannot.
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._context.Manager()
+            return self._manager
+
+    def stream(self, pdf_url: str, cancel_event=None, timeout: float | None = None):
+        """
+        Yields ``(page_text, new_chunks, (term_ids, new_terms))``, computed in
+        a worker process: ``iter_page_chunks`` output plus the chunks encoded
+        by ``default_analyzer()``, as one int32 id array per chunk over the
+        job's own vocabulary and the terms that page added to it (see
+        ``analyzer.TermRemap``).
+
+        Raises:
+            ExtractionQueueFull: If the pool queue is full (checked immediately).
+            TimeoutError: If the job exceeds ``timeout`` (default ``job_timeout``).
+            InterruptedError: If ``cancel_event`` is set before the job finishes.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            raise ExtractionQueueFull("Too many papers are being extracted; try again shortly.")
+        try:
+            pdf_bytes = download_pdf(pdf_url)
+            manager = self._get_manager()
+            results, stop = manager.Queue(), manager.Event()
+            future = self._executor.submit(_page_chunks_job, pdf_url, pdf_bytes, results, stop, default_analyzer())
+        except Exception:
+            self._slots.release()
+            raise
+        # A slot is held for the lifetime of the job, whether or not anyone still reads it.
+        future.add_done_callback(lambda f: self._slots.release())
+        self.stats["submitted"] += 1
+        return self._consume(pdf_url, future, results, stop, cancel_event, self.job_timeout if timeout is None else timeout)
+
+    def _consume(self, pdf_url, future, results, stop, cancel_event, timeout):
+        deadline = time.monotonic() + timeout
+        outcome = "failed"
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    outcome = "cancelled"
+                    raise InterruptedError(f"Extraction of {pdf_url} was cancelled.")
+                if time.monotonic() > deadline:
+                    outcome = "timed_out"
+                    raise TimeoutError(f"Extraction of {pdf_url} took longer than {timeout:.0f}s.")
+                try:
+                    message = results.get(timeout=0.25)
+                except queue.Empty:
+                    if future.done() and not future.cancelled() and future.exception() is not None:
+                        raise future.exception()
+                    continue
+                if message[0] == "page":
+                    _, page_text, joined, lengths, ids, counts, new_terms = message
+                    yield page_text, _unpack_chunks(joined, lengths), (_unpack_ids(ids, counts), new_terms)
+                elif message[0] == "done":
+                    for stage, seconds in message[1]:
+                        record_span(stage, seconds)
+                    outcome = "completed"
+                    return
+                else:
+                    raise RuntimeError(message[1])
+        finally:
+            if outcome != "completed":
+                # Pending jobs are dropped; a running one stops at its next page.
+                stop.set()
+                future.cancel()
+            self.stats[outcome] += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+
+def extraction_pool_from_env() -> ExtractionPool | None:
+    """Pool sized by ``EXTRACT_PROCESSES`` (default: all cores); ``0`` keeps extraction in-process."""
+    processes = int(os.getenv("EXTRACT_PROCESSES", str(os.cpu_count() or 1)))
+    if processes <= 0:
+        return None
+    return ExtractionPool(
+        processes=processes,
+        max_pending=int(os.getenv("EXTRACT_MAX_PENDING", "8")),
+        job_timeout=float(os.getenv("EXTRACT_TIMEOUT", "300")),
+    )
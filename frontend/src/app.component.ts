@@ -52,6 +52,8 @@ export class AppComponent {
   isBotThinking = signal<boolean>(false);
   thinkingStage = signal<string>('Thinking...');
   isFirstMessage = signal<boolean>(true);
+  // Identifies this tab's conversation so the backend keeps per-session chat history
+  private sessionId = crypto.randomUUID();
   
   chatHistory = signal<ChatMessage[]>([
     { sender: 'bot', text: 'Hello! How can I assist you today? Select a paper to ask questions about it.' }
@@ -139,7 +141,7 @@ export class AppComponent {
     const query = this.searchQuery();
 
     try {
-      const newResults = await this.geminiService.searchPapers(query);
+      const newResults = await this.geminiService.searchPapers(query, this.sessionId);
       this.results.set(newResults);
       this.resultsRaw.set(newResults);
     } catch (error) {
@@ -205,6 +207,7 @@ export class AppComponent {
     const payload = {
       query: message,
       paperId: paper?.arxivId,
+      sessionId: this.sessionId,
       pdfLink: paper ? `https://arxiv.org/pdf/${paper.arxivId}.pdf` : undefined
     };
 
@@ -33,14 +33,14 @@ export class GeminiService {
     return String(v);
   }
 
-  async searchPapers(query: string): Promise<ArxivPaper[]> {
+  async searchPapers(query: string, sessionId?: string): Promise<ArxivPaper[]> {
     if (!query || !query.trim()) return [];
 
     try {
       const resp = await fetch(`${this.baseUrl}/ask`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query })
+        body: JSON.stringify({ query, sessionId })
       });
 
       if (!resp.ok) {